@@ -0,0 +1,226 @@
+# (c) 2002 LOGILAB S.A. (Paris, FRANCE).
+# http://www.logilab.fr/ -- mailto:contact@logilab.fr
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307
+# USA.
+"""Search of the solutions by cycle cutset conditioning
+
+Once the variables of a cycle cutset are instanciated, the constraints
+left between the other variables form a forest. Made directionally arc
+consistent from the leaves to the roots, the forest is solved without
+backtracking, so that its solutions are enumerated in a time linear in
+their number."""
+
+from logilab.constraint.propagation import Solver, Repository, \
+                                           ConsistencyFailure, \
+                                           _default_printer
+
+
+def cycle_cutset(repository):
+    """return a (cutset, order) pair for the variables of repository which
+    are not instanciated: cutset is a list of variables such that the
+    constraints between the other variables form a forest, and order is
+    the list of the (variable, parent) pairs of this forest, each variable
+    coming after its parent (which is None for the roots).
+    The variables of the constraints on more than two of them are put in
+    the cutset, the others greedily by decreasing number of neighbours.
+    The cutset is empty when the constraint graph is a forest."""
+    domains = repository.getDomains()
+    free = set([var for var in repository._variables
+                if domains[var].size() > 1])
+    neighbours = dict([(var, set()) for var in free])
+    cutset = []
+    for constraint in repository._constraints:
+        variables = set(constraint.affectedVariables()) & free
+        if len(variables) == 2:
+            var1, var2 = variables
+            neighbours[var1].add(var2)
+            neighbours[var2].add(var1)
+        elif len(variables) > 2:
+            for var in variables:
+                if var not in cutset:
+                    cutset.append(var)
+    graph = dict([(var, set(others - set(cutset)))
+                  for var, others in neighbours.items()
+                  if var not in cutset])
+    # remove the leaves, then the variable with the most neighbours until
+    # there is no cycle left
+    left = dict([(var, set(others)) for var, others in graph.items()])
+    while True:
+        leaves = [var for var, others in left.items() if len(others) <= 1]
+        while leaves:
+            var = leaves.pop()
+            if var not in left:
+                continue
+            for other in left.pop(var):
+                left[other].discard(var)
+                if len(left[other]) <= 1:
+                    leaves.append(other)
+        if not left:
+            break
+        var = max(left, key=lambda var: len(left[var]))
+        cutset.append(var)
+        for other in left.pop(var):
+            left[other].discard(var)
+        for others in graph.values():
+            others.discard(var)
+        del graph[var]
+    order = []
+    seen = set()
+    for root in repository._variables:
+        if root not in graph or root in seen:
+            continue
+        seen.add(root)
+        order.append((root, None))
+        index = len(order) - 1
+        while index < len(order):
+            var = order[index][0]
+            for other in graph[var]:
+                if other not in seen:
+                    seen.add(other)
+                    order.append((other, var))
+            index += 1
+    return cutset, order
+
+
+class CutsetSolver(Solver):
+    """Solver instanciating the variables of a cycle cutset by search,
+    and solving the forest of constraints left without backtracking
+
+    For each solution of the constraints between the variables of the
+    cutset, the domains of the other variables are narrowed by the
+    constraints with the cutset, then made directionally arc consistent
+    from the leaves of the forest to its roots, recording for each value
+    of a parent the values of its child compatible with it. The solutions
+    of the forest are then read from these supports. When the constraint
+    graph is a tree, there is no search at all.
+
+    The domains must be finite domains, and each constraint on two
+    variables of the forest must remove the values of one of them which
+    are not compatible with the other once the latter is instanciated, as
+    the constraints of fd do. Searches with restarts or symmetries are
+    done by the Solver."""
+
+    def __init__(self, distributor=None, printer=_default_printer,
+                 **kwargs):
+        Solver.__init__(self, distributor, printer, **kwargs)
+        self.cutset = None
+
+    def _explore(self, repository):
+        """return the cutset generator (searches with restarts or
+        symmetries are done by the Solver)"""
+        if self._path is not None:
+            return Solver._explore(self, repository)
+        return self._cutset_solve(repository)
+
+    def _cutset_solve(self, repository):
+        """main generator"""
+        self._nodes += 1
+        try:
+            repository.consistency(self.verbose, custom_printer=self.printer)
+        except ConsistencyFailure:
+            return
+        domains = repository.getDomains()
+        cutset, order = cycle_cutset(repository)
+        self.cutset = cutset
+        forest = set([var for var, parent in order])
+        inner = []
+        edges = {}
+        for constraint in repository._constraints:
+            variables = set(constraint.affectedVariables()) & forest
+            if not variables:
+                inner.append(constraint)
+            else:
+                edges.setdefault(frozenset(variables), []).append(constraint)
+        variables = [var for var in repository._variables
+                     if var not in forest]
+        cut_domains = dict([(var, domains[var].copy()) for var in variables])
+        cut_repository = Repository(variables, cut_domains, inner,
+                                    repository._printer)
+        cut_repository._stats = repository._stats
+        for assignment in Solver._explore(self, cut_repository):
+            self._checkBudget()
+            supports = _supports(domains, assignment, order, edges)
+            if supports is None:
+                continue
+            for solution in _enumerate(order, supports, assignment):
+                yield solution
+
+
+def _singleton(domain, value):
+    """return a copy of domain reduced to value"""
+    domain = domain.copy()
+    domain.removeValues([val for val in domain.getValues() if val != value])
+    return domain
+
+def _supports(domains, assignment, order, edges):
+    """return the supports of the values of the variables of the forest
+    given by order once the variables of assignment are instanciated, a
+    dictionnary mapping each variable to a dictionnary mapping each value
+    of its parent to the list of its compatible values (the values of a
+    root are mapped from None), or None if the forest has no solution"""
+    narrowed = {}
+    for var, value in assignment.items():
+        narrowed[var] = _singleton(domains[var], value)
+    try:
+        for var, parent in order:
+            narrowed[var] = domains[var].copy()
+            for constraint in edges.get(frozenset([var]), ()):
+                constraint.narrow(narrowed)
+    except ConsistencyFailure:
+        return None
+    supports = {}
+    for index in range(len(order) - 1, -1, -1):
+        var, parent = order[index]
+        child = narrowed[var]
+        if parent is None:
+            supports[var] = {None: child.getValues()}
+            continue
+        constraints = edges[frozenset([var, parent])]
+        domain = narrowed[parent]
+        supported = {}
+        removed = []
+        for value in domain.getValues():
+            narrowed[parent] = _singleton(domain, value)
+            narrowed[var] = compatible = child.copy()
+            try:
+                for constraint in constraints:
+                    constraint.narrow(narrowed)
+            except ConsistencyFailure:
+                removed.append(value)
+            else:
+                supported[value] = compatible.getValues()
+        narrowed[parent] = domain
+        narrowed[var] = child
+        if len(removed) == domain.size():
+            return None
+        domain.removeValues(removed)
+        supports[var] = supported
+    return supports
+
+def _enumerate(order, supports, assignment):
+    """generate the solutions of the forest given by order, extending
+    assignment"""
+    solution = assignment.copy()
+    size = len(order)
+    def extend(index):
+        if index == size:
+            yield solution.copy()
+            return
+        var, parent = order[index]
+        for value in supports[var][solution.get(parent)]:
+            solution[var] = value
+            for result in extend(index + 1):
+                yield result
+    return extend(0)
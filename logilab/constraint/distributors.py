@@ -44,19 +44,23 @@ class AbstractDistributor(Psyobj):
         """returns the variable having the smallest domain.
         (or one of such varibles if there is a tie)
         """
-        domlist = [(dom.size(), variable ) for variable, dom in domains.items()
-                                           if dom.size() > 1]
-        domlist.sort()
-        return domlist[0][1]
+        best = None
+        for variable, dom in domains.items():
+            size = dom.size()
+            if size > 1 and (best is None or (size, variable) < best):
+                best = (size, variable)
+        return best[1]
 
     def findLargestDomain(self, domains):
         """returns the variable having the largest domain.
         (or one of such variables if there is a tie)
         """
-        domlist = [(dom.size(), variable) for variable, dom in domains.items()
-                                          if dom.size() > 1]
-        domlist.sort()
-        return domlist[-1][1]
+        best = None
+        for variable, dom in domains.items():
+            size = dom.size()
+            if size > 1 and (best is None or (size, variable) > best):
+                best = (size, variable)
+        return best[1]
 
     def nb_subdomains(self, domains):
         """return number of sub domains to explore"""
@@ -74,11 +78,53 @@ class AbstractDistributor(Psyobj):
             domain.resetFlags()
         return replicas
 
+    def split(self, domains, verbose=0):
+        """return the variable to distribute and a partition of its domain
+        Unlike distribute(), only the domain of that variable is copied"""
+        self.verbose = verbose
+        nb_subdomains = self.nb_subdomains(domains)
+        variable = self._chooseVariable(domains)
+        domain = domains[variable]
+        subdomains = [domain.copy() for i in range(nb_subdomains)]
+        self._splitDomain(variable, *subdomains)
+        for subdomain in subdomains:
+            subdomain.resetFlags()
+        return variable, subdomains
+
+    def _chooseVariable(self, domains):
+        """return the variable to distribute"""
+        return self._selectVariable(domains)
+
+    def _selectVariable(self, domains):
+        """the variable ordering heuristic: return the variable whose
+        domain should be split first"""
+        return self.findSmallestDomain(domains)
+
+    def notifyPropagation(self, variables):
+        """See DistributorInterface. Adaptive heuristics learn from it"""
+
+    def notifyFailure(self, constraint):
+        """See DistributorInterface. Adaptive heuristics learn from it"""
+
     def _distribute(self, *args):
         """ method to implement in concrete class
 
         take self.nb_subspaces copy of the original domains as argument
         distribute the domains and return each modified domain
+
+        The default implementation chooses a variable and calls
+        _splitDomain with its domain in each copy.
+        """
+        variable = self._chooseVariable(args[0])
+        modified = [domains[variable] for domains in args]
+        self._splitDomain(variable, *modified)
+        return modified
+
+    def _splitDomain(self, variable, *args):
+        """ method to implement in concrete class
+
+        take copies of the domain of variable as argument and narrow
+        each of them to one of the subspaces
         """
         raise NotImplementedError("Use a concrete implementation of "
                                   "the Distributor interface")
@@ -91,17 +137,15 @@ class NaiveDistributor(AbstractDistributor):
     def __init__(self):
         AbstractDistributor.__init__(self)
         
-    def _distribute(self, dom1, dom2):
+    def _splitDomain(self, variable, dom1, dom2):
         """See AbstractDistributor"""
-        variable = self.findSmallestDomain(dom1)
-        values = dom1[variable].getValues()
+        values = dom1.getValues()
         if self.verbose:
             __fmt_str = 'Distributing domain for variable'
             print(__fmt_str , variable, \
                   'at value', values[0])
-        dom1[variable].removeValues(values[1:])
-        dom2[variable].removeValue(values[0])
-        return (dom1[variable], dom2[variable])
+        dom1.removeValues(values[1:])
+        dom2.removeValue(values[0])
 
 
 class RandomizingDistributor(AbstractDistributor):
@@ -111,19 +155,17 @@ class RandomizingDistributor(AbstractDistributor):
     def __init__(self):
         AbstractDistributor.__init__(self)
         
-    def _distribute(self, dom1, dom2):
+    def _splitDomain(self, variable, dom1, dom2):
         """See AbstractDistributor"""
-        variable = self.findSmallestDomain(dom1)
-        values = dom1[variable].getValues()
+        values = dom1.getValues()
         distval = random.choice(values)
         values.remove(distval)
         if self.verbose:
             __fmt_str = 'Distributing domain for variable'
             print(__fmt_str , variable, \
                   'at value', distval)
-        dom1[variable].removeValues(values)
-        dom2[variable].removeValue(distval)
-        return (dom1[variable], dom2[variable])
+        dom1.removeValues(values)
+        dom2.removeValue(distval)
     
 
 class SplitDistributor(AbstractDistributor):
@@ -137,17 +179,20 @@ class SplitDistributor(AbstractDistributor):
         self.__to_split = None
     def nb_subdomains(self, domains):
         """See AbstractDistributor"""
-        self.__to_split = self.findSmallestDomain(domains)
+        self.__to_split = self._selectVariable(domains)
         if self.nb_subspaces:
             return min(self.nb_subspaces, domains[self.__to_split].size())
         else:
             return domains[self.__to_split].size()
+
+    def _chooseVariable(self, domains):
+        """See AbstractDistributor"""
+        return self.__to_split
     
-    def _distribute(self, *args):
+    def _splitDomain(self, variable, *args):
         """See AbstractDistributor"""
-        variable = self.__to_split
         nb_subspaces = len(args)
-        values = args[0][variable].getValues()
+        values = args[0].getValues()
         nb_elts = max(1, len(values)*1./nb_subspaces)
         slices = [(int(math.floor(index * nb_elts)),
                    int(math.floor((index + 1) * nb_elts)))
@@ -155,12 +200,9 @@ class SplitDistributor(AbstractDistributor):
         if self.verbose:
             __fmt_str = 'Distributing domain for variable'
             print(__fmt_str , variable)
-        modified = []
         for (dom, (end, start)) in zip(args, slices) :
-            dom[variable].removeValues(values[:end])
-            dom[variable].removeValues(values[start:])
-            modified.append(dom[variable])
-        return modified
+            dom.removeValues(values[:end])
+            dom.removeValues(values[start:])
 
 class DichotomyDistributor(SplitDistributor):
     """distributes domains by splitting the smallest domain in
@@ -175,4 +217,97 @@ class EnumeratorDistributor(SplitDistributor):
     def __init__(self):
         SplitDistributor.__init__(self, 0)
 
+
+class WeightedDegreeDistributor(SplitDistributor):
+    """distributes domains as the SplitDistributor, splitting the domain of
+    the variable with the smallest ratio of its size to its weight (the
+    dom/wdeg heuristic). The weight of a variable is increased each time
+    the narrowing of one of its constraints fails, so that the search
+    focuses on the hard part of the problem.
+
+    The weights are kept from one search to the next. If randomize is
+    true, ties are broken at random, so that restarts explore different
+    parts of the search tree."""
+
+    def __init__(self, nb_subspaces=2, randomize=False):
+        SplitDistributor.__init__(self, nb_subspaces)
+        self.randomize = randomize
+        self._weights = {}
+
+    def getWeight(self, variable):
+        """return the weight of variable"""
+        return self._weights.get(variable, 1)
+
+    def notifyFailure(self, constraint):
+        """See DistributorInterface"""
+        if constraint is None:
+            return
+        weights = self._weights
+        for variable in constraint.affectedVariables():
+            weights[variable] = weights.get(variable, 1) + 1
+
+    def _selectVariable(self, domains):
+        """See AbstractDistributor"""
+        weights = self._weights
+        tie = self.randomize and random.random or float
+        best = None
+        for variable, dom in domains.items():
+            size = dom.size()
+            if size > 1:
+                key = (size / weights.get(variable, 1), size, tie(),
+                       variable)
+                if best is None or key < best:
+                    best = key
+        return best[-1]
+
+
+class ActivityDistributor(SplitDistributor):
+    """distributes domains as the SplitDistributor, splitting the domain of
+    the variable with the largest ratio of its activity to its size.
+    The activity of a variable is increased each time propagation narrows
+    its domain, and decays by decay at each node so that recent activity
+    counts more.
+
+    The activities are kept from one search to the next. If randomize is
+    true, ties are broken at random."""
+
+    def __init__(self, nb_subspaces=2, decay=0.95, randomize=False):
+        SplitDistributor.__init__(self, nb_subspaces)
+        self.decay = decay
+        self.randomize = randomize
+        self._activities = {}
+        # rather than decaying all activities, the next increment grows
+        self._increment = 1.
+
+    def getActivity(self, variable):
+        """return the activity of variable, relative to the other ones"""
+        return self._activities.get(variable, 0.)
+
+    def notifyPropagation(self, variables):
+        """See DistributorInterface"""
+        activities = self._activities
+        increment = self._increment
+        for variable in dict.fromkeys(variables):
+            activities[variable] = activities.get(variable, 0.) + increment
+        self._increment = increment / self.decay
+        if self._increment > 1e100:
+            for variable in activities:
+                activities[variable] *= 1e-100
+            self._increment *= 1e-100
+
+    def _selectVariable(self, domains):
+        """See AbstractDistributor"""
+        activities = self._activities
+        tie = self.randomize and random.random or float
+        best = None
+        for variable, dom in domains.items():
+            size = dom.size()
+            if size > 1:
+                key = (-activities.get(variable, 0.) / size, size, tie(),
+                       variable)
+                if best is None or key < best:
+                    best = key
+        return best[-1]
+
+
 DefaultDistributor = DichotomyDistributor
\ No newline at end of file
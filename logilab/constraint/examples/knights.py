@@ -63,7 +63,7 @@ def knight_tour(size=6,verbose=0):
                        'abs(abs(%(v1)s[0]-%(v2)s[0]) - abs(%(v1)s[1]-%(v2)s[1])) == 1'%\
                        {'v1':k1,'v2':k2})
             constraints.append(c)
-    constraints.append(fd.AllDistinct(variables))
+    constraints.append(fd.AllDistinct(variables, 'domain'))
     half = size/2
     r = Repository(variables,domains,constraints)
     sol = Solver(EnumeratorDistributor()).solve_one(r,verbose)	
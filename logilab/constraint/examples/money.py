@@ -44,8 +44,9 @@ def money(verbose=0):
                                           '(n+r)%10 in (e,e-1)'))
     constraints.append(fd.make_expression(('o', 'e', 'n'),
                                           '(o+e)%10 in (n,n-1)'))
-    constraints.append(fd.make_expression(variables,
-                'm*10000+(o-m-s)*1000+(n-o-e)*100+(e-r-n)*10+y-e-d == 0'))
+    # m*10000+(o-m-s)*1000+(n-o-e)*100+(e-r-n)*10+y-e-d == 0
+    constraints.append(fd.ScalarProduct(variables,
+                                        [-1000, -91, 90, -1, 9000, 900, -10, 1]))
     r = Repository(variables, domains, constraints)
     s = Solver().solve_one(r, verbose)
     return s
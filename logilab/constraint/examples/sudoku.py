@@ -72,15 +72,18 @@ def sudoku(problem, verbose=0):
 
     # line and column constraints
     for i in range(9):
-        constraints.append(fd.AllDistinct(['v%02d_%02d'%(i,j) for j in range(9)]))
-        constraints.append(fd.AllDistinct(['v%02d_%02d'%(j,i) for j in range(9)]))
+        constraints.append(fd.AllDistinct(['v%02d_%02d'%(i,j) for j in range(9)],
+                                           'domain'))
+        constraints.append(fd.AllDistinct(['v%02d_%02d'%(j,i) for j in range(9)],
+                                           'domain'))
 
     # square constraints:
     for i in (0, 3, 6):
         for j in (0, 3, 6):
             constraints.append(fd.AllDistinct(['v%02d_%02d'%(i+ii,j+jj)
                                                for ii in (0, 1, 2)
-                                               for jj in (0, 1, 2)]))
+                                               for jj in (0, 1, 2)],
+                                              'domain'))
 
     # fixed values:
     for i, line in enumerate(problem):
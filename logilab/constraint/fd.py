@@ -19,16 +19,35 @@
 
 This module provides the following usable classes:
  * FiniteDomain: a class for storing FiniteDomains
+ * BitsetDomain: a compact FiniteDomain, storing the values as a bitmask
  * Expression: a constraint represented as an expression
  * BinaryExpression: a binary constraint represented as an expression
+ * Table: a constraint given by its allowed or forbidden tuples
+ * Sum and ScalarProduct: linear constraints
+ * GlobalCardinality, Among, AtMost and AtLeast: counting constraints
+ * LexLeq, LexChain and ValuePrecedence: symmetry breaking constraints
+ * Differs and Conjunction: propagators of the formulas recognized by
+   make_expression
  * various BasicConstraint classes
 
 The Expression and BinaryExpression classes can be constructed using the
-make_expression factory function.  """
+make_expression factory function, which uses dedicated propagators for
+the parts of the formula it recognizes.  """
 
 
 
+import ast
+import copy
+import mmap
+import weakref
 import operator
+from functools import reduce
+from itertools import product
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from logilab.constraint.propagation import AbstractDomain, BasicConstraint, \
                                            ConsistencyFailure, \
@@ -70,6 +89,7 @@ class FiniteDomain(AbstractDomain):
     def removeValue(self, value):
         """Remove value of domain and check for consistency"""
 ##         print "removing", value, "from", self._values.keys()
+        self._saveState()
         if self._cow:
             self.setValues(self._values)
         del self._values[value]
@@ -77,10 +97,11 @@ class FiniteDomain(AbstractDomain):
 
     def removeValues(self, values):
         """Remove values of domain and check for consistency"""
-        if self._cow:
-            self.setValues(self._values)
         if values:
 ##             print "removing", values, "from", self._values.keys()
+            self._saveState()
+            if self._cow:
+                self.setValues(self._values)
             for val in values :
                 del self._values[val]
             self._valueRemoved()
@@ -97,7 +118,20 @@ class FiniteDomain(AbstractDomain):
 
     def __iter__(self):
         return iter(self._values)
+
+    def __contains__(self, value):
+        return value in self._values
     
+    def getState(self):
+        """return the values of the domain, shared until next write"""
+        self._cow = True
+        return self._values
+
+    def setState(self, state):
+        """restore values returned by getState"""
+        self._cow = True
+        self._values = state
+
     def copy(self):
         """clone the domain"""
         return FiniteDomain(self)
@@ -105,17 +139,180 @@ class FiniteDomain(AbstractDomain):
     def __repr__(self):
         return '<FiniteDomain %s>' % str(self.getValues())
 
+
+try:
+    _popcount = int.bit_count
+except AttributeError: # python < 3.10
+    def _popcount(mask):
+        """return the number of bits set in mask"""
+        return bin(mask).count('1')
+
+class _Universe:
+    """the values of bitset domains and their indexes"""
+
+    def __init__(self, values, index):
+        self.values = values
+        self.index = index
+
+class BitsetDomain(AbstractDomain):
+    """
+    Variable Domain with a finite set of possible values, stored as the
+    bits of an integer. The values are indexed once in a universe which is
+    shared by all the domains built from the same values, so that copying,
+    saving or restoring a domain costs a single integer. The universes are
+    forgotten with the last domain using them.
+    """
+
+    _UNIVERSES = weakref.WeakValueDictionary()
+
+    def __init__(self, values):
+        """values is a list of values in the domain
+        or a BitsetDomain to copy"""
+        AbstractDomain.__init__(self)
+        if isinstance(values, BitsetDomain):
+            self._shared = values._shared
+            self._universe = values._universe
+            self._index = values._index
+            self._mask = values._mask
+        else:
+            assert len(values) > 0
+            key = tuple(values)
+            shared = BitsetDomain._UNIVERSES.get(key)
+            if shared is None:
+                index = {}
+                for val in key:
+                    index.setdefault(val, len(index))
+                shared = _Universe(tuple(index), index)
+                BitsetDomain._UNIVERSES[key] = shared
+            # the universe is kept alive by the domains referencing it
+            self._shared = shared
+            self._universe = shared.values
+            self._index = shared.index
+            self._mask = (1 << len(self._universe)) - 1
+
+    def _toMask(self, values):
+        """return the mask of values, which must all be in the universe"""
+        if isinstance(values, BitsetDomain) and \
+               values._universe is self._universe:
+            return values._mask
+        index = self._index
+        mask = 0
+        for val in values:
+            mask |= 1 << index[val]
+        return mask
+
+    def _setMask(self, mask):
+        """narrow the domain to mask and check for consistency"""
+        if mask != self._mask:
+            self._saveState()
+            self._mask = mask
+            self._valueRemoved()
+
+    def removeValue(self, value):
+        """Remove value of domain and check for consistency"""
+        bit = 1 << self._index[value]
+        if not self._mask & bit:
+            raise KeyError(value)
+        self._setMask(self._mask ^ bit)
+
+    def removeValues(self, values):
+        """Remove values of domain and check for consistency"""
+        if values:
+            self._setMask(self._mask & ~self._toMask(values))
+    __delitem__ = removeValue
+
+    def intersect(self, values):
+        """Remove the values of the domain which are not in values
+        (a list or a domain) and check for consistency"""
+        index = self._index
+        if not (isinstance(values, BitsetDomain) and
+                values._universe is self._universe):
+            values = [val for val in values if val in index]
+        self._setMask(self._mask & self._toMask(values))
+
+    def subtract(self, values):
+        """Remove the values of the domain which are in values
+        (a list or a domain) and check for consistency"""
+        index = self._index
+        if not (isinstance(values, BitsetDomain) and
+                values._universe is self._universe):
+            values = [val for val in values if val in index]
+        self.removeValues(values)
+
+    def size(self):
+        """computes the size of a finite domain"""
+        return _popcount(self._mask)
+    __len__ = size
+
+    def getValues(self):
+        """return all the values in the domain"""
+        return list(self)
+
+    def __iter__(self):
+        universe = self._universe
+        mask = self._mask
+        while mask:
+            low = mask & -mask
+            yield universe[low.bit_length() - 1]
+            mask ^= low
+
+    def __contains__(self, value):
+        try:
+            return bool(self._mask >> self._index[value] & 1)
+        except KeyError:
+            return False
+
+    def getState(self):
+        """return the bitmask of the domain"""
+        return self._mask
+
+    def setState(self, state):
+        """restore a bitmask returned by getState"""
+        self._mask = state
+
+    def copy(self):
+        """clone the domain"""
+        return BitsetDomain(self)
+
+    def __setstate__(self, state):
+        # share the universe again with the domains built from it
+        self.__dict__.update(state)
+        shared = BitsetDomain._UNIVERSES.get(self._universe)
+        if shared is None:
+            shared = _Universe(self._universe, self._index)
+            BitsetDomain._UNIVERSES[self._universe] = shared
+        self._shared = shared
+        self._universe = shared.values
+        self._index = shared.index
+
+    def __repr__(self):
+        return '<BitsetDomain %s>' % str(self.getValues())
+
 ##
 ## Constraints
 ##    
 class AllDistinct(AbstractConstraint):
-    """Contraint: all values must be distinct"""
+    """Contraint: all values must be distinct
 
-    def __init__(self, variables):
+    Two levels of propagation are available:
+     * 'value' (the default) removes the value of the variables which are
+       instanciated from the other domains and checks that there are
+       enough values left for all the variables
+     * 'domain' enforces generalized arc consistency with Regin's
+       matching based algorithm: every value which can not be part of a
+       solution of the constraint is removed. It is more expensive, but
+       needs much less distribution on hard problems"""
+
+    def __init__(self, variables, consistency='value'):
         assert len(variables)>1
+        assert consistency in ('value', 'domain')
         AbstractConstraint.__init__(self, variables)
         # worst case complexity
         self.__cost = len(variables) * (len(variables) - 1) / 2 
+        self._consistency = consistency
+        # matching found by the last narrowing, used as a starting point
+        # for the next one
+        self._matching = {}
 
     def __repr__(self):
         return '<AllDistinct %s>' % str(self._variables)
@@ -126,6 +323,8 @@ class AllDistinct(AbstractConstraint):
 
     def narrow(self, domains):
         """narrowing algorithm for the constraint"""
+        if self._consistency == 'domain':
+            return self._narrowDomains(domains)
         variables = [(domains[variable].size(), variable, domains[variable])
                      for variable in self._variables]
         
@@ -157,12 +356,357 @@ class AllDistinct(AbstractConstraint):
                 return 0
         return 1
 
+    def _narrowDomains(self, domains):
+        """Regin's filtering: find a maximum matching between variables and
+        values, then remove the edges of the value graph which do not belong
+        to any maximum matching"""
+        variables = self._variables
+        var_values = [domains[var].getValues() for var in variables]
+        # variables and values are nodes 0..n-1 and n.. of the value graph
+        nb_vars = len(variables)
+        val_node = {}
+        for values in var_values:
+            for val in values:
+                if val not in val_node:
+                    val_node[val] = nb_vars + len(val_node)
+        successors = [[val_node[val] for val in values]
+                      for values in var_values]
+        # start from the previous matching, where it is still valid
+        match = [None] * (nb_vars + len(val_node))
+        for index, var in enumerate(variables):
+            node = val_node.get(self._matching.get(var))
+            if node is not None and match[node] is None and \
+                   node in successors[index]:
+                match[index] = node
+                match[node] = index
+        for index in range(nb_vars):
+            if match[index] is None and not _augment(index, successors, match):
+                raise ConsistencyFailure('Inconsistency while applying %s' %
+                                         repr(self))
+        node_val = list(val_node)
+        self._matching = dict([(var, node_val[match[index] - nb_vars])
+                               for index, var in enumerate(variables)])
+        # orient the graph: matched edges go from the variable to the value,
+        # the other ones from the value to the variable
+        graph = [[match[index]] for index in range(nb_vars)]
+        graph.extend([[] for val in val_node])
+        for index, nodes in enumerate(successors):
+            for node in nodes:
+                if node != match[index]:
+                    graph[node].append(index)
+        # an edge is consistent if it is matched, if it belongs to an even
+        # alternating path starting at a free value or to an even
+        # alternating cycle
+        free = [node for node in range(nb_vars, len(graph))
+                if match[node] is None]
+        reached = set(free)
+        while free:
+            node = free.pop()
+            for succ in graph[node]:
+                if succ not in reached:
+                    reached.add(succ)
+                    free.append(succ)
+        component = _strongly_connected(graph)
+        entailed = 1
+        try:
+            for index, values in enumerate(var_values):
+                if len(values) == 1:
+                    continue
+                matched = match[index]
+                removed = [val for val, node in zip(values, successors[index])
+                           if node != matched and node not in reached and
+                           component[node] != component[index]]
+                domains[variables[index]].removeValues(removed)
+                if len(values) - len(removed) > 1:
+                    entailed = 0
+        except ConsistencyFailure:
+            raise ConsistencyFailure('Inconsistency while applying %s' % \
+                                     repr(self))
+        return entailed
+
+
+def _augment(root, successors, match):
+    """look for an augmenting path starting at the free variable root in
+    the value graph, and flip the matching along it.
+    Return True if one was found"""
+    stack = [root]
+    iterators = [iter(successors[root])]
+    chosen = []
+    visited = set()
+    while stack:
+        for node in iterators[-1]:
+            if node in visited:
+                continue
+            visited.add(node)
+            chosen.append(node)
+            owner = match[node]
+            if owner is None:
+                for var, val in zip(stack, chosen):
+                    match[var] = val
+                    match[val] = var
+                return True
+            stack.append(owner)
+            iterators.append(iter(successors[owner]))
+            break
+        else:
+            stack.pop()
+            iterators.pop()
+            if chosen:
+                chosen.pop()
+    return False
+
+def _strongly_connected(graph):
+    """return the list of the strongly connected component number of each
+    node of graph, given as a list of successor lists (Tarjan's algorithm)
+    """
+    index = [None] * len(graph)
+    lowlink = [0] * len(graph)
+    component = [None] * len(graph)
+    on_stack = [False] * len(graph)
+    stack = []
+    counter = 0
+    nb_components = 0
+    for root in range(len(graph)):
+        if index[root] is not None:
+            continue
+        work = [(root, iter(graph[root]))]
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        while work:
+            node, successors = work[-1]
+            for succ in successors:
+                if index[succ] is None:
+                    index[succ] = lowlink[succ] = counter
+                    counter += 1
+                    stack.append(succ)
+                    on_stack[succ] = True
+                    work.append((succ, iter(graph[succ])))
+                    break
+                elif on_stack[succ]:
+                    lowlink[node] = min(lowlink[node], index[succ])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        component[member] = nb_components
+                        if member == node:
+                            break
+                    nb_components += 1
+    return component
+
+
+class _NotVectorizable(Exception):
+    """raised when a formula can not be evaluated on numpy arrays"""
 
+class _Vectorizer(ast.NodeTransformer):
+    """rewrites the AST of a formula so that it can be evaluated on numpy
+    arrays: boolean operators, chained comparisons, tests of membership in
+    literal sequences and conditional expressions are replaced by the
+    equivalent numpy functions. Raises _NotVectorizable for any construct
+    which would not give the same result on arrays as on numbers"""
+
+    _BINOPS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod,
+               ast.BitAnd, ast.BitOr, ast.BitXor)
+    _CMPOPS = (ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+
+    def __init__(self, variables):
+        self.variables = variables
+        # true while visiting a node of which only the truth value is used
+        self._test = False
+
+    def visit(self, node, test=False):
+        outer = self._test
+        self._test = test
+        try:
+            return ast.NodeTransformer.visit(self, node)
+        finally:
+            self._test = outer
+
+    def _isBoolean(self, node):
+        """tell if node always evaluates to a boolean"""
+        if isinstance(node, ast.BoolOp):
+            return all([self._isBoolean(value) for value in node.values])
+        return isinstance(node, ast.Compare) or \
+               isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not)
+
+    def _call(self, func, *args):
+        return ast.Call(func=ast.Attribute(value=ast.Name(id='_np',
+                                                          ctx=ast.Load()),
+                                           attr=func, ctx=ast.Load()),
+                        args=list(args), keywords=[])
+
+    def _combine(self, func, terms):
+        return reduce(lambda left, right: self._call(func, left, right), terms)
+
+    def generic_visit(self, node):
+        raise _NotVectorizable(node.__class__.__name__)
+
+    def visit_Expression(self, node):
+        node.body = self.visit(node.body, test=True)
+        return node
+
+    def visit_Constant(self, node):
+        if type(node.value) not in (int, float, bool):
+            raise _NotVectorizable(repr(node.value))
+        return node
+
+    def visit_Name(self, node):
+        if node.id not in self.variables:
+            raise _NotVectorizable(node.id)
+        return node
+
+    def visit_BinOp(self, node):
+        if not isinstance(node.op, self._BINOPS):
+            raise _NotVectorizable(node.op.__class__.__name__)
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        return node
+
+    def visit_UnaryOp(self, node):
+        operand = self.visit(node.operand)
+        if isinstance(node.op, ast.Not):
+            return self._call('logical_not', operand)
+        if not isinstance(node.op, (ast.USub, ast.UAdd)):
+            raise _NotVectorizable(node.op.__class__.__name__)
+        node.operand = operand
+        return node
+
+    def visit_BoolOp(self, node):
+        # python returns one of the operands, numpy a boolean
+        if not (self._test or self._isBoolean(node)):
+            raise _NotVectorizable('BoolOp')
+        if isinstance(node.op, ast.And):
+            func = 'logical_and'
+        else:
+            func = 'logical_or'
+        return self._combine(func, [self.visit(value, self._test)
+                                    for value in node.values])
+
+    def visit_Compare(self, node):
+        terms = []
+        left = self.visit(node.left)
+        for op, right in zip(node.ops, node.comparators):
+            if isinstance(op, (ast.In, ast.NotIn)):
+                if not isinstance(right, (ast.Tuple, ast.List, ast.Set)) \
+                       or not right.elts:
+                    raise _NotVectorizable(op.__class__.__name__)
+                term = self._combine('logical_or', [
+                    ast.Compare(left=copy.deepcopy(left), ops=[ast.Eq()],
+                                comparators=[self.visit(elt)])
+                    for elt in right.elts])
+                if isinstance(op, ast.NotIn):
+                    term = self._call('logical_not', term)
+                terms.append(term)
+                continue
+            if not isinstance(op, self._CMPOPS):
+                raise _NotVectorizable(op.__class__.__name__)
+            right = self.visit(right)
+            terms.append(ast.Compare(left=copy.deepcopy(left), ops=[op],
+                                     comparators=[right]))
+            left = right
+        return self._combine('logical_and', terms)
+
+    def visit_IfExp(self, node):
+        return self._call('where', self.visit(node.test, test=True),
+                          self.visit(node.body, self._test),
+                          self.visit(node.orelse, self._test))
+
+    def visit_Call(self, node):
+        if not (isinstance(node.func, ast.Name) and node.func.id == 'abs'
+                and len(node.args) == 1 and not node.keywords):
+            raise _NotVectorizable('call')
+        return self._call('absolute', self.visit(node.args[0]))
+
+
+def _magnitude(node, value, bounds):
+    """return a bound of the absolute value of the evaluation of node, the
+    variables being bounded by value, and append to bounds the bounds of
+    its subexpressions"""
+    if isinstance(node, ast.Expression):
+        return _magnitude(node.body, value, bounds)
+    if isinstance(node, ast.Constant):
+        bound = abs(node.value)
+    elif isinstance(node, ast.Name):
+        bound = value
+    elif isinstance(node, ast.BinOp):
+        left = _magnitude(node.left, value, bounds)
+        right = _magnitude(node.right, value, bounds)
+        if isinstance(node.op, (ast.Add, ast.Sub)):
+            bound = left + right
+        elif isinstance(node.op, ast.Mult):
+            bound = left * right
+        elif isinstance(node.op, ast.Mod):
+            bound = right
+        elif isinstance(node.op, (ast.Div, ast.FloorDiv)):
+            bound = left
+        else:
+            bound = 2 * max(left, right)
+    elif isinstance(node, ast.UnaryOp):
+        bound = _magnitude(node.operand, value, bounds)
+    elif isinstance(node, ast.IfExp):
+        _magnitude(node.test, value, bounds)
+        bound = max(_magnitude(node.body, value, bounds),
+                    _magnitude(node.orelse, value, bounds))
+    elif isinstance(node, ast.Call):
+        bound = _magnitude(node.args[0], value, bounds)
+    else:
+        # comparisons and boolean operators
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.expr):
+                _magnitude(child, value, bounds)
+        bound = 1
+    bounds.append(bound)
+    return bound
 
+def _vectorize(variables, formula):
+    """return a function evaluating formula on numpy arrays, or None if
+    numpy is missing or the formula can not be vectorized
+
+    The function has a magnitude attribute, the function returning a bound
+    of the absolute values computed by the formula given a bound of the
+    values of the variables"""
+    if numpy is None:
+        return None
+    try:
+        tree = _Vectorizer(variables).visit(ast.parse(formula, mode='eval'))
+    except (SyntaxError, _NotVectorizable):
+        return None
+    original = ast.parse(formula, mode='eval')
+    def magnitude(value):
+        bounds = []
+        _magnitude(original, value, bounds)
+        return max(bounds)
+    args = ast.arguments(posonlyargs=[], args=[ast.arg(arg=var)
+                                               for var in variables],
+                         vararg=None, kwonlyargs=[], kw_defaults=[],
+                         kwarg=None, defaults=[])
+    tree = ast.Expression(body=ast.Lambda(args=args, body=tree.body))
+    code = compile(ast.fix_missing_locations(tree), '<formula>', 'eval')
+    func = eval(code, {'_np': numpy}, {})
+    func.magnitude = magnitude
+    return func
+
+
+_INT64_MAX = (1 << 63) - 1
 
 class Expression(AbstractConstraint):
-    """A constraint represented as a python expression."""
+    """A constraint represented as a python expression.
+
+    When numpy is available and the values of the domains are numbers,
+    the formula is evaluated at once on the whole cartesian product of the
+    domains, if it has between _VECTORIZE_MIN_SIZE and _VECTORIZE_MAX_SIZE
+    elements (below, the cost of calling numpy is not worth it)."""
     _FILTER_CACHE = {}
+    _VECTOR_CACHE = {}
+    _VECTORIZE_MIN_SIZE = 32
+    _VECTORIZE_MAX_SIZE = 1 << 22
 
     def __init__(self, variables, formula, type='fd.Expression'):
         """variables is a list of variables which appear in the formula
@@ -170,150 +714,488 @@ class Expression(AbstractConstraint):
         AbstractConstraint.__init__(self, variables)
         self.formula = formula
         self.type = type
+        self._compile()
+        # for each variable, the last supporting tuple found for each of
+        # its values
+        self._residues = [{} for variable in variables]
+
+    def _compile(self):
+        """build the functions evaluating the formula"""
+        variables = self._variables
+        formula = self.formula
+        # the functions take the values in the order of the variables
+        key = (tuple(variables), formula)
         try:
-            self.filterFunc = Expression._FILTER_CACHE[formula]
+            self.filterFunc = Expression._FILTER_CACHE[key]
         except KeyError:
             self.filterFunc = eval('lambda %s: %s' % \
                                         (','.join(variables), formula), {}, {})
-            Expression._FILTER_CACHE[formula] = self.filterFunc
+            Expression._FILTER_CACHE[key] = self.filterFunc
+        try:
+            self.vectorFunc = Expression._VECTOR_CACHE[key]
+        except KeyError:
+            self.vectorFunc = _vectorize(variables, formula)
+            Expression._VECTOR_CACHE[key] = self.vectorFunc
 
-    def _init_result_cache(self):
-        """key = (variable,value), value = [has_success,has_failure]"""
-        result_cache = {}
-        for var_name in self._variables:
-            result_cache[var_name] = {}
-        return result_cache
+    def __getstate__(self):
+        # the compiled functions can not be pickled
+        state = self.__dict__.copy()
+        del state['filterFunc']
+        del state['vectorFunc']
+        return state
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._compile()
 
-    def _assign_values(self, domains):
-        variables = []
-        kwargs = {}
-        for variable in self._variables:
-            domain = domains[variable]
-            values = domain.getValues()
-            variables.append((domain.size(), [variable, values, 0, len(values)]))
-            kwargs[variable] = values[0]
-        # sort variables to instanciate those with fewer possible values first
-        variables.sort()
+    def _vectorNarrow(self, domains, residues=None):
+        """narrow the domains using numpy
+        Return None if the domains do not allow it
+
+        residues is a list of one dictionnary per variable, filled by
+        _vectorResidues with the supports of its values"""
+        variables = self._variables
+        shape = [domains[variable].size() for variable in variables]
+        if not self._VECTORIZE_MIN_SIZE <= reduce(operator.mul, shape) \
+               <= self._VECTORIZE_MAX_SIZE:
+            return None
+        all_values = [domains[variable].getValues() for variable in variables]
+        grids = {}
+        magnitude = 0
+        for axis, (variable, values) in enumerate(zip(variables, all_values)):
+            array = numpy.array(values)
+            # numpy adds booleans with a logical or
+            if array.dtype.kind not in 'iuf':
+                return None
+            magnitude = max(magnitude, abs(array).max())
+            grid_shape = [1] * len(variables)
+            grid_shape[axis] = len(values)
+            grids[variable] = array.reshape(grid_shape)
+        if not numpy.isfinite(magnitude):
+            return None
+        # numpy integers overflow silently
+        if self.vectorFunc.magnitude(int(magnitude) + 1) > _INT64_MAX:
+            return None
+        try:
+            with numpy.errstate(all='raise'):
+                result = self.vectorFunc(**grids)
+        except (FloatingPointError, OverflowError, ZeroDivisionError):
+            # let the python version give the same result or error as
+            # it does without numpy
+            return None
+        result = numpy.broadcast_to(numpy.asarray(result, dtype=bool), shape)
+        axes = tuple(range(len(variables)))
+        try:
+            for axis, (variable, values) in enumerate(zip(variables,
+                                                          all_values)):
+                support = result.any(axis=axes[:axis] + axes[axis+1:])
+                domains[variable].removeValues([val for val, supported
+                                                in zip(values, support)
+                                                if not supported])
+        except ConsistencyFailure:
+            raise ConsistencyFailure('Inconsistency while applying %s' % \
+                                     repr(self))
+        if residues is not None:
+            self._vectorResidues(result, all_values, residues)
+        return int(result.all())
+
+    def _vectorResidues(self, result, all_values, residues):
+        """record a supporting tuple of each value from result, the
+        boolean array of the formula on the cartesian product all_values"""
+        shape = result.shape
+        for axis, (values, residue) in enumerate(zip(all_values, residues)):
+            matrix = numpy.moveaxis(result, axis, 0).reshape(len(values), -1)
+            others = all_values[:axis] + all_values[axis+1:]
+            indexes = numpy.unravel_index(matrix.argmax(axis=1),
+                                          shape[:axis] + shape[axis+1:])
+            for row, (val, supported) in enumerate(zip(values,
+                                                       matrix.any(axis=1))):
+                if supported:
+                    support = [vals[index[row]]
+                               for vals, index in zip(others, indexes)]
+                    support.insert(axis, val)
+                    residue[val] = tuple(support)
 
-        go_on = 1
-        while go_on:
-            yield kwargs
-            # try to instanciate the next variable
-            for size, curr in variables:
-                if (curr[2] + 1) < curr[-1]:
-                    curr[2] += 1
-                    kwargs[curr[0]] = curr[1][curr[2]]
-                    break
-                else:
-                    curr[2] = 0
-                    kwargs[curr[0]] = curr[1][0]
-            else:
-                # it's over
-                go_on = 0
-            
-        
     def narrow(self, domains):
-        """generic narrowing algorithm for n-ary expressions"""
-        maybe_entailed = 1
-        ffunc = self.filterFunc
-        result_cache = self._init_result_cache()
-        for kwargs in self._assign_values(domains):
-            if maybe_entailed:
-                for var, val in kwargs.items():
-                    if val not in result_cache[var]:
-                        break
-                else:
-                    continue
-            if ffunc(**kwargs):
-                for var, val in list(kwargs.items()):
-                    result_cache[var][val] = 1
-            else:
-                maybe_entailed = 0
+        """generic narrowing algorithm for n-ary expressions
 
+        A support of each value is searched in the cartesian product of
+        the other domains, enumerated lazily up to the first tuple
+        satisfying the formula. The last support found (its residue) is
+        recorded for each value of the tuple, and only the values whose
+        residue lost a value are searched again. Residues are checked
+        before being used, so they need not be restored when the search
+        backtracks."""
+        residues = self._residues
+        if not residues[0] and self.vectorFunc is not None:
+            entailed = self._vectorNarrow(domains, residues)
+            if entailed is not None:
+                return entailed
+        doms = [domains[var] for var in self._variables]
         try:
-            for var, keep in result_cache.items():
-                domain = domains[var]
-                domain.removeValues([val for val in domain if val not in keep])
-                
+            changed = True
+            while changed:
+                changed = False
+                for index, dom in enumerate(doms):
+                    if self._reviseDomain(doms, index):
+                        changed = True
         except ConsistencyFailure:
             raise ConsistencyFailure('Inconsistency while applying %s' % \
                                      repr(self))
-        except KeyError:
-            # There are no more value in result_cache
-            pass
+        # the values of the last unbound variable are all supported
+        unbound = 0
+        for dom in doms:
+            if dom.size() > 1:
+                unbound += 1
+        return int(unbound <= 1)
 
-        return maybe_entailed
+    def _reviseDomain(self, doms, index):
+        """remove the values of the index-th domain which have no
+        support, and tell whether some were removed"""
+        ffunc = self.filterFunc
+        residues = self._residues
+        residue = residues[index]
+        all_values = None
+        removed = []
+        for value in doms[index].getValues():
+            support = residue.get(value)
+            if support is not None:
+                for val, dom in zip(support, doms):
+                    if val not in dom:
+                        break
+                else:
+                    continue
+            if all_values is None:
+                all_values = [dom.getValues() for dom in doms]
+            all_values[index] = (value,)
+            for values in product(*all_values):
+                if ffunc(*values):
+                    for other, val in zip(residues, values):
+                        other[val] = values
+                    break
+            else:
+                removed.append(value)
+        doms[index].removeValues(removed)
+        return bool(removed)
 
     def __repr__(self):
         return '<%s "%s">' % (self.type, self.formula)
 
+    def merge(self, other):
+        """return the expression of the conjunction of self and other if
+        other is an expression of the same class on the same variables, or
+        None. Used by Repository(simplify=True)"""
+        if other.__class__ is not self.__class__ or \
+               set(other._variables) != set(self._variables):
+            return None
+        if other.formula == self.formula:
+            return self
+        return self.__class__(self._variables, '(%s) and (%s)' % \
+                              (self.formula, other.formula), self.type)
+
+_NO_VALUE = object()
+
 class BinaryExpression(Expression):
     """A binary constraint represented as a python expression
 
     This implementation uses a narrowing algorithm optimized for
     binary constraints."""
+    _VECTORIZE_MIN_SIZE = 256
     
     def __init__(self, variables, formula, type = 'fd.BinaryExpression'):
         assert len(variables) == 2
         Expression.__init__(self, variables, formula, type)
+        # for each variable, the last support found in the domain of the
+        # other variable for each of its values
+        self._residues = ({}, {})
 
     def narrow(self, domains):
         """specialized narrowing algorithm for binary expressions
-        Runs much faster than the generic version"""
-        maybe_entailed = 1
-        var1 = self._variables[0]
+        Runs much faster than the generic version
+
+        The last support found for a value (its residue) is remembered, and
+        only the values whose residue was removed from the other domain are
+        tested again. Residues are checked before being used, so they need
+        not be restored when the search backtracks."""
+        var1, var2 = self._variables
         dom1 = domains[var1]
-        values1 = dom1.getValues()
-        var2 = self._variables[1]
         dom2 = domains[var2]
-        values2 = dom2.getValues()
+        residues1, residues2 = self._residues
+        if not residues1 and self.vectorFunc is not None:
+            entailed = self._vectorNarrow(domains, self._residues)
+            if entailed is not None:
+                return entailed
+        try:
+            self._revise(var1, dom1, var2, dom2, residues1, residues2)
+            # the values removed from dom2 supported no value of dom1, so
+            # there is no need to revise dom1 again
+            self._revise(var2, dom2, var1, dom1, residues2, residues1)
+        except ConsistencyFailure:
+            raise ConsistencyFailure('Inconsistency while applying %s' % \
+                                     repr(self))
+        # the remaining values of the other domain are all supported by
+        # the single value left
+        return int(dom1.size() == 1 or dom2.size() == 1)
+
+    def _vectorResidues(self, result, all_values, residues):
+        """record a supporting value of the other variable"""
+        for matrix, values, others, residue in (
+            (result, all_values[0], all_values[1], residues[0]),
+            (result.T, all_values[1], all_values[0], residues[1])):
+            for val, row, index in zip(values, matrix.any(axis=1),
+                                       matrix.argmax(axis=1)):
+                if row:
+                    residue[val] = others[index]
+
+    def _revise(self, var1, dom1, var2, dom2, residues1, residues2):
+        """remove the values of dom1 which have no support in dom2"""
         ffunc = self.filterFunc
-        if dom2.size() < dom1.size():
-            var1, var2 = var2, var1
-            dom1, dom2 = dom2, dom1
-            values1, values2 = values2, values1
-            
         kwargs = {}
-        keep1 = {}
-        keep2 = {}
-        maybe_entailed = 1
+        removed = []
         try:
-            # iterate for all values
-            for val1 in values1:
+            for val1 in dom1.getValues():
+                if residues1.get(val1, _NO_VALUE) in dom2:
+                    continue
                 kwargs[var1] = val1
-                for val2 in values2:
+                for val2 in dom2:
                     kwargs[var2] = val2
-                    if val1 in keep1 and val2 in keep2 and maybe_entailed == 0:
-                        continue
                     if ffunc(**kwargs):
-                        keep1[val1] = 1
-                        keep2[val2] = 1
-                    else:
-                        maybe_entailed = 0
-
-            dom1.removeValues([val for val in values1 if val not in keep1])
-            dom2.removeValues([val for val in values2 if val not in keep2])
-            
-        except ConsistencyFailure:
-            raise ConsistencyFailure('Inconsistency while applying %s' % \
-                                     repr(self))
+                        residues1[val1] = val2
+                        residues2[val2] = val1
+                        break
+                else:
+                    removed.append(val1)
         except Exception:
             print(self, kwargs)
             raise 
-        return maybe_entailed
+        dom1.removeValues(removed)
+
+
+class _NotRecognized(Exception):
+    """raised when a formula has no dedicated propagator"""
 
+# nodes of which the evaluation may fail on some values
+_UNSAFE_NODES = (ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.Subscript,
+                 ast.Attribute, ast.Call)
+
+_MIRRORED = {ast.Eq: ast.Eq, ast.NotEq: ast.NotEq, ast.Lt: ast.Gt,
+             ast.LtE: ast.GtE, ast.Gt: ast.Lt, ast.GtE: ast.LtE}
+_RELATIONS = {ast.Eq: '==', ast.NotEq: '!=', ast.LtE: '<=', ast.GtE: '>='}
+
+try:
+    _unparse = ast.unparse
+except AttributeError: # python < 3.9
+    _unparse = None
+
+def _conjuncts(node):
+    """return the list of the tests of which node is the conjunction,
+    chained comparisons being split in comparisons of two terms"""
+    if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And):
+        tests = []
+        for value in node.values:
+            tests += _conjuncts(value)
+        return tests
+    if isinstance(node, ast.Compare) and len(node.ops) > 1:
+        terms = [node.left] + node.comparators
+        return [ast.Compare(left=left, ops=[op], comparators=[right])
+                for left, op, right in zip(terms, node.ops, terms[1:])]
+    return [node]
+
+def _linear(node, variables):
+    """return the (coefficients, constant) pair of node if it is a linear
+    expression of variables with integer coefficients, coefficients being
+    a dictionnary"""
+    if isinstance(node, ast.Name) and node.id in variables:
+        return {node.id: 1}, 0
+    if isinstance(node, ast.Constant) and type(node.value) is int:
+        return {}, node.value
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.UAdd):
+        return _linear(node.operand, variables)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        coefs, constant = _linear(node.operand, variables)
+        return dict([(var, -coef) for var, coef in coefs.items()]), -constant
+    if isinstance(node, ast.BinOp) and \
+           isinstance(node.op, (ast.Add, ast.Sub, ast.Mult)):
+        coefs1, constant1 = _linear(node.left, variables)
+        coefs2, constant2 = _linear(node.right, variables)
+        if isinstance(node.op, ast.Mult):
+            if coefs1 and coefs2:
+                raise _NotRecognized('product of variables')
+            if coefs2:
+                coefs1, constant1, coefs2, constant2 = \
+                        coefs2, constant2, coefs1, constant1
+            return dict([(var, coef * constant2)
+                         for var, coef in coefs1.items()]), \
+                   constant1 * constant2
+        sign = isinstance(node.op, ast.Add) and 1 or -1
+        coefs = coefs1.copy()
+        for var, coef in coefs2.items():
+            coefs[var] = coefs.get(var, 0) + sign * coef
+        return coefs, constant1 + sign * constant2
+    raise _NotRecognized(node.__class__.__name__)
+
+def _ordered(variables, var1, var2, offsets):
+    """return Differs(var1, var2, offsets) with the variables in the
+    order of variables"""
+    if variables.index(var1) > variables.index(var2):
+        return Differs(var2, var1, [-offset for offset in offsets])
+    return Differs(var1, var2, offsets)
+
+def _recognize(node, variables):
+    """return the list of the dedicated constraints equivalent to node, a
+    comparison of two terms"""
+    if not (isinstance(node, ast.Compare) and len(node.ops) == 1):
+        raise _NotRecognized(node.__class__.__name__)
+    left, op, right = node.left, node.ops[0].__class__, node.comparators[0]
+    # x in (a, b, c)
+    if op is ast.In:
+        if isinstance(left, ast.Name) and left.id in variables and \
+               isinstance(right, (ast.Tuple, ast.List, ast.Set)) and \
+               all([isinstance(elt, ast.Constant) for elt in right.elts]):
+            return [InSet(left.id, set([elt.value for elt in right.elts]))]
+        raise _NotRecognized('in')
+    if op not in _BASIC_CONSTRAINTS:
+        raise _NotRecognized(op.__name__)
+    if isinstance(right, ast.Name) and right.id in variables and not \
+           (isinstance(left, ast.Name) and left.id in variables):
+        left, op, right = right, _MIRRORED[op], left
+    plain = isinstance(left, ast.Name) and left.id in variables
+    # x < constant, for any kind of values
+    if plain and isinstance(right, ast.Constant):
+        return [_BASIC_CONSTRAINTS[op](left.id, right.value)]
+    # x != y and x < y, for any kind of values
+    if plain and isinstance(right, ast.Name) and right.id in variables:
+        if left.id == right.id or op is ast.Eq:
+            raise _NotRecognized('comparison')
+        if op is ast.NotEq:
+            return [_ordered(variables, left.id, right.id, [0])]
+        if op in (ast.Gt, ast.GtE):
+            left, right = right, left
+        return [LexLeq([left.id], [right.id], op in (ast.Lt, ast.Gt))]
+    # abs(x - y + c) != k
+    if op is ast.NotEq and isinstance(left, ast.Call):
+        left, right = right, left
+    if op is ast.NotEq and isinstance(right, ast.Call) and \
+           isinstance(right.func, ast.Name) and right.func.id == 'abs' and \
+           len(right.args) == 1 and not right.keywords:
+        coefs, constant = _linear(right.args[0], variables)
+        terms, distance = _linear(left, variables)
+        coefs = dict([(var, coef) for var, coef in coefs.items() if coef])
+        if terms or sorted(coefs.values()) != [-1, 1]:
+            raise _NotRecognized('abs')
+        var1 = [var for var, coef in coefs.items() if coef == 1][0]
+        var2 = [var for var, coef in coefs.items() if coef == -1][0]
+        if distance < 0:
+            return []
+        return [_ordered(variables, var1, var2,
+                         [distance - constant, -distance - constant])]
+    # linear constraints on numbers
+    coefs1, constant1 = _linear(left, variables)
+    coefs2, constant2 = _linear(right, variables)
+    coefs = coefs1.copy()
+    for var, coef in coefs2.items():
+        coefs[var] = coefs.get(var, 0) - coef
+    constant = constant2 - constant1
+    coefs = dict([(var, coef) for var, coef in coefs.items() if coef])
+    if not coefs or op not in _RELATIONS:
+        # strict inequalities are only equivalent to the others on integers
+        raise _NotRecognized('linear')
+    if op is ast.NotEq and sorted(coefs.values()) == [-1, 1]:
+        var1 = [var for var, coef in coefs.items() if coef == 1][0]
+        var2 = [var for var, coef in coefs.items() if coef == -1][0]
+        return [_ordered(variables, var1, var2, [constant])]
+    scope = [var for var in variables if var in coefs]
+    consistency = op is ast.Eq and 'domain' or 'bounds'
+    return [ScalarProduct(scope, [coefs[var] for var in scope],
+                          _RELATIONS[op], constant, consistency)]
+
+def _compile(variables, formula):
+    """return the list of the constraints equivalent to formula: its
+    conjuncts are recognized as dedicated constraints when possible, the
+    other ones being grouped by variables in expressions. Return None if
+    the formula is better kept as a single expression"""
+    try:
+        tree = ast.parse(formula, mode='eval')
+    except SyntaxError:
+        return None
+    constraints = []
+    others = {}
+    for node in _conjuncts(tree.body):
+        try:
+            constraints += _recognize(node, variables)
+            continue
+        except _NotRecognized:
+            pass
+        # a conjunct which may fail is only evaluated if the previous ones
+        # hold: it must not be separated from them
+        for child in ast.walk(node):
+            if isinstance(child, _UNSAFE_NODES) and not \
+                   (isinstance(child, ast.Call) and
+                    isinstance(child.func, ast.Name) and
+                    child.func.id == 'abs'):
+                return None
+        names = set([child.id for child in ast.walk(node)
+                     if isinstance(child, ast.Name)])
+        scope = tuple([var for var in variables if var in names])
+        if not scope:
+            return None
+        others.setdefault(scope, []).append(node)
+    if not constraints and len(others) < 2:
+        return None
+    if others and _unparse is None:
+        # the tests can not be written back before python 3.9
+        return None
+    # merge the differences forbidden between the same variables
+    merged = []
+    differs = {}
+    for constraint in constraints:
+        if isinstance(constraint, Differs):
+            key = tuple(constraint._variables)
+            if key in differs:
+                other = differs[key]
+                other._offsets = tuple(sorted(set(other._offsets +
+                                                  constraint._offsets)))
+                continue
+            differs[key] = constraint
+        merged.append(constraint)
+    for scope, tests in others.items():
+        merged.append(_make_expression(list(scope), ' and '.join(
+            [_unparse(test) for test in tests])))
+    return merged
 
 def make_expression(variables, formula, constraint_type=None):
     """create a new constraint of type Expression or BinaryExpression
-    The chosen class depends on the number of variables in the constraint"""
-    # encode unicode
-    vars = []
-    for var in variables:
-        if type(var) == type(''):
-            vars.append(var.encode())
-        else:
-            vars.append(var)
+    The chosen class depends on the number of variables in the constraint
+
+    Unless constraint_type is given, the formula is analysed first: its
+    conjuncts are split, and the comparisons of a variable with a
+    constant, x != y, x < y, abs(x - y) != k, x in (a, b) and the
+    comparisons of linear expressions (except strict inequalities) are
+    given dedicated propagators, which are grouped in a Conjunction if
+    there are several. The propagators of arithmetic expressions are
+    replaced by the expression when the domains hold other values than
+    numbers, and those on a single variable are queued as the expression
+    would be (instead of being applied once when added to the repository).
+    The formulas holding operations which may fail, such as divisions,
+    subscripts or calls, are kept whole."""
+    vars = list(variables)
+    if constraint_type is None:
+        constraints = _compile(vars, formula)
+        if constraints is not None:
+            for constraint in constraints:
+                if isinstance(constraint, ScalarProduct) or \
+                       isinstance(constraint, Differs) and \
+                       constraint._offsets != (0,):
+                    return Conjunction(constraints,
+                                       _make_expression(vars, formula))
+            if len(constraints) == 1 and \
+                   not isinstance(constraints[0], BasicConstraint):
+                return constraints[0]
+            return Conjunction(constraints)
+    return _make_expression(vars, formula, constraint_type)
+
+def _make_expression(vars, formula, constraint_type=None):
+    """create the Expression or BinaryExpression evaluating formula"""
     if len(vars) == 2:
         if constraint_type is not None:
             return BinaryExpression(vars, formula, constraint_type)
@@ -327,6 +1209,871 @@ def make_expression(variables, formula, constraint_type=None):
             return Expression(vars, formula)
 
 
+class CostExpression(Expression):
+    """The cost of the solutions represented as a python expression, for
+    Solver.solve_best
+
+    It is called with the values of a solution to get its cost. As a
+    constraint, it removes the values which can not give a cost lower
+    than the bound set by setBound(), so that the search is pruned by
+    branch and bound. The narrowing enumerates the cartesian product of
+    the domains: use a lower bound function instead when the cost depends
+    on many variables."""
+
+    def __init__(self, variables, formula):
+        self.cost = formula
+        self.bound = None
+        Expression.__init__(self, list(variables), 'True', 'fd.CostExpression')
+
+    def _compile(self):
+        """build the functions evaluating the cost, which are compared to
+        the bound: they do not depend on it, nor go in the caches of
+        Expression"""
+        variables = self._variables
+        self.costFunc = eval('lambda %s: %s' % \
+                             (','.join(variables), self.cost), {}, {})
+        self.filterFunc = self._lower
+        cost = _vectorize(variables, self.cost)
+        if cost is None:
+            self.vectorFunc = None
+        else:
+            def lower(**grids):
+                return cost(**grids) < self.bound
+            lower.magnitude = cost.magnitude
+            self.vectorFunc = lower
+
+    def _lower(self, *values):
+        """tell whether the cost of values is lower than the bound"""
+        return self.costFunc(*values) < self.bound
+
+    def __getstate__(self):
+        state = Expression.__getstate__(self)
+        del state['costFunc']
+        return state
+
+    def __call__(self, **solution):
+        return self.costFunc(*[solution[var] for var in self._variables])
+
+    def merge(self, other):
+        """the cost can not be merged with another constraint"""
+        return None
+
+    def setBound(self, bound):
+        """only accept solutions with a cost lower than bound from now on"""
+        self.bound = bound
+        if bound is None:
+            self.formula = 'True'
+        else:
+            self.formula = '(%s) < %r' % (self.cost, bound)
+        # the supports of the previous bound may not be supports anymore
+        self._residues = [{} for variable in self._variables]
+
+    def narrow(self, domains):
+        """never entailed, since the bound keeps decreasing"""
+        if self.bound is not None:
+            Expression.narrow(self, domains)
+        return 0
+
+
+def _mask(indexes, size):
+    """return the bitmask of size bits where the bits of indexes are set"""
+    bits = bytearray((size + 7) >> 3)
+    for index in indexes:
+        bits[index >> 3] |= 1 << (index & 7)
+    return int.from_bytes(bits, 'little')
+
+def read_tuples(filename, separator=None, convert=int):
+    """generate the tuples of a text file with one tuple per line, the
+    values being separated by separator and converted with convert. The
+    file is memory mapped, so that it is never loaded in memory at once"""
+    stream = open(filename, 'rb')
+    try:
+        try:
+            data = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            return
+        try:
+            if separator is not None:
+                separator = separator.encode()
+            for line in iter(data.readline, b''):
+                if line.strip():
+                    yield tuple([convert(value)
+                                 for value in line.split(separator)])
+        finally:
+            data.close()
+    finally:
+        stream.close()
+
+
+class Table(AbstractConstraint):
+    """Constraint given in extension: the values of the variables must be
+    one of the allowed tuples, or none of the forbidden ones if forbidden
+    is true.
+
+    tuples is any iterable, which is read once, or a 2 dimensional numpy
+    array, possibly memory mapped (see numpy.load and read_tuples).
+
+    The narrowing uses the compact table algorithm: each value of each
+    variable has a bitmask of the tuples holding it, so that the tuples
+    still valid are computed with a few operations on large integers
+    rather than by scanning the table. The last valid tuple found for a
+    value (its residue) is remembered, and checked before being used."""
+
+    def __init__(self, variables, tuples, forbidden=False):
+        AbstractConstraint.__init__(self, list(variables))
+        self.forbidden = forbidden
+        if numpy is not None and isinstance(tuples, numpy.ndarray):
+            self._loadArray(tuples)
+        else:
+            self._loadTuples(tuples)
+        self._all = (1 << self._size) - 1
+        # for each variable, a tuple holding each of its values
+        self._residues = [{} for var in self._variables]
+
+    def _loadTuples(self, tuples):
+        """build the bitmasks from an iterable of tuples"""
+        arity = len(self._variables)
+        rows = []
+        seen = set()
+        indexes = [{} for var in self._variables]
+        for row in tuples:
+            row = tuple(row)
+            assert len(row) == arity
+            if row in seen:
+                continue
+            seen.add(row)
+            index = len(rows)
+            rows.append(row)
+            for position, val in enumerate(row):
+                indexes[position].setdefault(val, []).append(index)
+        self._rows = rows
+        self._size = size = len(rows)
+        self._masks = [dict([(val, _mask(val_indexes, size))
+                             for val, val_indexes in position.items()])
+                       for position in indexes]
+
+    def _loadArray(self, tuples):
+        """build the bitmasks from a numpy array, one tuple per row"""
+        assert tuples.ndim == 2 and tuples.shape[1] == len(self._variables)
+        self._rows = rows = numpy.unique(tuples, axis=0)
+        self._size = size = len(rows)
+        self._masks = []
+        for column in rows.T:
+            values, inverse, counts = numpy.unique(column, return_inverse=True,
+                                                   return_counts=True)
+            order = numpy.argsort(inverse, kind='stable')
+            masks = {}
+            start = 0
+            for val, end in zip(values.tolist(), numpy.cumsum(counts).tolist()):
+                bits = numpy.zeros(size, dtype=bool)
+                bits[order[start:end]] = True
+                masks[val] = int.from_bytes(
+                    numpy.packbits(bits, bitorder='little').tobytes(), 'little')
+                start = end
+            self._masks.append(masks)
+
+    def __repr__(self):
+        if self.forbidden:
+            kind = 'forbidden'
+        else:
+            kind = 'allowed'
+        return '<fd.Table %s: %d %s tuples>' % (self._variables, self._size,
+                                                kind)
+
+    def estimateCost(self, domains):
+        """the bitmasks have one bit per tuple"""
+        return len(self._variables) * ((self._size >> 6) + 1)
+
+    def _valid(self, index, domains):
+        """tell whether the tuple at index is valid in domains"""
+        row = self._rows[index]
+        if numpy is not None and isinstance(row, numpy.ndarray):
+            row = row.tolist()
+        for val, dom in zip(row, domains):
+            if val not in dom:
+                return False
+        return True
+
+    def _validTuples(self, domains):
+        """return the bitmask of the tuples valid in domains"""
+        valid = self._all
+        for masks, dom in zip(self._masks, domains):
+            present = [val for val in dom if val in masks]
+            if len(present) == len(masks):
+                continue
+            # combine the masks of the fewest values
+            if 2 * len(present) <= len(masks):
+                mask = 0
+                for val in present:
+                    mask |= masks[val]
+                valid &= mask
+            else:
+                for val, mask in masks.items():
+                    if val not in dom:
+                        valid &= ~mask
+        return valid
+
+    def narrow(self, domains):
+        """narrowing algorithm for the constraint"""
+        doms = [domains[var] for var in self._variables]
+        valid = self._validTuples(doms)
+        try:
+            if self.forbidden:
+                return self._narrowForbidden(doms, valid)
+            return self._narrowAllowed(doms, valid)
+        except ConsistencyFailure:
+            raise ConsistencyFailure('Inconsistency while applying %s' % \
+                                     repr(self))
+
+    def _narrowAllowed(self, doms, valid):
+        """remove the values held by no valid tuple"""
+        if not valid:
+            raise ConsistencyFailure()
+        for masks, residues, dom in zip(self._masks, self._residues, doms):
+            removed = []
+            for val in dom:
+                mask = masks.get(val)
+                if mask is None:
+                    removed.append(val)
+                    continue
+                index = residues.get(val)
+                if index is not None and self._valid(index, doms):
+                    continue
+                mask &= valid
+                if mask:
+                    residues[val] = (mask & -mask).bit_length() - 1
+                else:
+                    removed.append(val)
+            # the removed values were held by no valid tuple, so valid
+            # does not change
+            dom.removeValues(removed)
+        # entailed if every combination of the values is allowed
+        return int(_popcount(valid) ==
+                   reduce(operator.mul, [dom.size() for dom in doms]))
+
+    def _narrowForbidden(self, doms, valid):
+        """remove the values whose combinations with the other values are
+        all forbidden"""
+        for position, (masks, dom) in enumerate(zip(self._masks, doms)):
+            if not valid:
+                return 1
+            others = 1
+            for other, other_dom in enumerate(doms):
+                if other != position:
+                    others *= other_dom.size()
+            if _popcount(valid) < others:
+                continue
+            removed = []
+            for val in dom:
+                mask = masks.get(val, 0) & valid
+                if mask and _popcount(mask) >= others:
+                    removed.append(val)
+                    valid &= ~mask
+            dom.removeValues(removed)
+        return int(not valid)
+
+Extension = Table
+
+
+class ScalarProduct(AbstractConstraint):
+    """Linear constraint: sum(coefficients[i] * variables[i]) compared
+    to constant with relation, one of '==', '!=', '<=' and '>='.
+
+    The propagation works on the bounds of the domains, in time linear in
+    the number of variables (plus the removal of the values out of the
+    bounds). With consistency='domain', the '==' relation removes every
+    value which belongs to no solution instead, by computing the sums
+    reachable by the first and last variables: use it on small domains
+    only."""
+
+    def __init__(self, variables, coefficients, relation='==', constant=0,
+                 consistency='bounds'):
+        assert len(variables) == len(coefficients)
+        assert len(set(variables)) == len(variables)
+        assert relation in ('==', '!=', '<=', '>=')
+        assert consistency in ('bounds', 'domain')
+        AbstractConstraint.__init__(self, list(variables))
+        coefficients = list(coefficients)
+        if relation == '>=':
+            # a.x >= k  <=>  -a.x <= -k
+            coefficients = [-coef for coef in coefficients]
+            constant = -constant
+            relation = '<='
+        self._coefficients = coefficients
+        self._relation = relation
+        self._constant = constant
+        self._consistency = consistency
+
+    def __repr__(self):
+        terms = ['%r*%s' % (coef, var)
+                 for coef, var in zip(self._coefficients, self._variables)]
+        return '<%s %s %s %r>' % (self.__class__.__name__, ' + '.join(terms),
+                                  self._relation, self._constant)
+
+    def estimateCost(self, domains):
+        """linear in the number of variables"""
+        return len(self._variables)
+
+    def narrow(self, domains):
+        """narrowing algorithm for the constraint"""
+        doms = [domains[var] for var in self._variables]
+        try:
+            if self._relation == '!=':
+                return self._narrowNotEqual(doms)
+            if self._relation == '==' and self._consistency == 'domain':
+                return self._narrowDomains(doms)
+            return self._narrowBounds(doms)
+        except ConsistencyFailure:
+            raise ConsistencyFailure('Inconsistency while applying %s' % \
+                                     repr(self))
+
+    def _termBounds(self, doms):
+        """return the lists of the minimum and maximum of each term"""
+        lows, highs = [], []
+        for coef, dom in zip(self._coefficients, doms):
+            low, high = min(dom), max(dom)
+            if coef < 0:
+                low, high = high, low
+            lows.append(coef * low)
+            highs.append(coef * high)
+        return lows, highs
+
+    def _narrowBounds(self, doms):
+        """remove the values out of the bounds allowed by the other
+        terms, until the bounds do not change"""
+        constant = self._constant
+        equal = self._relation == '=='
+        lows, highs = self._termBounds(doms)
+        low, high = sum(lows), sum(highs)
+        changed = True
+        while changed:
+            if low > constant or (equal and high < constant):
+                raise ConsistencyFailure()
+            changed = False
+            for index, (coef, dom) in enumerate(zip(self._coefficients, doms)):
+                # bounds of the term allowed by the other terms
+                term_high = constant - (low - lows[index])
+                term_low = None
+                if equal:
+                    term_low = constant - (high - highs[index])
+                if highs[index] <= term_high and \
+                       (term_low is None or lows[index] >= term_low):
+                    continue
+                dom.removeValues([val for val in dom
+                                  if coef * val > term_high or
+                                  (term_low is not None and
+                                   coef * val < term_low)])
+                val_low, val_high = min(dom), max(dom)
+                if coef < 0:
+                    val_low, val_high = val_high, val_low
+                low += coef * val_low - lows[index]
+                high += coef * val_high - highs[index]
+                lows[index], highs[index] = coef * val_low, coef * val_high
+                changed = equal
+        if equal:
+            # the bounds are equal to the constant if all the domains are
+            # reduced to one value
+            return int(low == high)
+        return int(high <= constant)
+
+    def _narrowNotEqual(self, doms):
+        """remove the forbidden value of the last variable not
+        instanciated"""
+        lows, highs = self._termBounds(doms)
+        if sum(lows) > self._constant or sum(highs) < self._constant:
+            return 1
+        free = [index for index, dom in enumerate(doms) if dom.size() > 1]
+        if len(free) > 1:
+            return 0
+        if not free:
+            # low == high == constant
+            raise ConsistencyFailure()
+        index = free[0]
+        coef = self._coefficients[index]
+        rest = self._constant - (sum(lows) - lows[index])
+        for val in doms[index].getValues():
+            if coef * val == rest:
+                doms[index].removeValue(val)
+        return 1
+
+    def _narrowDomains(self, doms):
+        """remove the values which can not complete the sum of the other
+        terms to the constant"""
+        coefs = self._coefficients
+        # reachable[i] is the set of the sums of the first i terms
+        reachable = [set([0])]
+        for coef, dom in zip(coefs, doms):
+            reachable.append(set([total + coef * val
+                                  for total in reachable[-1] for val in dom]))
+        if self._constant not in reachable[-1]:
+            raise ConsistencyFailure()
+        # needed is the set of the sums of the last terms completing the
+        # constant, for the terms after the current one
+        needed = set([self._constant])
+        entailed = 1
+        for index in range(len(doms) - 1, -1, -1):
+            coef, dom = coefs[index], doms[index]
+            before = reachable[index]
+            dom.removeValues([val for val in dom
+                              if not any([total - coef * val in before
+                                          for total in needed])])
+            if dom.size() > 1:
+                entailed = 0
+            needed = set([total - coef * val for total in needed
+                          for val in dom]) & before
+        return entailed
+
+
+class Sum(ScalarProduct):
+    """Linear constraint: sum(variables) compared to constant with
+    relation, see ScalarProduct"""
+
+    def __init__(self, variables, relation='==', constant=0,
+                 consistency='bounds'):
+        ScalarProduct.__init__(self, variables, [1] * len(variables),
+                               relation, constant, consistency)
+
+
+class Among(AbstractConstraint):
+    """Constraint: the number of variables taking one of values is at
+    least low and at most high (the number of variables by default)
+
+    The variables whose domain is included in values must take one of
+    them, the ones whose domain meets values may take one. When the first
+    ones are high, the values are removed from the others; when the
+    second ones are low, they must all take one of the values."""
+
+    def __init__(self, variables, values, low=0, high=None):
+        AbstractConstraint.__init__(self, list(variables))
+        if high is None:
+            high = len(self._variables)
+        assert 0 <= low <= high
+        self._values = set(values)
+        self._low = low
+        self._high = high
+
+    def __repr__(self):
+        return '<%s %s in %s: %d..%d>' % (self.__class__.__name__,
+                                          self._variables,
+                                          sorted(self._values),
+                                          self._low, self._high)
+
+    def estimateCost(self, domains):
+        """linear in the number of variables"""
+        return len(self._variables)
+
+    def narrow(self, domains):
+        """narrowing algorithm for the constraint"""
+        values = self._values
+        mandatory = 0
+        undecided = []
+        for var in self._variables:
+            dom = domains[var]
+            inside = len([val for val in dom if val in values])
+            if inside == dom.size():
+                mandatory += 1
+            elif inside:
+                undecided.append(dom)
+        possible = mandatory + len(undecided)
+        if mandatory > self._high or possible < self._low:
+            raise ConsistencyFailure('Inconsistency while applying %s' % \
+                                     repr(self))
+        # the removals below can not fail, since the undecided domains
+        # have values both in and out of values
+        if mandatory == self._high:
+            for dom in undecided:
+                dom.removeValues([val for val in dom if val in values])
+            return 1
+        if possible == self._low:
+            for dom in undecided:
+                dom.removeValues([val for val in dom if val not in values])
+            return 1
+        return int(mandatory >= self._low and possible <= self._high)
+
+
+class AtMost(Among):
+    """Constraint: at most count variables take value"""
+
+    def __init__(self, variables, value, count):
+        Among.__init__(self, variables, [value], 0, count)
+
+
+class AtLeast(Among):
+    """Constraint: at least count variables take value"""
+
+    def __init__(self, variables, value, count):
+        Among.__init__(self, variables, [value], count)
+
+
+class GlobalCardinality(AbstractConstraint):
+    """Constraint: the number of variables taking each value of cards is
+    within the bounds given by cards, a dictionnary mapping values to a
+    number of variables or to a (low, high) pair. If closed is true, the
+    variables can only take the values of cards.
+
+    The propagation counts, for each value, the variables instanciated to
+    it and the ones which may take it, as Among does for each value, until
+    nothing changes."""
+
+    def __init__(self, variables, cards, closed=False):
+        AbstractConstraint.__init__(self, list(variables))
+        self._cards = {}
+        for val, card in cards.items():
+            if isinstance(card, tuple):
+                low, high = card
+            else:
+                low = high = card
+            assert 0 <= low <= high
+            self._cards[val] = (low, high)
+        self._lows = sum([low for low, high in self._cards.values()])
+        self._closed = closed
+
+    def __repr__(self):
+        return '<GlobalCardinality %s %s>' % (self._variables, self._cards)
+
+    def estimateCost(self, domains):
+        """linear in the number of variables"""
+        return len(self._variables)
+
+    def narrow(self, domains):
+        """narrowing algorithm for the constraint"""
+        cards = self._cards
+        doms = [domains[var] for var in self._variables]
+        try:
+            if self._lows > len(doms):
+                raise ConsistencyFailure()
+            if self._closed:
+                for dom in doms:
+                    dom.removeValues([val for val in dom if val not in cards])
+            changed = True
+            while changed:
+                changed = False
+                entailed = 1
+                # the domains holding each value
+                holders = dict([(val, []) for val in cards])
+                for dom in doms:
+                    for val in dom:
+                        if val in holders:
+                            holders[val].append(dom)
+                for val, (low, high) in cards.items():
+                    possible = holders[val]
+                    fixed = len([dom for dom in possible if dom.size() == 1])
+                    if fixed > high or len(possible) < low:
+                        raise ConsistencyFailure()
+                    if fixed == high and len(possible) > high:
+                        for dom in possible:
+                            if dom.size() > 1:
+                                dom.removeValue(val)
+                    elif len(possible) == low and fixed < low:
+                        for dom in possible:
+                            if dom.size() > 1:
+                                dom.removeValues([other for other in dom
+                                                  if other != val])
+                    else:
+                        if fixed < low or len(possible) > high:
+                            entailed = 0
+                        continue
+                    # holders is not up to date anymore
+                    changed = True
+                    break
+        except ConsistencyFailure:
+            raise ConsistencyFailure('Inconsistency while applying %s' % \
+                                     repr(self))
+        return entailed
+
+
+def _lex_leq(vector1, vector2, strict):
+    """tell whether vector1 is lexicographically lower than or equal to
+    (strictly lower if strict) vector2"""
+    if strict:
+        return vector1 < vector2
+    return vector1 <= vector2
+
+
+class LexLeq(AbstractConstraint):
+    """Constraint: the values of variables1 are lexicographically lower
+    than or equal to the ones of variables2 (strictly lower if strict)
+
+    Only the first position alpha where the vectors are not instanciated
+    to the same values can be narrowed: x[alpha] <= y[alpha], and
+    x[alpha] < y[alpha] if the rest of the vectors can not be lower or
+    equal. This enforces generalized arc consistency when the vectors do
+    not share variables."""
+
+    def __init__(self, variables1, variables2, strict=False):
+        assert len(variables1) == len(variables2)
+        variables = []
+        for var in list(variables1) + list(variables2):
+            if var not in variables:
+                variables.append(var)
+        AbstractConstraint.__init__(self, variables)
+        self._vector1 = list(variables1)
+        self._vector2 = list(variables2)
+        self._strict = strict
+
+    def __repr__(self):
+        if self._strict:
+            relation = '<'
+        else:
+            relation = '<='
+        return '<LexLeq %s %s %s>' % (self._vector1, relation, self._vector2)
+
+    def estimateCost(self, domains):
+        """linear in the number of variables"""
+        return len(self._variables)
+
+    def narrow(self, domains):
+        """narrowing algorithm for the constraint"""
+        try:
+            return self._narrow(domains)
+        except ConsistencyFailure:
+            raise ConsistencyFailure('Inconsistency while applying %s' % \
+                                     repr(self))
+
+    def _narrow(self, domains):
+        doms1 = [domains[var] for var in self._vector1]
+        doms2 = [domains[var] for var in self._vector2]
+        strict = self._strict
+        alpha = 0
+        while True:
+            # skip the positions instanciated to the same value
+            while alpha < len(doms1) and (doms1[alpha] is doms2[alpha] or (
+                doms1[alpha].size() == 1 and
+                doms1[alpha].getValues() == doms2[alpha].getValues())):
+                alpha += 1
+            if alpha == len(doms1):
+                if strict:
+                    raise ConsistencyFailure()
+                return 1
+            lows1 = [min(dom) for dom in doms1[alpha:]]
+            highs1 = [max(dom) for dom in doms1[alpha:]]
+            lows2 = [min(dom) for dom in doms2[alpha:]]
+            highs2 = [max(dom) for dom in doms2[alpha:]]
+            if _lex_leq(highs1, lows2, strict):
+                return 1
+            dom1, dom2 = doms1[alpha], doms2[alpha]
+            if _lex_leq(lows1[1:], highs2[1:], strict):
+                dom1.removeValues([val for val in dom1 if val > highs2[0]])
+                dom2.removeValues([val for val in dom2 if val < lows1[0]])
+            else:
+                # the vectors can not be equal up to alpha
+                dom1.removeValues([val for val in dom1 if val >= highs2[0]])
+                dom2.removeValues([val for val in dom2 if val <= lows1[0]])
+            if dom1.size() > 1 or dom1.getValues() != dom2.getValues():
+                return int(max(dom1) < min(dom2))
+
+
+class LexChain(AbstractConstraint):
+    """Constraint: the values of the vectors of variables are in
+    lexicographic order (strictly increasing if strict)
+
+    Each pair of consecutive vectors is narrowed as LexLeq does, until the
+    domains do not change."""
+
+    def __init__(self, vectors, strict=False):
+        assert len(vectors) > 1
+        variables = []
+        for vector in vectors:
+            for var in vector:
+                if var not in variables:
+                    variables.append(var)
+        AbstractConstraint.__init__(self, variables)
+        self._vectors = [list(vector) for vector in vectors]
+        self._pairs = [LexLeq(vector1, vector2, strict)
+                       for vector1, vector2 in zip(vectors, vectors[1:])]
+
+    def __repr__(self):
+        return '<LexChain %s>' % self._vectors
+
+    def estimateCost(self, domains):
+        """linear in the number of variables"""
+        return len(self._variables)
+
+    def narrow(self, domains):
+        """narrowing algorithm for the constraint"""
+        doms = [domains[var] for var in self._variables]
+        pairs = self._pairs
+        size = None
+        while True:
+            entailed = 1
+            for pair in pairs:
+                entailed &= pair.narrow(domains)
+            new_size = sum([dom.size() for dom in doms])
+            if new_size == size:
+                return entailed
+            size = new_size
+
+
+class ValuePrecedence(AbstractConstraint):
+    """Constraint: each value of values is taken by the variables only
+    after the previous value was taken, if it is taken at all. This
+    breaks the symmetry of interchangeable values."""
+
+    def __init__(self, variables, values):
+        AbstractConstraint.__init__(self, list(variables))
+        self._values = list(values)
+
+    def __repr__(self):
+        return '<ValuePrecedence %s %s>' % (self._variables, self._values)
+
+    def estimateCost(self, domains):
+        """linear in the number of variables"""
+        return len(self._variables)
+
+    def narrow(self, domains):
+        """narrowing algorithm for the constraint"""
+        doms = [domains[var] for var in self._variables]
+        entailed = 1
+        try:
+            for value, following in zip(self._values, self._values[1:]):
+                # following can not be taken up to the first variable which
+                # can take value
+                for dom in doms:
+                    if following in dom:
+                        dom.removeValue(following)
+                    if value in dom:
+                        if dom.size() > 1:
+                            entailed = 0
+                        break
+        except ConsistencyFailure:
+            raise ConsistencyFailure('Inconsistency while applying %s' % \
+                                     repr(self))
+        return entailed
+
+
+class Differs(AbstractConstraint):
+    """Constraint: the difference var1 - var2 is none of offsets, the
+    default offsets meaning var1 != var2
+
+    A value can only lose its supports when the other domain has no more
+    values than there are offsets, so that the narrowing takes constant
+    time on larger domains."""
+
+    def __init__(self, var1, var2, offsets=(0,)):
+        assert var1 != var2
+        AbstractConstraint.__init__(self, [var1, var2])
+        self._offsets = tuple(sorted(set(offsets)))
+
+    def __repr__(self):
+        return '<Differs %s - %s not in %s>' % (self._variables[0],
+                                                self._variables[1],
+                                                list(self._offsets))
+
+    def estimateCost(self, domains):
+        """constant time"""
+        return 1
+
+    def merge(self, other):
+        """return the Differs forbidding the offsets of self and other if
+        other is a Differs on the same variables, or None"""
+        if not isinstance(other, Differs) or \
+               set(other._variables) != set(self._variables):
+            return None
+        offsets = other._offsets
+        if other._variables != self._variables:
+            offsets = [-offset for offset in offsets]
+        return Differs(self._variables[0], self._variables[1],
+                       self._offsets + tuple(offsets))
+
+    def narrow(self, domains):
+        """narrowing algorithm for the constraint"""
+        var1, var2 = self._variables
+        dom1, dom2 = domains[var1], domains[var2]
+        try:
+            while self._revise(dom1, dom2, 1) | self._revise(dom2, dom1, -1):
+                pass
+        except ConsistencyFailure:
+            raise ConsistencyFailure('Inconsistency while applying %s' % \
+                                     repr(self))
+        # the values of the other domain are all supported by the single
+        # value left
+        return int(dom1.size() == 1 or dom2.size() == 1)
+
+    def _revise(self, dom1, dom2, sign):
+        """remove the values of dom1 which have no support in dom2, sign
+        being -1 if dom1 is the domain of var2, and tell whether some were
+        removed"""
+        offsets = self._offsets
+        if dom2.size() > len(offsets):
+            return False
+        values2 = dom2.getValues()
+        removed = []
+        for val1 in dom1.getValues():
+            for val2 in values2:
+                if offsets == (0,):
+                    # no arithmetic for var1 != var2
+                    if val1 != val2:
+                        break
+                elif sign * (val1 - val2) not in offsets:
+                    break
+            else:
+                removed.append(val1)
+        dom1.removeValues(removed)
+        return bool(removed)
+
+
+def _numbers(domains, variables):
+    """tell whether the domains of variables only hold numbers"""
+    for var in variables:
+        for value in domains[var].getValues():
+            if not isinstance(value, (int, float)):
+                return False
+    return True
+
+class Conjunction(AbstractConstraint):
+    """Constraint: all the constraints hold
+
+    The constraints are narrowed in turn until the domains do not change.
+    make_expression builds conjunctions when it splits a formula.
+
+    fallback is an optional constraint equivalent to the conjunction,
+    narrowed instead when the domains hold values which are not numbers,
+    for constraints requiring numbers."""
+
+    def __init__(self, constraints, fallback=None):
+        variables = []
+        for constraint in constraints:
+            for var in constraint.affectedVariables():
+                if var not in variables:
+                    variables.append(var)
+        AbstractConstraint.__init__(self, variables)
+        self._constraints = list(constraints)
+        self._fallback = fallback
+        # whether the domains hold numbers, checked on the first narrowing
+        # since their values are only removed afterwards
+        self._numbers = None
+
+    def __repr__(self):
+        return '<Conjunction %s>' % self._constraints
+
+    def estimateCost(self, domains):
+        cost = 0
+        for constraint in self._constraints:
+            cost += constraint.estimateCost(domains)
+        return cost
+
+    def narrow(self, domains):
+        """narrowing algorithm for the constraint"""
+        if self._fallback is not None:
+            if self._numbers is None:
+                self._numbers = _numbers(domains, self._variables)
+            if not self._numbers:
+                return self._fallback.narrow(domains)
+        if len(self._constraints) == 1:
+            return self._constraints[0].narrow(domains)
+        doms = [domains[var] for var in self._variables]
+        size = None
+        while True:
+            entailed = 1
+            for constraint in self._constraints:
+                entailed &= constraint.narrow(domains)
+            new_size = sum([dom.size() for dom in doms])
+            if new_size == size:
+                return entailed
+            size = new_size
+
+
 class Equals(BasicConstraint):
     """A basic constraint variable == constant value"""
     def __init__(self, variable, reference):
@@ -366,6 +2113,7 @@ class InSet(BasicConstraint):
     def __init__(self, variable, set):
         BasicConstraint.__init__(self, variable, set, _in )
 
-
-
-
+# basic constraints of the comparisons recognized by make_expression
+_BASIC_CONSTRAINTS = {ast.Eq: Equals, ast.NotEq: NotEquals,
+                      ast.Lt: LesserThan, ast.LtE: LesserOrEqual,
+                      ast.Gt: GreaterThan, ast.GtE: GreaterOrEqual}
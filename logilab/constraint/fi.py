@@ -21,6 +21,9 @@
 
 
 
+import math
+from collections.abc import Sequence
+
 from logilab.common.compat import set, sorted
 
 from logilab.constraint.distributors import AbstractDistributor
@@ -42,6 +45,39 @@ class Interval:
         return self._start == other._start and \
                self._end == other._end
 
+def _floor(value):
+    """floor of value, ignoring rounding errors of the computations"""
+    return int(math.floor(value + 1e-9))
+
+
+class IntervalSequence(Sequence):
+    """Read only sequence of the intervals of a FiniteIntervalDomain, as
+    they were when it was created. The intervals are computed when they
+    are accessed"""
+
+    def __init__(self, domain):
+        self._domain = domain.copy()
+
+    def __len__(self):
+        return self._domain.size()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._domain.getValue(i)
+                    for i in range(*index.indices(len(self)))]
+        return self._domain.getValue(index)
+
+    def __iter__(self):
+        return self._domain.iter_values()
+
+    def __eq__(self, other):
+        if not isinstance(other, (Sequence, list)):
+            return NotImplemented
+        return len(self) == len(other) and list(self) == list(other)
+
+    def __repr__(self):
+        return '<IntervalSequence of %d intervals>' % len(self)
+
 class FiniteIntervalDomain(AbstractDomain):
     """
     Domain for a variable with interval values. 
@@ -80,26 +116,58 @@ class FiniteIntervalDomain(AbstractDomain):
                self._resolution == other._resolution
 
     def getValues(self):
-        return list(self.iter_values())
+        """return a sequence of the intervals of the domain, ordered by
+        length then by start. They are computed when accessed"""
+        return IntervalSequence(self)
 
     def iter_values(self):
-        length = self._min_length
-        while length <= self._max_length:
-            start = self.lowestMin
-            while start + length <= self.highestMax:
-                yield Interval(start, start+length)
-                start += self._resolution
-            length += self._resolution
-        
-        
+        lengths, positions = self._shape()
+        for index in range(lengths):
+            length = self._min_length + index * self._resolution
+            for position in range(positions - index):
+                start = self.lowestMin + position * self._resolution
+                yield Interval(start, start + length)
+
+    def _shape(self):
+        """return the number of lengths of the intervals, and the number of
+        positions of the shortest ones (there is one less position for each
+        longer length)"""
+        resolution = self._resolution
+        positions = _floor((self.highestMax - self.lowestMin -
+                            self._min_length) / resolution) + 1
+        if positions <= 0:
+            return 0, 0
+        lengths = _floor((self._max_length - self._min_length) /
+                         resolution) + 1
+        return min(lengths, positions), positions
+
     def size(self):
         """computes the size of a finite interval"""
-        size = 0
-        length = self._min_length 
-        while length <= self._max_length :
-            size += ((self.highestMax - length) - self.lowestMin) / self._resolution + 1
-            length += self._resolution
-        return size
+        lengths, positions = self._shape()
+        return lengths * positions - lengths * (lengths - 1) // 2
+
+    def getValue(self, index):
+        """return the interval at index in getValues(), in constant time"""
+        lengths, positions = self._shape()
+        size = lengths * positions - lengths * (lengths - 1) // 2
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError('interval index out of range')
+        # there are before(i) intervals shorter than the i-th length:
+        # solve before(i) = i * positions - i * (i - 1) / 2 = index
+        before = lambda i: i * positions - i * (i - 1) // 2
+        term = 2 * positions + 1
+        length_index = int((term - math.sqrt(term * term - 8 * index)) / 2)
+        # fix rounding errors
+        while length_index > 0 and before(length_index) > index:
+            length_index -= 1
+        while before(length_index + 1) <= index:
+            length_index += 1
+        start = self.lowestMin + \
+                (index - before(length_index)) * self._resolution
+        return Interval(start, start + self._min_length +
+                        length_index * self._resolution)
 
     def _highestMin(self):
         return self.highestMax - self._min_length
@@ -117,19 +185,31 @@ class FiniteIntervalDomain(AbstractDomain):
                                     self._min_length, self._max_length,
                                     self._resolution)
 
+    def getState(self):
+        return (self.lowestMin, self.highestMax,
+                self._min_length, self._max_length)
+
+    def setState(self, state):
+        (self.lowestMin, self.highestMax,
+         self._min_length, self._max_length) = state
+
     def setLowestMin(self, new_lowestMin):
+        self._saveState()
         self.lowestMin = new_lowestMin
         self._valueRemoved()
 
     def setHighestMax(self, new_highestMax):
+        self._saveState()
         self.highestMax = new_highestMax
         self._valueRemoved()
 
     def setMinLength(self, new_min):
+        self._saveState()
         self._min_length = new_min
         self._valueRemoved()
 
     def setMaxLength(self, new_max):
+        self._saveState()
         self._max_length = new_max
         self._valueRemoved()
 
@@ -193,21 +273,11 @@ class FiniteIntervalDistributor(AbstractDistributor):
             copy2._min_length += copy2._resolution
         
 
-    def _distribute(self, dom1, dom2):
-        variable = self.findSmallestDomain(dom1)
+    def _splitDomain(self, variable, dom1, dom2):
         if self.verbose:
             __fmt_str = 'Distributing domain for variable'
             print(__fmt_str , variable)
-        splitted = dom1[variable]
-        cpy1 = splitted.copy()
-        cpy2 = splitted.copy()
-
-        self._split_values(cpy1, cpy2)
-            
-        dom1[variable] = cpy1
-        dom2[variable] = cpy2
-        
-        return cpy1, cpy2
+        self._split_values(dom1, dom2)
             
         
 
@@ -247,13 +317,16 @@ class AbstractFIConstraint(AbstractConstraint):
 
 
 
-# FIXME: deal with more than 2 domains at once ?
 class NoOverlap(AbstractFIConstraint):
+    """the intervals do not overlap, see Disjunctive for more than 2
+    intervals"""
 
     def __eq__(self, other):
         return isinstance(other, NoOverlap) and \
                set(self._variables) == set(other._variables)
 
+    __hash__ = AbstractFIConstraint.__hash__
+
     def _doNarrow(self, dom1, dom2):
         if not dom1.overlap(dom2):
             return 1
@@ -352,3 +425,259 @@ class EndsAfterEnd(AbstractFIConstraint):
             return 1
         return 0
     
+
+##
+## Resource constraints
+##
+## The tasks are given to the filtering functions as (earliest start,
+## latest end, duration) triples, the duration being the minimum length of
+## the interval. The latest ends are filtered by applying the same
+## functions on the mirrored tasks.
+
+def _mirror(tasks):
+    """return the tasks obtained by reversing time"""
+    return [(-lct, -est, duration) for est, lct, duration in tasks]
+
+def _earliest_completion(tasks):
+    """return the earliest time when all the tasks can be completed"""
+    ect = None
+    total = 0
+    for est, lct, duration in sorted(tasks, reverse=True):
+        total += duration
+        if ect is None or est + total > ect:
+            ect = est + total
+    return ect
+
+def _edge_finding(tasks):
+    """return the earliest starts of the tasks of a unary resource, raised
+    by edge finding: if a task can not end before the end of the tasks of
+    a set Omega, it starts after their earliest completion.
+    Raise ConsistencyFailure if the tasks of a set Omega can not be done
+    before their latest end (overload checking)"""
+    nb_tasks = len(tasks)
+    new_est = [est for est, lct, duration in tasks]
+    order = sorted(range(nb_tasks), key=lambda index: tasks[index][0])
+    for bound in sorted(set([lct for est, lct, duration in tasks])):
+        # Omega holds the tasks ending before bound. For each position in
+        # the order of the earliest starts, compute the duration of the
+        # tasks of Omega starting after it (suffix), and the maximum of
+        # est + suffix over Omega before (prefix) and after (after) it
+        suffix = [0] * (nb_tasks + 1)
+        after = [None] * (nb_tasks + 1)
+        for position in range(nb_tasks - 1, -1, -1):
+            est, lct, duration = tasks[order[position]]
+            suffix[position] = suffix[position + 1]
+            after[position] = after[position + 1]
+            if lct <= bound:
+                suffix[position] += duration
+                if after[position] is None or \
+                       est + suffix[position] > after[position]:
+                    after[position] = est + suffix[position]
+        ect = after[0]
+        if ect is None:
+            continue
+        if ect > bound:
+            raise ConsistencyFailure('resource overloaded before %s' % bound)
+        prefix = None
+        for position in range(nb_tasks):
+            index = order[position]
+            est, lct, duration = tasks[index]
+            if lct <= bound:
+                if prefix is None or est + suffix[position] > prefix:
+                    prefix = est + suffix[position]
+                continue
+            # earliest completion of Omega and the task
+            completion = est + suffix[position]
+            if prefix is not None and prefix > completion:
+                completion = prefix
+            completion += duration
+            if after[position + 1] is not None and \
+                   after[position + 1] > completion:
+                completion = after[position + 1]
+            if completion > bound and ect > new_est[index]:
+                # the task ends after Omega
+                new_est[index] = ect
+    return new_est
+
+def _not_last(tasks):
+    """return the latest ends of the tasks of a unary resource, lowered by
+    the not-last rule: if the tasks of a set Omega can not be completed
+    before the latest start of a task, this task ends before the latest
+    start of one of them"""
+    nb_tasks = len(tasks)
+    new_lct = [lct for est, lct, duration in tasks]
+    lst = [lct - duration for est, lct, duration in tasks]
+    queue = sorted(range(nb_tasks), key=lambda index: lst[index])
+    theta = []
+    for index in sorted(range(nb_tasks), key=lambda index: tasks[index][1]):
+        while len(theta) < nb_tasks and \
+                  tasks[index][1] > lst[queue[len(theta)]]:
+            theta.append(queue[len(theta)])
+        others = [other for other in theta if other != index]
+        if others and \
+               _earliest_completion([tasks[other] for other in others]) > \
+               lst[index]:
+            new_lct[index] = min(new_lct[index], lst[others[-1]])
+    return new_lct
+
+def _timetable(tasks, demands, capacity):
+    """return the earliest starts of the tasks of a cumulative resource,
+    raised so that they do not overload the profile of the compulsory
+    parts of the other tasks.
+    Raise ConsistencyFailure if the profile exceeds the capacity"""
+    events = []
+    for (est, lct, duration), demand in zip(tasks, demands):
+        if lct - duration < est + duration:
+            events.append((lct - duration, demand))
+            events.append((est + duration, -demand))
+    events.sort()
+    segments = []
+    height = 0
+    for position, (time, delta) in enumerate(events):
+        height += delta
+        if height > capacity:
+            raise ConsistencyFailure('resource overloaded at %s' % time)
+        if height and position + 1 < len(events) and \
+               events[position + 1][0] > time:
+            segments.append((time, events[position + 1][0], height))
+    new_est = []
+    for (est, lct, duration), demand in zip(tasks, demands):
+        start = est
+        for begin, end, height in segments:
+            if begin >= start + duration:
+                break
+            if end <= start:
+                continue
+            if lct - duration <= begin and end <= est + duration:
+                # compulsory part of the task itself
+                height -= demand
+            if height + demand > capacity:
+                start = end
+        new_est.append(start)
+    return new_est
+
+def _energy_overload(tasks, demands, capacity):
+    """raise ConsistencyFailure if the tasks starting after a time and
+    ending before another one need more energy than available between
+    the two"""
+    for bound in set([lct for est, lct, duration in tasks]):
+        energy = 0
+        for (est, lct, duration), demand in sorted(zip(tasks, demands),
+                                                   reverse=True):
+            if lct <= bound:
+                energy += duration * demand
+                if energy > capacity * (bound - est):
+                    raise ConsistencyFailure('resource overloaded between '
+                                             '%s and %s' % (est, bound))
+
+
+class AbstractResourceConstraint(AbstractConstraint):
+    """Base class of the constraints on the intervals of many variables
+    sharing a resource"""
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, str(self._variables))
+
+    def estimateCost(self, domains):
+        """quadratic in the number of tasks"""
+        return len(self._variables) ** 2
+
+    def narrow(self, domains):
+        """narrowing algorithm for the constraint, repeated until the
+        domains do not change"""
+        doms = [domains[var] for var in self._variables]
+        while True:
+            tasks = [(dom.lowestMin, dom.highestMax, dom._min_length)
+                     for dom in doms]
+            new_est, new_lct = self._filter(tasks)
+            changed = False
+            for dom, (est, lct, duration), start, end in zip(doms, tasks,
+                                                             new_est, new_lct):
+                if end - start < duration:
+                    raise ConsistencyFailure('no room left for %s in %s' %
+                                             (dom, self))
+                if start > est:
+                    dom.setLowestMin(start)
+                    changed = True
+                if end < lct:
+                    dom.setHighestMax(end)
+                    changed = True
+            if not changed:
+                return self._entailed(tasks)
+
+    def _filter(self, tasks):
+        """return the new earliest starts and latest ends of the tasks"""
+        raise NotImplementedError
+
+    def _entailed(self, tasks):
+        """tell whether the resource can not be overloaded anymore"""
+        raise NotImplementedError
+
+
+class Disjunctive(AbstractResourceConstraint):
+    """The intervals of the variables do not overlap (they use a unary
+    resource): the n-ary version of NoOverlap.
+
+    The propagation uses overload checking, edge finding and the
+    not-first / not-last rules, in O(n^2) for n variables."""
+
+    def _filter(self, tasks):
+        mirror = _mirror(tasks)
+        new_est = _edge_finding(tasks)
+        new_lct = [-end for end in _edge_finding(mirror)]
+        # not first
+        for index, end in enumerate(_not_last(mirror)):
+            new_est[index] = max(new_est[index], -end)
+        for index, end in enumerate(_not_last(tasks)):
+            new_lct[index] = min(new_lct[index], end)
+        return new_est, new_lct
+
+    def _entailed(self, tasks):
+        tasks = sorted(tasks)
+        for (est, lct, duration), following in zip(tasks, tasks[1:]):
+            if lct > following[0]:
+                return 0
+        return 1
+
+
+class Cumulative(AbstractResourceConstraint):
+    """The intervals of the variables use a resource of the given
+    capacity, each one needing the amount given by demands: at any time,
+    the sum of the demands of the intervals holding it does not exceed
+    capacity.
+
+    The propagation uses the timetable of the compulsory parts of the
+    intervals, and checks that the energy needed in each time window is
+    available."""
+
+    def __init__(self, variables, demands, capacity):
+        assert len(variables) == len(demands)
+        AbstractResourceConstraint.__init__(self, variables)
+        self._demands = demands
+        self._capacity = capacity
+
+    def __repr__(self):
+        return '<%s %s %s/%s>' % (self.__class__.__name__,
+                                  str(self._variables), self._demands,
+                                  self._capacity)
+
+    def _filter(self, tasks):
+        _energy_overload(tasks, self._demands, self._capacity)
+        new_est = _timetable(tasks, self._demands, self._capacity)
+        new_lct = [-end for end in _timetable(_mirror(tasks), self._demands,
+                                              self._capacity)]
+        return new_est, new_lct
+
+    def _entailed(self, tasks):
+        events = []
+        for (est, lct, duration), demand in zip(tasks, self._demands):
+            events.append((est, demand))
+            events.append((lct, -demand))
+        # ends before starts at the same time
+        events.sort(key=lambda event: (event[0], event[1]))
+        height = 0
+        for time, delta in events:
+            height += delta
+            if height > self._capacity:
+                return 0
+        return 1
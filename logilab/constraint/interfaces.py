@@ -64,6 +64,16 @@ class DomainInterface:
         These values should not be modified!"""
         raise NotImplementedError
 
+    def getState(self):
+        """returns an opaque snapshot of the content of the domain
+        The domain must not modify it afterwards"""
+        raise NotImplementedError
+
+    def setState(self, state):
+        """restores a snapshot returned by getState on this domain or
+        on a copy of it"""
+        raise NotImplementedError
+
 class DistributorInterface:
     """The interface that all distributors should implement"""
     def distribute(self, domains, verbose=0):
@@ -72,6 +82,21 @@ class DistributorInterface:
         This list should be a partition of the initial domains"""
         raise NotImplementedError
 
+    def split(self, domains, verbose=0):
+        """returns a (variable, subdomains) pair: subdomains is a partition
+        of the domain of variable, and only this domain is copied"""
+        raise NotImplementedError
+
+    def notifyPropagation(self, variables):
+        """called by the solver after the propagation at each node, with
+        the variables whose domain was narrowed"""
+        raise NotImplementedError
+
+    def notifyFailure(self, constraint):
+        """called by the solver when the propagation failed. constraint is
+        the one whose narrowing failed, or None"""
+        raise NotImplementedError
+
 ## class VariableInterface:
 ##     """The interface that all variables should implement"""
 ##     def getDomain(self):
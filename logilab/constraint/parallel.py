@@ -0,0 +1,146 @@
+# (c) 2002 LOGILAB S.A. (Paris, FRANCE).
+# http://www.logilab.fr/ -- mailto:contact@logilab.fr
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307
+# USA.
+"""Search of the solutions in several processes"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from time import strftime
+
+from logilab.constraint.propagation import Solver, ConsistencyFailure, \
+                                           _default_printer
+
+
+def _expand(distributor, repository):
+    """run the propagation on repository
+    Return a (solution, subspaces) pair: the solution if one was found, and
+    the list of the subspaces to explore otherwise"""
+    try:
+        found_solution = repository.consistency()
+    except ConsistencyFailure as exc:
+        distributor.notifyPropagation(repository.getChangedVariables())
+        distributor.notifyFailure(exc.constraint)
+        return None, []
+    distributor.notifyPropagation(repository.getChangedVariables())
+    if found_solution:
+        solution = {}
+        for variable, domain in repository.getDomains().items():
+            solution[variable] = domain.getValues()[0]
+        return solution, []
+    return None, list(repository.distribute(distributor))
+
+def _explore(distributor, stack, max_distributions):
+    """explore depth first the subspaces of stack, a list of (repository,
+    depth) pairs where the last one is explored first, stopping after
+    max_distributions distributions.
+    Return the solutions found, the subspaces left to explore, the number
+    of nodes explored and of distributions done and the maximum depth
+    reached"""
+    solutions = []
+    nb_nodes = nb_distributions = 0
+    max_depth = 0
+    while stack and nb_distributions < max_distributions:
+        nb_nodes += 1
+        repository, depth = stack.pop()
+        max_depth = max(max_depth, depth)
+        solution, subspaces = _expand(distributor, repository)
+        if solution is not None:
+            solutions.append(solution)
+        elif subspaces:
+            nb_distributions += 1
+            subspaces.reverse()
+            stack.extend([(repo, depth + 1) for repo in subspaces])
+    return solutions, stack, nb_nodes, nb_distributions, max_depth
+
+
+class ParallelSolver(Solver):
+    """Solver exploring the search tree in a pool of processes
+
+    The top of the search tree is expanded breadth first in the calling
+    process until there are a few subspaces per process. Each subspace is
+    then explored depth first by a worker which gives back, after at most
+    chunk_size distributions, the solutions found so far and the subspaces
+    it had not explored yet. These are shared again between the workers, so
+    that none stays idle while a large subtree remains.
+
+    The solutions are generated as soon as a worker gives them back: they
+    are the same as the ones of Solver, but not in the same order.
+    The repository, distributor and constraints must be picklable.
+    Budgets are checked each time a worker gives its results back."""
+
+    def __init__(self, distributor=None, printer=_default_printer,
+                 processes=None, chunk_size=256):
+        """processes is the number of worker processes, which defaults to
+        the number of CPUs"""
+        Solver.__init__(self, distributor, printer)
+        self.processes = processes or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+
+    def _explore(self, repository):
+        """return the parallel generator (searches with restarts run in
+        this process)"""
+        if self._path is not None:
+            return Solver._explore(self, repository)
+        return self._parallel_solve(repository)
+
+    def _parallel_solve(self, repository):
+        """main generator"""
+        distributor = self._distributor
+        frontier = [(repository, 0)]
+        while frontier and len(frontier) < 4 * self.processes:
+            self._nodes += 1
+            self._checkBudget()
+            repo, depth = frontier.pop(0)
+            self.max_depth = max(self.max_depth, depth)
+            solution, subspaces = _expand(distributor, repo)
+            if solution is not None:
+                yield solution
+            elif subspaces:
+                self.distrib_cnt += 1
+                frontier.extend([(subspace, depth + 1)
+                                 for subspace in subspaces])
+        executor = ProcessPoolExecutor(self.processes)
+        pending = set()
+        try:
+            pending = set([executor.submit(_explore, distributor, [subspace],
+                                           self.chunk_size)
+                           for subspace in frontier])
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    solutions, stack, nb_nodes, nb_distributions, depth = \
+                               future.result()
+                    self._nodes += nb_nodes
+                    self.distrib_cnt += nb_distributions
+                    self.max_depth = max(self.max_depth, depth)
+                    # share what is left before handing out the solutions
+                    for index in range(min(len(stack), self.processes)):
+                        pending.add(executor.submit(
+                            _explore, distributor,
+                            stack[index::self.processes], self.chunk_size))
+                    for solution in solutions:
+                        yield solution
+                self._checkBudget()
+        finally:
+            # shutdown(cancel_futures=True) requires python 3.9
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+        if self.verbose:
+            self.printer( strftime('%H:%M:%S'),'Finished search')
+            self.printer( strftime('%H:%M:%S'), 'Maximum recursion depth = ',
+                self.max_depth)
+            self.printer( 'Nb distributions = ', self.distrib_cnt)
@@ -18,41 +18,283 @@
 
 
 from operator import mul as MUL
-from time import strftime
+from itertools import count
+from heapq import heapify, heappop, heappush
+from time import strftime, perf_counter as _clock
+import tracemalloc
 from logilab.constraint.interfaces import DomainInterface, ConstraintInterface
 from logilab.constraint.psyco_wrapper import Psyobj
 from logilab.common.compat import enumerate
 from functools import reduce
 
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# values of Solver.status, telling why the last search stopped
+EXHAUSTED = 'exhausted'              # the whole search space was explored
+SOLVED = 'solved'                    # solve_one found a solution
+TIMED_OUT = 'timed out'
+NODE_LIMITED = 'node-limited'
+MEMORY_LIMITED = 'memory-limited'
+
 def _default_printer(*msgs):
     for msg in msgs[:-1]:
         print(msg,)
     print(msgs[-1])
 class ConsistencyFailure(Exception):
     """The repository is not in a consistent state"""
-    pass
+    # the constraint whose narrowing failed, set by Repository.consistency
+    constraint = None
+
+def _memory_usage():
+    """return the memory used in bytes: the memory traced by tracemalloc
+    if it is tracing, else the maximum resident size of the process, or
+    None if it is not available"""
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    if resource is not None:
+        # kilobytes on linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return None
+
+
+class _OutOfBudget(Exception):
+    """Raised to stop the search when a budget is exhausted"""
+    def __init__(self, status):
+        Exception.__init__(self, status)
+        self.status = status
+
+
+class _Restart(Exception):
+    """Raised to stop a run of the search, carrying the nogoods learnt"""
+    def __init__(self, nogoods):
+        Exception.__init__(self)
+        self.nogoods = nogoods
+
+
+def luby_restarts(scale=32):
+    """Generate the failure limits of the Luby restart policy:
+    scale times 1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8..."""
+    index = 1
+    while True:
+        i = index
+        while True:
+            size = 1
+            while size < i + 1:
+                size *= 2
+            # size - 1 is the length of the smallest complete subsequence
+            # holding i
+            if i == size - 1:
+                yield scale * (size // 2)
+                break
+            i -= size // 2 - 1
+        index += 1
+
+def geometric_restarts(scale=32, factor=1.5):
+    """Generate the failure limits of the geometric restart policy:
+    scale, scale * factor, scale * factor**2..."""
+    limit = float(scale)
+    while True:
+        yield int(limit)
+        limit *= factor
+
+def _image(symmetry, decisions):
+    """return the image of decisions, a list of (variable, values) pairs,
+    by symmetry, or None if it is decisions itself or if the image of a
+    decision spans several variables"""
+    image = []
+    for variable, values in decisions:
+        images = [symmetry(variable, value) for value in values]
+        variables = set([var for var, val in images])
+        if len(variables) != 1:
+            return None
+        image.append((images[0][0], [val for var, val in images]))
+    if [(var, set(vals)) for var, vals in image] == \
+           [(var, set(vals)) for var, vals in decisions]:
+        return None
+    return image
+
+
+class Trail(Psyobj):
+    """Undo log used to backtrack the changes made in place during search
+
+    Each entry is an (undo, arg) pair: undo(arg) is called on backtrack.
+    Entries are only recorded while at least one choice point is open, so
+    that changes made at the root of the search are kept."""
+
+    # stamps are unique among all trails so that a domain which was used
+    # with another trail never believes it is already saved
+    _stamps = count(1)
+
+    def __init__(self):
+        self._entries = []
+        self._marks = []
+        self.stamp = next(Trail._stamps)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def level(self):
+        """return the number of open choice points"""
+        return len(self._marks)
+
+    def mark(self):
+        """open a new choice point and return its level"""
+        self._marks.append((len(self._entries), self.stamp))
+        self.stamp = next(Trail._stamps)
+        return len(self._marks)
+
+    def push(self, undo, arg):
+        """record that undo(arg) must be called on backtrack"""
+        if self._marks:
+            self._entries.append((undo, arg))
+
+    def backtrack(self, level):
+        """undo every change recorded since the choice point of the given
+        level was opened. Does nothing if it is already closed"""
+        entries = self._entries
+        marks = self._marks
+        while len(marks) >= level:
+            length, self.stamp = marks.pop()
+            while len(entries) > length:
+                undo, arg = entries.pop()
+                undo(arg)
+
+def simplify_model(domains, constraints):
+    """simplify a model before building its repository:
+     * the constraints on a single variable are applied to its domain, and
+       dropped when entailed
+     * the constraints of which all the variables are instanciated are
+       checked and dropped
+     * the constraints given twice are dropped, and those on the same
+       variables are merged when they have a merge() method returning
+       their conjunction
+    Return the list of the constraints left and a report, a dictionnary
+    giving the number of constraints given ('constraints'), of dropped
+    unary, entailed and merged constraints, of constraints left ('left')
+    and of values removed from the domains ('values').
+    Raise ConsistencyFailure if the model has no solution."""
+    report = {'constraints': 0, 'unary': 0, 'entailed': 0, 'merged': 0}
+    size = 0
+    for domain in domains.values():
+        size += domain.size()
+    seen = set()
+    others = []
+    for constraint in constraints:
+        report['constraints'] += 1
+        if id(constraint) in seen:
+            report['merged'] += 1
+            continue
+        seen.add(id(constraint))
+        if len(set(constraint.affectedVariables())) == 1:
+            if _narrow(constraint, domains):
+                report['unary'] += 1
+                continue
+        others.append(constraint)
+    left = []
+    by_scope = {}
+    for constraint in others:
+        variables = constraint.affectedVariables()
+        for var in variables:
+            if domains[var].size() > 1:
+                break
+        else:
+            if _narrow(constraint, domains):
+                report['entailed'] += 1
+                continue
+        indexes = by_scope.setdefault(frozenset(variables), [])
+        for index in indexes:
+            merge = getattr(left[index], 'merge', None)
+            merged = merge is not None and merge(constraint) or None
+            if merged is not None:
+                left[index] = merged
+                report['merged'] += 1
+                break
+        else:
+            indexes.append(len(left))
+            left.append(constraint)
+    report['left'] = len(left)
+    for domain in domains.values():
+        size -= domain.size()
+    report['values'] = size
+    return left, report
+
+def _product(searches, solution):
+    """generate the solutions made of solution updated with one solution
+    of each generator of searches, generating each one only once.
+    The first solution of each generator is looked for first, so that
+    there is no solution at all as soon as one of them has none."""
+    caches = []
+    for search in searches:
+        for first in search:
+            caches.append([first])
+            break
+        else:
+            return
+    def combine(index, solution):
+        if index == len(searches):
+            yield solution
+            return
+        cache = caches[index]
+        for part in cache:
+            combined = solution.copy()
+            combined.update(part)
+            for result in combine(index + 1, combined):
+                yield result
+        for part in searches[index]:
+            cache.append(part)
+            combined = solution.copy()
+            combined.update(part)
+            for result in combine(index + 1, combined):
+                yield result
+    for result in combine(0, solution):
+        yield result
+
+def _narrow(constraint, domains):
+    """narrow the domains with constraint, telling which constraint failed
+    as the consistency of the repository does"""
+    try:
+        return constraint.narrow(domains)
+    except ConsistencyFailure as exc:
+        exc.constraint = constraint
+        raise
 
 class Repository(Psyobj):
     """Stores variables, domains and constraints
     Propagates domain changes to constraints
     Manages the constraint evaluation queue"""
     
-    def __init__(self, variables, domains, constraints = None, printer=_default_printer):
-        # encode unicode
+    def __init__(self, variables, domains, constraints = None, printer=_default_printer,
+                 simplify=False):
+        """if simplify is true, the model is simplified by simplify_model
+        before the constraints are added, and self.simplify_report holds
+        its report"""
         self._printer = printer
-        
-        for i, var in enumerate(variables):
-            if type(var) == type(''):
-                variables[i] = var.encode()
-                
         self._variables = variables   # list of variable names
         self._domains = domains    # maps variable name to domain object
         self._constraints = [] # list of constraint objects
+        self._trail = None     # undo log, when searching in place
+        self._changed = []     # variables narrowed by the last consistency
+        self._stats = None     # SearchStats measuring the narrowing
+        # when _fixpoint is true, the domains are consistent with the
+        # constraints except the _pending ones and the ones listening to
+        # domains flagged as changed
+        self._fixpoint = False
+        self._pending = []
+        # (trail level, _fixpoint, _pending, constraints added) of the
+        # open checkpoints
+        self._checkpoints = []
 #        self._queue = []       # queue of constraints waiting to be processed
         self._variableListeners = {}
         for var in self._variables:
             self._variableListeners[var] = []
             assert var in self._domains
+        self.simplify_report = None
+        if simplify:
+            constraints, self.simplify_report = simplify_model(
+                domains, constraints or ())
         for constr in constraints or ():
             self.addConstraint(constr)
 
@@ -97,7 +339,7 @@ class Repository(Psyobj):
         color_index = 2
         i = 0
         for constraint in self._constraints:
-            key = constraint.type
+            key = getattr(constraint, 'type', constraint.__class__.__name__)
             if key not in type_colors:
                 type_colors[key] = color_index
                 color_index += 1
@@ -124,18 +366,44 @@ class Repository(Psyobj):
         stream.close()
         
     def addConstraint(self, constraint):
+        """add a constraint. If a checkpoint is open (see push), it is
+        removed by the matching pop()"""
+        if self._checkpoints:
+            self._checkpoints[-1][3].append(constraint)
         if isinstance(constraint, BasicConstraint):
             # Basic constraints are processed just once
             # because they are straight away entailed
             var = constraint.getVariable()
             constraint.narrow({var: self._domains[var]})
         else:
-            self._constraints.append(constraint)
-            for var in constraint.affectedVariables():
-                self._variableListeners[var].append(constraint)
-        
+            self._addConstraint(constraint)
+            self._pending.append(constraint)
+            if self._trail is not None:
+                self._trail.push(self._undoAddConstraint, constraint)
+
+    def removeConstraint(self, constraint):
+        """remove a constraint. If a checkpoint is open (see push), it is
+        added back by the matching pop()"""
+        self._removeConstraint(constraint)
+        for checkpoint in self._checkpoints:
+            if constraint in checkpoint[3]:
+                checkpoint[3].remove(constraint)
+        if self._trail is not None:
+            self._trail.push(self._addConstraint, constraint)
+
+    def _addConstraint(self, constraint):
+        self._constraints.append(constraint)
+        for var in constraint.affectedVariables():
+            self._variableListeners[var].append(constraint)
+
+    def _undoAddConstraint(self, constraint):
+        if constraint in self._constraints:
+            self._removeConstraint(constraint)
+
     def _removeConstraint(self, constraint):
         self._constraints.remove(constraint)
+        if constraint in self._pending:
+            self._pending.remove(constraint)
         for var in constraint.affectedVariables():
             try:
                 self._variableListeners[var].remove(constraint)
@@ -145,13 +413,172 @@ class Repository(Psyobj):
                                  self._variableListeners[var],
                                  constraint)
 
+    def components(self):
+        """return the lists of the variables of the independent parts of
+        the repository: two variables are in the same part if they are
+        linked by constraints through variables which are not
+        instanciated. The instanciated variables are left out."""
+        domains = self._domains
+        listeners = self._variableListeners
+        seen = set()
+        components = []
+        for var in self._variables:
+            if var in seen or domains[var].size() == 1:
+                continue
+            seen.add(var)
+            component = [var]
+            stack = [var]
+            while stack:
+                for constraint in listeners[stack.pop()]:
+                    for other in constraint.affectedVariables():
+                        if other not in seen and domains[other].size() > 1:
+                            seen.add(other)
+                            component.append(other)
+                            stack.append(other)
+            components.append(component)
+        return components
+
+    def split(self):
+        """return a repository for each part of self given by components(),
+        with copies of the domains and the constraints on these variables
+        (and on the instanciated variables they refer to). Constraints on
+        instanciated variables only are left out."""
+        domains = self._domains
+        index = {}
+        components = self.components()
+        for number, component in enumerate(components):
+            for var in component:
+                index[var] = number
+        constraints = [[] for component in components]
+        for constraint in self._constraints:
+            for var in constraint.affectedVariables():
+                if var in index:
+                    constraints[index[var]].append(constraint)
+                    break
+        repositories = []
+        for component, part in zip(components, constraints):
+            variables = component[:]
+            for constraint in part:
+                for var in constraint.affectedVariables():
+                    if var not in index and var not in variables:
+                        variables.append(var)
+            part_domains = {}
+            for var in variables:
+                part_domains[var] = domains[var].copy()
+            repository = Repository(variables, part_domains, part,
+                                    self._printer)
+            repository._stats = self._stats
+            repositories.append(repository)
+        return repositories
+
     def getDomains(self):
         return self._domains
 
+    def getChangedVariables(self):
+        """return the variables whose domain was narrowed during the last
+        call to consistency(), once per narrowing"""
+        return self._changed
+
+    def setStats(self, stats):
+        """Measure the narrowing of the constraints with stats, a
+        SearchStats instance, in this repository and the ones created by
+        distribute(). Use None to stop measuring."""
+        self._stats = stats
+
+    def setTrail(self, trail):
+        """Record the changes of the domains and of the set of constraints
+        on trail, so that they can be undone by branch(). Use None to stop
+        recording: the changes made since the first choice point of the
+        previous trail are undone first."""
+        if self._trail is not None and self._trail.level():
+            self._trail.backtrack(1)
+            self._fixpoint = False
+        self._trail = trail
+        for domain in self._domains.values():
+            domain._trail = trail
+
+    def push(self):
+        """Open a checkpoint: the changes of the domains and of the set of
+        constraints made from now on are recorded on the trail, and undone
+        by the matching pop(). Together with the incremental propagation
+        of consistency(), this allows to edit a model cheaply: push(),
+        add constraints, consistency(), and pop() to get back to the
+        previous state."""
+        if self._trail is None:
+            self.setTrail(Trail())
+        self._checkpoints.append((self._trail.mark(), self._fixpoint,
+                                  self._pending[:], []))
+
+    def pop(self):
+        """Close the last checkpoint opened by push(), restoring the
+        domains and the constraints of that time"""
+        level, fixpoint, pending, added = self._checkpoints.pop()
+        self._trail.backtrack(level)
+        self._fixpoint = fixpoint
+        self._pending = pending
+        if not self._checkpoints and not self._trail.level():
+            self.setTrail(None)
+
+    def retract(self, constraint):
+        """Remove a constraint added while a checkpoint was open: the
+        checkpoints are closed down to the one where it was added, then
+        opened again with the other constraints added back, so that the
+        next consistency() only propagates them.
+        Changes made directly to the domains since then are lost."""
+        for index, checkpoint in enumerate(self._checkpoints):
+            if constraint in checkpoint[3]:
+                break
+        else:
+            raise ValueError('%s was not added after a checkpoint' % \
+                             constraint)
+        replay = [checkpoint[3] for checkpoint in self._checkpoints[index:]]
+        replay[0].remove(constraint)
+        while len(self._checkpoints) > index:
+            self.pop()
+        for constraints in replay:
+            self.push()
+            for added in constraints:
+                self.addConstraint(added)
+
     def distribute(self, distributor, verbose=0):
         """Create new repository using the distributor and self """
         for domains in distributor.distribute(self._domains, verbose):
-            yield Repository(self._variables, domains, self._constraints) 
+            repository = Repository(self._variables, domains,
+                                    self._constraints)
+            repository._stats = self._stats
+            yield repository
+
+    def branch(self, distributor, verbose=0, path=None):
+        """Same as distribute(), but the subspaces are explored in place.
+
+        The domains of self are narrowed to each subspace in turn and self
+        is yielded; the changes are undone through the trail (see
+        setTrail) before the next subspace is entered.
+
+        If path is a list, a [variable, subdomains, index] entry telling
+        the subspace being explored is appended to it until the
+        exploration is over."""
+        trail = self._trail
+        variable, subdomains = distributor.split(self._domains, verbose)
+        domain = self._domains[variable]
+        if path is not None:
+            decision = [variable, subdomains, 0]
+            path.append(decision)
+        try:
+            for index, subdomain in enumerate(subdomains):
+                if path is not None:
+                    decision[2] = index
+                level = trail.mark()
+                try:
+                    domain._saveState()
+                    domain.setState(subdomain.getState())
+                    self._fixpoint = False
+                    yield self
+                finally:
+                    trail.backtrack(level)
+        finally:
+            if path is not None:
+                path.pop()
 
 # alf 20041216 -- I tried the following to avoid the cost of the
 # creation of new Repository objects. It resulted in functional, but
@@ -181,47 +608,83 @@ class Repository(Psyobj):
         if verbose:
             printer( strftime('%H:%M:%S'), '** Consistency **')
 
-        _queue = [ (constr.estimateCost(self._domains),
-                           constr) for constr in self._constraints ]
-        _queue.sort()
-        _affected_constraints = {}
-        while True:
-            if not _queue:
-                # refill the queue if some constraints have been affected
-                _queue = [(constr.estimateCost(self._domains),
-                           constr) for constr in _affected_constraints]
-                if not _queue:
-                    break
-                _queue.sort()
-                _affected_constraints.clear()
+        # the queue is a heap of (cost, order, constraint) entries. queued
+        # maps the constraints of the heap to a flag telling that one of
+        # their variables changed since their cost was estimated: their
+        # cost is re-estimated when they get to the top of the heap.
+        domains = self._domains
+        stats = self._stats
+        self._changed = changed = []
+        _queue = []
+        queued = {}
+        order = count()
+        if self._fixpoint:
+            # only propagate the changes made since the last fixpoint
+            constraints = self._pending[:]
+            for var, dom in domains.items():
+                if dom.hasChanged():
+                    constraints += self._variableListeners[var]
+        else:
+            constraints = self._constraints
+        self._fixpoint = False
+        for constr in constraints:
+            if constr not in queued:
+                _queue.append((constr.estimateCost(domains), next(order),
+                               constr))
+                queued[constr] = False
+        heapify(_queue)
+        while _queue:
             if verbose > 2:
-                printer( strftime('%H:%M:%S'), 'Queue', _queue)
-            cost, constraint = _queue.pop(0)
+                printer( strftime('%H:%M:%S'), 'Queue', sorted(_queue))
+            cost, _, constraint = heappop(_queue)
+            if queued.pop(constraint):
+                new_cost = constraint.estimateCost(domains)
+                if _queue and new_cost > _queue[0][0]:
+                    heappush(_queue, (new_cost, next(order), constraint))
+                    queued[constraint] = False
+                    continue
+                cost = new_cost
             if verbose > 1:
                 printer( strftime('%H:%M:%S'),
                 'Trying to entail constraint', constraint, '[cost:%d]' % cost)
-            entailed = constraint.narrow(self._domains)
+            try:
+                if stats is None:
+                    entailed = constraint.narrow(domains)
+                else:
+                    entailed = stats.narrow(constraint, domains)
+            except ConsistencyFailure as exc:
+                exc.constraint = constraint
+                raise
             for var in constraint.affectedVariables():
                 # affected constraints are listeners of
                 # affected variables of this constraint
-                dom = self._domains[var]
+                dom = domains[var]
                 if not dom.hasChanged():
                     continue
+                changed.append(var)
                 if verbose > 1 :
                     printer( strftime('%H:%M:%S'),
                         ' -> New domain for variable', var, 'is', dom)
                 for constr in self._variableListeners[var]:
-                    if constr is not constraint:
-                        _affected_constraints[constr] = True
+                    if constr is constraint:
+                        continue
+                    if constr in queued:
+                        queued[constr] = True
+                    else:
+                        heappush(_queue, (constr.estimateCost(domains),
+                                          next(order), constr))
+                        queued[constr] = False
                 dom.resetFlags()
             if entailed:
                 if verbose:
                     printer( strftime('%H:%M:%S'),
                         "--> Entailed constraint", constraint)
                 self._removeConstraint(constraint)
-                if constraint in _affected_constraints:
-                    del _affected_constraints[constraint]
-                
+                if self._trail is not None:
+                    self._trail.push(self._addConstraint, constraint)
+
+        self._pending = []
+        self._fixpoint = True
         for domain in self._domains.values():
             if domain.size() != 1:
                 return 0
@@ -230,100 +693,439 @@ class Repository(Psyobj):
 class Solver(Psyobj):
     """Top-level object used to manage the search"""
 
-    def __init__(self, distributor=None, printer=_default_printer):
-        """if no distributer given, will use the default one"""
+    def __init__(self, distributor=None, printer=_default_printer,
+                 trail=False, stats=None, strategy=None, symmetries=None,
+                 decompose=False):
+        """if no distributer given, will use the default one
+
+        if trail is true, the search explores the subspaces in place and
+        backtracks through an undo log instead of copying the repository
+        at each distribution. Solutions are the same and come in the same
+        order, but the distributor must implement split()
+
+        stats is an optional stats.SearchStats instance, which collects
+        the statistics of the searches and is notified of their events
+
+        strategy is an optional search strategy from the strategies
+        module, used instead of the plain depth first search
+
+        symmetries is an optional list of symmetries of the problem, each
+        one a callable mapping a (variable, value) pair to its image (see
+        the symmetry module). Once a subspace is explored, the images of
+        its decisions are forbidden in the subspaces explored after it, so
+        that only one solution of each class of symmetric solutions is
+        generated. The subspaces are explored in place (see trail).
+
+        if decompose is true, the repository is split after the first
+        propagation into its independent parts (see
+        Repository.components), which are searched separately; their
+        solutions are combined lazily. Finding a solution then costs the
+        sum of the searches of the parts instead of their product. The
+        repository is not split when searching with symmetries or
+        restarts."""
         self.printer = printer
         if distributor is None:
             from logilab.constraint.distributors import DefaultDistributor
             distributor = DefaultDistributor()
         self.verbose = True
         self._distributor = distributor
+        self._use_trail = trail
+        self.stats = stats
+        self.strategy = strategy
+        self.symmetries = symmetries
+        self.decompose = decompose
         self.max_depth = 0
+        self.restart_cnt = 0
+        self.status = None
+        self.best = None
+        # budget of the current search
+        self._nodes = 0
+        self._max_nodes = self._deadline = self._max_memory = None
+        # failures allowed before restarting, and the decisions leading to
+        # the current node, when restarting
+        self._failure_limit = None
+        self._failures = 0
+        self._path = None
+
+    def solve_one(self, repository, verbose=0, restarts=None,
+                  timeout=None, max_nodes=None, max_memory=None):
+        """Generates only one solution
 
-    def solve_one(self, repository, verbose=0):
-        """Generates only one solution"""
+        The search can be bounded by a timeout in seconds, a maximum number
+        of nodes of the search tree, or a maximum memory usage in bytes
+        (measured by tracemalloc if it is tracing, or as the maximum
+        resident size of the process). When one of them is reached, the
+        search stops and self.status is set to TIMED_OUT, NODE_LIMITED or
+        MEMORY_LIMITED. It is set to SOLVED if a solution is found, and to
+        EXHAUSTED if there is none. The other solve methods accept the same
+        budgets, and set the status to EXHAUSTED when all the solutions
+        were generated.
+
+        restarts is an optional iterable of failure counts, such as
+        luby_restarts() or geometric_restarts(): the search is restarted
+        from scratch when it has met that many failures, with the next
+        count as limit. What was learnt is kept from one run to the next:
+        the weights of adaptive distributors, and nogoods forbidding the
+        subspaces already explored in vain. The runs explore the subspaces
+        in place (see trail), so the distributor must implement split(),
+        and the nogoods require domains of values, as fd domains."""
         self.verbose = verbose
         self.max_depth = 0
         self.distrib_cnt = 0
+        self.restart_cnt = 0
+        self._setBudget(timeout, max_nodes, max_memory)
+        search = None
+        if restarts is not None:
+            search = self._restart_solve(repository, restarts)
         try:
             # XXX  FIXME: this is a workaround a bug in psyco-1.4
 ##             return  self._solve(repository).next()
-            return  next(self._solve(repository, 0))
+            solution = next(self._search(repository, search))
         except StopIteration:
             return
+        self.status = SOLVED
+        return solution
         
-    def solve_best(self, repository, cost_func, verbose=0):
-        """Generates solution with an improving cost"""
+    def solve_best(self, repository, cost_func, verbose=0, lower_bound=None,
+                   timeout=None, max_nodes=None, max_memory=None):
+        """Generates solution with an improving cost
+
+        self.best holds the last (solution, cost) pair generated, which is
+        the best solution found so far if the search is stopped by one of
+        the budgets of solve_one().
+
+        The search is pruned by branch and bound if cost_func is a
+        constraint with a setBound() method (see fd.CostExpression), or if
+        lower_bound is given: it is called with the domains of a subspace
+        and returns a lower bound of the cost of the solutions of this
+        subspace. In both cases, only solutions with a strictly lower cost
+        are generated."""
         self.verbose = verbose
         self.max_depth = 0
         self.distrib_cnt = 0
+        self.best = None
+        self._setBudget(timeout, max_nodes, max_memory)
         best_cost = None
+        if lower_bound is not None:
+            bound = CostBound(repository._variables, lower_bound)
+        elif hasattr(cost_func, 'setBound'):
+            bound = cost_func
+        else:
+            bound = None
+        if bound is not None:
+            repository.addConstraint(bound)
+        try:
             # XXX  FIXME: this is a workaround a bug in psyco-1.4
 ##        for solution in self._solve(repository):
-        for solution in self._solve(repository, 0):
-            cost = cost_func(**solution)
-            if best_cost is None or cost <= best_cost:
-                best_cost = cost
-                yield solution, cost            
-        
-    def solve_all(self, repository, verbose=0):
-        """Generates all solutions"""
+            for solution in self._search(repository):
+                cost = cost_func(**solution)
+                if best_cost is None or cost < best_cost or \
+                       (cost == best_cost and bound is None):
+                    best_cost = cost
+                    if bound is not None:
+                        bound.setBound(cost)
+                    self.best = solution, cost
+                    yield solution, cost
+        finally:
+            if bound is not None:
+                if bound in repository._constraints:
+                    repository.removeConstraint(bound)
+                bound.setBound(None)
+
+    def solve_all(self, repository, verbose=0,
+                  timeout=None, max_nodes=None, max_memory=None):
+        """Generates all solutions, see solve_one() for the budgets"""
         self.verbose = verbose
         self.max_depth = 0
         self.distrib_cnt = 0
-        for solution in self._solve(repository):
+        self._setBudget(timeout, max_nodes, max_memory)
+        for solution in self._search(repository):
             yield solution
 
-    def solve(self, repository, verbose=0):
-        """return list of all solutions"""
+    def solve(self, repository, verbose=0,
+              timeout=None, max_nodes=None, max_memory=None):
+        """return list of all solutions, or of the solutions found
+        before a budget was exhausted (see solve_one())"""
         self.max_depth = 0
         self.distrib_cnt = 0
         solutions = []
-        for solution in self.solve_all(repository, verbose):
+        for solution in self.solve_all(repository, verbose, timeout,
+                                       max_nodes, max_memory):
             solutions.append(solution)
         return solutions
+
+    def _setBudget(self, timeout, max_nodes, max_memory):
+        """set the budgets of the search which starts. The status is set
+        when the search is over to EXHAUSTED, or to TIMED_OUT,
+        NODE_LIMITED or MEMORY_LIMITED if it was interrupted; solve_one
+        sets it to SOLVED if it found a solution."""
+        self.status = None
+        self._nodes = 0
+        self._max_nodes = max_nodes
+        self._max_memory = max_memory
+        if timeout is None:
+            self._deadline = None
+        else:
+            self._deadline = _clock() + timeout
+
+    def _checkBudget(self):
+        """raise _OutOfBudget if a budget is exhausted"""
+        if self._max_nodes is not None and self._nodes > self._max_nodes:
+            raise _OutOfBudget(NODE_LIMITED)
+        if self._deadline is not None and _clock() > self._deadline:
+            raise _OutOfBudget(TIMED_OUT)
+        # measuring the memory is not that cheap
+        if self._max_memory is not None and not self._nodes % 32:
+            memory = _memory_usage()
+            if memory is not None and memory > self._max_memory:
+                raise _OutOfBudget(MEMORY_LIMITED)
         
+    def _search(self, repository, search=None):
+        """return the main generator, run on a trail if required, or
+        search if given"""
+        if search is not None:
+            pass
+        elif self.symmetries:
+            search = self._symmetric_solve(repository)
+        elif self.decompose:
+            search = self._decomposed_solve(repository)
+        else:
+            search = self._partSearch(repository)
+        search = self._budgeted(search)
+        if self.stats is not None:
+            return self._observe(repository, search)
+        return search
+
+    def _budgeted(self, search):
+        """generate the solutions of search until a budget is exhausted,
+        and set the status"""
+        try:
+            for solution in search:
+                yield solution
+        except _OutOfBudget as exc:
+            self.status = exc.status
+            if self.verbose:
+                self.printer( strftime('%H:%M:%S'), 'Search stopped:',
+                              exc.status)
+        else:
+            self.status = EXHAUSTED
+
+    def _observe(self, repository, search):
+        """generate the solutions of search, measured by self.stats"""
+        stats = self.stats
+        stats.on_start(repository)
+        repository.setStats(stats)
+        try:
+            for solution in search:
+                stats.on_solution(solution)
+                yield solution
+        finally:
+            repository.setStats(None)
+            stats.on_finish()
+
+    def _trail_solve(self, repository):
+        """main generator, with the repository recording its changes
+        on a trail for the duration of the search"""
+        repository.push()
+        try:
+            for solution in self._explore(repository):
+                yield solution
+        finally:
+            repository.pop()
+
+    def _partSearch(self, repository):
+        """return the generator searching repository, on a trail if
+        required"""
+        if self._use_trail:
+            return self._trail_solve(repository)
+        return self._explore(repository)
+
+    def _decomposed_solve(self, repository):
+        """main generator, searching separately the independent parts of
+        repository"""
+        if self._use_trail:
+            repository.push()
+        try:
+            try:
+                repository.consistency(self.verbose,
+                                       custom_printer=self.printer)
+            except ConsistencyFailure as exc:
+                if self.verbose:
+                    self.printer( strftime('%H:%M:%S'), exc)
+                return
+            parts = repository.split()
+            if len(parts) == 1:
+                for solution in self._partSearch(repository):
+                    yield solution
+                return
+            if self.verbose:
+                self.printer( strftime('%H:%M:%S'),
+                              'Searching %d independent parts' % len(parts))
+            solution = {}
+            for variable, domain in repository.getDomains().items():
+                if domain.size() == 1:
+                    solution[variable] = domain.getValues()[0]
+            for solution in _product([self._partSearch(part)
+                                      for part in parts], solution):
+                yield solution
+        finally:
+            if self._use_trail:
+                repository.pop()
+
+    def _symmetric_solve(self, repository):
+        """main generator, recording the decisions leading to the current
+        node to break the symmetries"""
+        self._path = []
+        try:
+            for solution in self._trail_solve(repository):
+                yield solution
+        finally:
+            self._path = None
+
+    def _explore(self, repository):
+        """return the generator exploring the search tree of repository
+        with the search strategy"""
+        if self.strategy is None:
+            return self._solve(repository, 0)
+        return self.strategy.search(self, repository)
+
+    def _restart_solve(self, repository, restarts):
+        """main generator, restarting the search with the failure counts
+        of restarts as limits"""
+        nogoods = []
+        try:
+            for limit in restarts:
+                self._failure_limit = limit
+                self._failures = 0
+                self._path = []
+                try:
+                    for solution in self._trail_solve(repository):
+                        yield solution
+                    return
+                except _Restart as exc:
+                    self.restart_cnt += 1
+                    if self.verbose:
+                        self.printer( strftime('%H:%M:%S'),
+                            'Restart after %d failures, with %d nogoods' % \
+                                      (limit, len(exc.nogoods)))
+                    if self.stats is not None:
+                        self.stats.on_restart(repository, exc.nogoods)
+                    for nogood in exc.nogoods:
+                        repository.addConstraint(nogood)
+                    nogoods += exc.nogoods
+            # no more limits: search until the end
+            self._failure_limit = None
+            self._path = self.symmetries and [] or None
+            for solution in self._trail_solve(repository):
+                yield solution
+        finally:
+            self._failure_limit = self._path = None
+            for nogood in nogoods:
+                if nogood in repository._constraints:
+                    repository.removeConstraint(nogood)
+
+    def _pathNogoods(self):
+        """return the nogoods forbidding the subspaces which were fully
+        explored on the way to the current node"""
+        nogoods = []
+        decisions = []
+        for variable, subdomains, index in self._path:
+            for subdomain in subdomains[:index]:
+                nogoods.append(Nogood(decisions + [(variable,
+                                                    subdomain.getValues())]))
+            decisions.append((variable, subdomains[index].getValues()))
+        return nogoods
+
+    def _symmetricNogoods(self):
+        """return the nogoods forbidding the images by the symmetries of
+        the subspaces explored before the current one"""
+        variable, subdomains, index = self._path[-1]
+        decisions = [(var, subs[i].getValues())
+                     for var, subs, i in self._path[:-1]]
+        nogoods = []
+        for subdomain in subdomains[:index]:
+            explored = decisions + [(variable, subdomain.getValues())]
+            for symmetry in self.symmetries:
+                image = _image(symmetry, explored)
+                if image is not None:
+                    nogoods.append(Nogood(image))
+        return nogoods
+
     def _solve(self, repository, recursion_level=0):
         """main generator"""
         _solve = self._solve
+        solution, subspaces = self._node(repository, recursion_level)
+        if solution is not None:
+            yield solution
+        elif subspaces is not None:
+            for repo in subspaces:
+                for solution in _solve(repo, recursion_level+1):
+                    if solution is not None:
+                        yield solution
+                            
+        if recursion_level == 0 and self.verbose:
+            self._finished()
+
+    def _finished(self):
+        """print the end of search message"""
+        self.printer( strftime('%H:%M:%S'),'Finished search')
+        self.printer( strftime('%H:%M:%S'), 'Maximum recursion depth = ',
+            self.max_depth)
+        self.printer( 'Nb distributions = ', self.distrib_cnt)
+
+    def _node(self, repository, recursion_level):
+        """propagate at a node of the search tree
+        Return a (solution, subspaces) pair: the solution if one was found,
+        else an iterator on the subspaces of the repository or None if
+        it is inconsistent"""
         verbose = self.verbose
+        self._nodes += 1
+        if self._max_nodes is not None or self._deadline is not None or \
+               self._max_memory is not None:
+            self._checkBudget()
         if recursion_level > self.max_depth:
             self.max_depth = recursion_level
         if verbose >= 2:
             self.printer( strftime('%H:%M:%S'),)
             self.printer( '*** [%d] Solve called with repository' % recursion_level,)
             repository.display_vars()
+        stats = self.stats
+        if stats is not None:
+            stats.on_node(repository, recursion_level)
+        if self.symmetries and self._path and self._path[-1][2] > 0:
+            for nogood in self._symmetricNogoods():
+                repository.addConstraint(nogood)
         try:
             foundSolution = repository.consistency(verbose, custom_printer=self.printer)
         except ConsistencyFailure as exc:
+            self._distributor.notifyPropagation(
+                repository.getChangedVariables())
+            self._distributor.notifyFailure(exc.constraint)
+            if stats is not None:
+                stats.on_failure(repository, exc.constraint)
             if verbose:
                 self.printer( strftime('%H:%M:%S'), exc)
-        else:
-            if foundSolution:
-                solution = {}
-                for variable, domain in list(repository.getDomains().items()):
-                    solution[variable] = domain.getValues()[0]
-                if verbose:
-                    self.printer( strftime('%H:%M:%S'), '### Found Solution', solution)
-                    self.printer( '-'*80)
-                yield solution
-            else:
-                self.distrib_cnt += 1
-                for repo in repository.distribute(self._distributor,
-                                                  verbose>=2):
-                    for solution in _solve(repo, recursion_level+1):
-                        if solution is not None:
-                            yield solution
-                            
-        if recursion_level == 0 and self.verbose:
-            self.printer( strftime('%H:%M:%S'),'Finished search')
-            self.printer( strftime('%H:%M:%S'), 'Maximum recursion depth = ',
-                self.max_depth)
-            self.printer( 'Nb distributions = ', self.distrib_cnt)
-
-        
-
-
+            if self._failure_limit is not None:
+                self._failures += 1
+                if self._failures >= self._failure_limit:
+                    raise _Restart(self._pathNogoods())
+            return None, None
+        self._distributor.notifyPropagation(repository.getChangedVariables())
+        if foundSolution:
+            solution = {}
+            for variable, domain in list(repository.getDomains().items()):
+                solution[variable] = domain.getValues()[0]
+            if verbose:
+                self.printer( strftime('%H:%M:%S'), '### Found Solution', solution)
+                self.printer( '-'*80)
+            return solution, None
+        self.distrib_cnt += 1
+        if self._path is not None:
+            return None, repository.branch(self._distributor, verbose>=2,
+                                           self._path)
+        elif self._use_trail:
+            return None, repository.branch(self._distributor, verbose>=2)
+        return None, repository.distribute(self._distributor, verbose>=2)
 
 
 class BasicConstraint(Psyobj):
@@ -374,6 +1176,10 @@ class AbstractDomain(Psyobj):
     Can be used as a starting point for concrete domains"""
 
     __implements__ = DomainInterface
+
+    _trail = None  # set by Repository.setTrail
+    _stamp = 0     # stamp of the trail when the state was last saved
+
     def __init__(self):
         self.__changed = 0
 
@@ -383,6 +1189,21 @@ class AbstractDomain(Psyobj):
     def hasChanged(self):
         return self.__changed
 
+    def _saveState(self):
+        """The implementation of removeValue should call this method
+        before modifying the domain, so that the change can be undone
+        when backtracking"""
+        trail = self._trail
+        if trail is not None and self._stamp != trail.stamp:
+            trail.push(self._restoreState, (self._stamp, self.getState()))
+            self._stamp = trail.stamp
+
+    def _restoreState(self, saved):
+        """undo the changes recorded by _saveState"""
+        self._stamp, state = saved
+        self.setState(state)
+        self.resetFlags()
+
     def _valueRemoved(self):
         """The implementation of removeValue should call this method"""
         self.__changed = 1
@@ -407,4 +1228,79 @@ class AbstractConstraint(Psyobj):
         """Return an estimate of the cost of the narrowing of the constraint"""
         return reduce(MUL, [domains[var].size() for var in self._variables])
 
-    
+
+class CostBound(AbstractConstraint):
+    """Constraint used by Solver.solve_best to cut the subspaces which can
+    not hold a solution better than the best one found so far
+
+    lower_bound is called with the domains and returns a lower bound of the
+    cost of the solutions allowed by the domains."""
+
+    def __init__(self, variables, lower_bound):
+        AbstractConstraint.__init__(self, variables)
+        self._lower_bound = lower_bound
+        self.bound = None
+
+    def __repr__(self):
+        return '<CostBound %s>' % self.bound
+
+    def setBound(self, bound):
+        """only accept solutions with a cost lower than bound from now on"""
+        self.bound = bound
+
+    def estimateCost(self, domains):
+        # computing a bound is expected to be cheap, and fails early
+        return len(self._variables)
+
+    def narrow(self, domains):
+        """never entailed, since the bound keeps decreasing"""
+        if self.bound is not None and \
+               self._lower_bound(domains) >= self.bound:
+            raise ConsistencyFailure('cost bound %s can not be improved' % \
+                                     self.bound)
+        return 0
+
+
+class Nogood(AbstractConstraint):
+    """Forbids a combination of decisions, given as a list of (variable,
+    values) pairs: the variables can not all take one of their values at
+    the same time. Solver.solve_one learns nogoods when restarting."""
+
+    def __init__(self, decisions):
+        literals = {}
+        for variable, values in decisions:
+            if variable in literals:
+                literals[variable] &= set(values)
+            else:
+                literals[variable] = set(values)
+        AbstractConstraint.__init__(self, list(literals))
+        self._literals = literals
+
+    def __repr__(self):
+        return '<Nogood %s>' % sorted(self._literals.items())
+
+    def estimateCost(self, domains):
+        return len(self._variables)
+
+    def narrow(self, domains):
+        """remove the values of the last undecided variable when all the
+        others are bound to take one of their values"""
+        undecided = None
+        for variable, values in self._literals.items():
+            domain = domains[variable]
+            inside = 0
+            for value in domain.getValues():
+                if value in values:
+                    inside += 1
+            if inside == 0:
+                return 1
+            if inside < domain.size():
+                if undecided is not None:
+                    return 0
+                undecided = variable
+        if undecided is None:
+            raise ConsistencyFailure('nogood %s' % self)
+        domain = domains[undecided]
+        domain.removeValues([value for value in domain.getValues()
+                             if value in self._literals[undecided]])
+        return 1
@@ -0,0 +1,208 @@
+# (c) 2002 LOGILAB S.A. (Paris, FRANCE).
+# http://www.logilab.fr/ -- mailto:contact@logilab.fr
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307
+# USA.
+"""Statistics of the search"""
+
+import json
+import marshal
+import inspect
+import tracemalloc
+from time import perf_counter as _clock
+
+from logilab.constraint.psyco_wrapper import Psyobj
+from logilab.constraint.propagation import ConsistencyFailure
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# indexes in the counters of a constraint
+CALLS, TIME, REMOVALS, FAILURES = range(4)
+
+
+def _class_name(constraint):
+    """return a name such as 'fd.AllDistinct' for the class of constraint"""
+    klass = constraint.__class__
+    return '%s.%s' % (klass.__module__.split('.')[-1], klass.__name__)
+
+
+class SearchStats(Psyobj):
+    """Statistics of a search, collected when given to a Solver with
+    Solver(stats=...)
+
+    The solver calls the on_* methods, which may be extended to observe the
+    search. Counters are reset when a search starts:
+     * nodes: number of nodes of the search tree (calls to consistency)
+     * failures: number of nodes where propagation failed
+     * solutions: number of solutions found
+     * restarts: number of restarts of the search
+     * removals: number of values removed from the domains by propagation
+     * peak_trail: maximum length of the trail, when searching in place
+     * peak_memory: peak memory of the search in bytes if tracemalloc is
+       tracing, or maximum resident size of the process otherwise
+     * elapsed: time spent in the search in seconds
+    and, for each constraint, the number of calls to narrow(), the time
+    spent in it, the number of values it removed and the number of times
+    it failed."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """reset the counters"""
+        self.nodes = 0
+        self.failures = 0
+        self.solutions = 0
+        self.restarts = 0
+        self.removals = 0
+        self.peak_trail = 0
+        self.peak_memory = None
+        self.elapsed = 0.
+        self._constraints = {}
+        self._start = None
+
+    def on_start(self, repository):
+        """called when the search of repository starts"""
+        self.reset()
+        self._start = _clock()
+
+    def on_node(self, repository, depth):
+        """called before propagating at each node of the search tree"""
+        self.nodes += 1
+        trail = repository._trail
+        if trail is not None and len(trail) > self.peak_trail:
+            self.peak_trail = len(trail)
+
+    def on_failure(self, repository, constraint):
+        """called when propagation fails, with the failed constraint if
+        there is one"""
+        self.failures += 1
+
+    def on_restart(self, repository, nogoods):
+        """called when the search restarts, with the nogoods learnt"""
+        self.restarts += 1
+
+    def on_solution(self, solution):
+        """called with each solution"""
+        self.solutions += 1
+
+    def on_finish(self):
+        """called when the search is over or interrupted"""
+        self.elapsed = _clock() - self._start
+        if tracemalloc.is_tracing():
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+        elif resource is not None:
+            # kilobytes on linux
+            self.peak_memory = resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def narrow(self, constraint, domains):
+        """call constraint.narrow(domains) and record its cost"""
+        variables = constraint.affectedVariables()
+        before = 0
+        for var in variables:
+            before += domains[var].size()
+        try:
+            counters = self._constraints[constraint]
+        except KeyError:
+            counters = self._constraints[constraint] = [0, 0., 0, 0]
+        counters[CALLS] += 1
+        start = _clock()
+        try:
+            return constraint.narrow(domains)
+        except ConsistencyFailure:
+            counters[FAILURES] += 1
+            raise
+        finally:
+            counters[TIME] += _clock() - start
+            for var in variables:
+                before -= domains[var].size()
+            counters[REMOVALS] += before
+            self.removals += before
+
+    def by_constraint(self):
+        """return a list of (constraint, counters) pairs, the most time
+        consuming constraints first. counters is a dictionnary with keys
+        calls, time, removals and failures"""
+        result = []
+        for constraint, counters in self._constraints.items():
+            result.append((constraint, dict(zip(
+                ('calls', 'time', 'removals', 'failures'), counters))))
+        result.sort(key=lambda item: -item[1]['time'])
+        return result
+
+    def by_class(self):
+        """return a dictionnary of the counters of the constraints summed
+        by class of constraint"""
+        result = {}
+        for constraint, counters in self._constraints.items():
+            name = _class_name(constraint)
+            try:
+                total = result[name]
+            except KeyError:
+                total = result[name] = {'calls': 0, 'time': 0.,
+                                        'removals': 0, 'failures': 0}
+            total['calls'] += counters[CALLS]
+            total['time'] += counters[TIME]
+            total['removals'] += counters[REMOVALS]
+            total['failures'] += counters[FAILURES]
+        return result
+
+    def as_dict(self, top=10):
+        """return the statistics as a dictionnary, with the counters of
+        the top most time consuming constraints"""
+        constraints = []
+        for constraint, counters in self.by_constraint()[:top]:
+            counters['constraint'] = repr(constraint)
+            constraints.append(counters)
+        return {'nodes': self.nodes,
+                'failures': self.failures,
+                'solutions': self.solutions,
+                'restarts': self.restarts,
+                'removals': self.removals,
+                'peak_trail': self.peak_trail,
+                'peak_memory': self.peak_memory,
+                'elapsed': self.elapsed,
+                'classes': self.by_class(),
+                'constraints': constraints}
+
+    def to_json(self, top=10, **kwargs):
+        """return the statistics as a JSON string. kwargs are given to
+        json.dumps"""
+        return json.dumps(self.as_dict(top), **kwargs)
+
+    def dump_stats(self, filename):
+        """write the time spent in each constraint to filename in the
+        format of cProfile, so that it can be read with pstats.Stats"""
+        profile = {}
+        for constraint, counters in self._constraints.items():
+            narrow = constraint.__class__.narrow
+            try:
+                path = inspect.getsourcefile(narrow) or '~'
+                line = narrow.__code__.co_firstlineno
+            except (TypeError, AttributeError):
+                path, line = '~', 0
+            calls, elapsed = counters[CALLS], counters[TIME]
+            name = repr(constraint)
+            if (path, line, name) in profile:
+                name = '%s at 0x%x' % (name, id(constraint))
+            profile[(path, line, name)] = (calls, calls, elapsed, elapsed, {})
+        stream = open(filename, 'wb')
+        try:
+            marshal.dump(profile, stream)
+        finally:
+            stream.close()
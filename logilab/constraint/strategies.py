@@ -0,0 +1,238 @@
+# (c) 2002 LOGILAB S.A. (Paris, FRANCE).
+# http://www.logilab.fr/ -- mailto:contact@logilab.fr
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307
+# USA.
+"""Search strategies, exploring the search tree in another order than
+the depth first search of the Solver
+
+A strategy is given to the solver with Solver(strategy=...). Each
+strategy generates the same solutions as the depth first search if it is
+not interrupted, but in another order: the ones reached by following the
+choices of the distributor most closely come first."""
+
+from time import perf_counter as _clock
+
+from logilab.constraint.psyco_wrapper import Psyobj
+from logilab.constraint.propagation import _OutOfBudget, NODE_LIMITED, \
+                                           TIMED_OUT
+
+
+class SearchStrategy(Psyobj):
+    """Base class of the search strategies
+
+    The search stops after having explored max_nodes nodes, or after
+    timeout seconds, if these are given. The interrupted attribute tells
+    whether the last search was stopped this way, in which case the status
+    of the solver is NODE_LIMITED or TIMED_OUT."""
+
+    def __init__(self, max_nodes=None, timeout=None):
+        self.max_nodes = max_nodes
+        self.timeout = timeout
+        self.interrupted = False
+        self._nodes = 0
+        self._deadline = None
+
+    def search(self, solver, repository):
+        """generate the solutions of repository"""
+        self.interrupted = False
+        self._nodes = 0
+        if self.timeout is not None:
+            self._deadline = _clock() + self.timeout
+        # when the budget is exhausted, the solver sets its status
+        for solution in self._search(solver, repository):
+            yield solution
+        if solver.verbose:
+            solver._finished()
+
+    def _search(self, solver, repository):
+        """method to implement in concrete class"""
+        raise NotImplementedError
+
+    def _iteration(self, repository, probe):
+        """generate the solutions of probe, the generator of an iteration
+        exploring repository, in a checkpoint of repository: each
+        iteration then propagates from the same state and explores the
+        same tree, as the solutions found by the previous iterations are
+        told by their place in this tree"""
+        repository.push()
+        try:
+            for solution in probe:
+                yield solution
+        finally:
+            probe.close()
+            repository.pop()
+
+    def _node(self, solver, repository, depth):
+        """propagate at a node with the solver, see Solver._node"""
+        self._nodes += 1
+        if self.max_nodes is not None and self._nodes > self.max_nodes:
+            self.interrupted = True
+            raise _OutOfBudget(NODE_LIMITED)
+        if self._deadline is not None and _clock() > self._deadline:
+            self.interrupted = True
+            raise _OutOfBudget(TIMED_OUT)
+        return solver._node(repository, depth)
+
+
+class LimitedDiscrepancySearch(SearchStrategy):
+    """Explores the search tree by increasing number of discrepancies, a
+    discrepancy being a subspace taken instead of the first one proposed
+    by the distributor (taking the i-th subspace counts i discrepancies).
+    Iteration k generates the solutions reached with k discrepancies.
+
+    max_discrepancies bounds the number of iterations."""
+
+    def __init__(self, max_discrepancies=None, max_nodes=None, timeout=None):
+        SearchStrategy.__init__(self, max_nodes, timeout)
+        self.max_discrepancies = max_discrepancies
+        self._cut = False
+
+    def _search(self, solver, repository):
+        discrepancies = 0
+        while self.max_discrepancies is None or \
+                  discrepancies <= self.max_discrepancies:
+            self._cut = False
+            for solution in self._iteration(repository, self._probe(
+                solver, repository, 0, discrepancies)):
+                yield solution
+            if not self._cut:
+                # the whole tree was explored
+                return
+            discrepancies += 1
+
+    def _probe(self, solver, repository, depth, discrepancies):
+        """generate the solutions reached with exactly discrepancies
+        discrepancies"""
+        solution, subspaces = self._node(solver, repository, depth)
+        if solution is not None:
+            # found by the previous iterations otherwise
+            if discrepancies == 0:
+                yield solution
+            return
+        if subspaces is None:
+            return
+        try:
+            for index, repo in enumerate(subspaces):
+                if index > discrepancies:
+                    self._cut = True
+                    break
+                for solution in self._probe(solver, repo, depth + 1,
+                                            discrepancies - index):
+                    yield solution
+        finally:
+            subspaces.close()
+
+
+class DepthBoundedDiscrepancySearch(SearchStrategy):
+    """Explores the search tree with discrepancies allowed only near the
+    root, the depth where they are allowed increasing at each iteration.
+    Iteration i takes a discrepancy at depth i-1, and follows the
+    distributor below, so that each leaf is reached at only one
+    iteration.
+
+    max_depth bounds the number of iterations."""
+
+    def __init__(self, max_depth=None, max_nodes=None, timeout=None):
+        SearchStrategy.__init__(self, max_nodes, timeout)
+        self.max_depth = max_depth
+        self._deeper = False
+
+    def _search(self, solver, repository):
+        iteration = 0
+        while self.max_depth is None or iteration <= self.max_depth:
+            self._deeper = False
+            for solution in self._iteration(repository, self._probe(
+                solver, repository, 0, iteration)):
+                yield solution
+            if not self._deeper:
+                return
+            iteration += 1
+
+    def _probe(self, solver, repository, depth, iteration):
+        """generate the solutions reached at this iteration"""
+        solution, subspaces = self._node(solver, repository, depth)
+        if solution is not None:
+            # leaves above the depth of the discrepancy were reached before
+            if iteration == 0 or depth >= iteration:
+                yield solution
+            return
+        if subspaces is None:
+            return
+        if depth >= iteration - 1:
+            # this node is visited by the next iteration, which may take
+            # a discrepancy below it
+            self._deeper = True
+        try:
+            for index, repo in enumerate(subspaces):
+                if depth >= iteration:
+                    # follow the distributor
+                    if index > 0:
+                        break
+                elif depth == iteration - 1 and index == 0:
+                    # take a discrepancy
+                    continue
+                for solution in self._probe(solver, repo, depth + 1,
+                                            iteration):
+                    yield solution
+        finally:
+            subspaces.close()
+
+
+class IterativeDeepeningSearch(SearchStrategy):
+    """Explores the search tree depth first down to a depth limit, which
+    is increased by step at each iteration. Iteration k generates the
+    solutions found between the previous limit and the new one.
+
+    max_depth bounds the depth limit."""
+
+    def __init__(self, step=1, max_depth=None, max_nodes=None, timeout=None):
+        SearchStrategy.__init__(self, max_nodes, timeout)
+        self.step = step
+        self.max_depth = max_depth
+        self._cut = False
+
+    def _search(self, solver, repository):
+        previous, limit = -1, self.step
+        while True:
+            if self.max_depth is not None:
+                limit = min(limit, self.max_depth)
+            self._cut = False
+            for solution in self._iteration(repository, self._probe(
+                solver, repository, 0, previous, limit)):
+                yield solution
+            if not self._cut or limit == self.max_depth:
+                return
+            previous, limit = limit, limit + self.step
+
+    def _probe(self, solver, repository, depth, previous, limit):
+        """generate the solutions found deeper than previous, down to
+        limit"""
+        solution, subspaces = self._node(solver, repository, depth)
+        if solution is not None:
+            if depth > previous:
+                yield solution
+            return
+        if subspaces is None:
+            return
+        try:
+            if depth >= limit:
+                self._cut = True
+                return
+            for repo in subspaces:
+                for solution in self._probe(solver, repo, depth + 1,
+                                            previous, limit):
+                    yield solution
+        finally:
+            subspaces.close()
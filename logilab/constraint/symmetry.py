@@ -0,0 +1,86 @@
+# (c) 2002 LOGILAB S.A. (Paris, FRANCE).
+# http://www.logilab.fr/ -- mailto:contact@logilab.fr
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307
+# USA.
+"""Symmetries of the problems
+
+A symmetry maps the solutions of a problem to other solutions. They can
+be broken in two ways:
+ * by adding constraints keeping only one solution of each class of
+   symmetric solutions: see break_variable_symmetry and
+   break_value_symmetry
+ * during the search, by giving the symmetries to the solver with
+   Solver(symmetries=...): a symmetry is then a callable mapping a
+   (variable, value) pair to its image, such as VariableSymmetry and
+   ValueSymmetry instances (see interchangeable_variables and
+   interchangeable_values)"""
+
+from logilab.constraint.psyco_wrapper import Psyobj
+from logilab.constraint import fd
+
+
+class VariableSymmetry(Psyobj):
+    """Symmetry exchanging the variables as given by mapping, a
+    dictionnary mapping variables to their image"""
+
+    def __init__(self, mapping):
+        self.mapping = mapping
+
+    def __repr__(self):
+        return '<VariableSymmetry %s>' % self.mapping
+
+    def __call__(self, variable, value):
+        return self.mapping.get(variable, variable), value
+
+
+class ValueSymmetry(Psyobj):
+    """Symmetry exchanging the values as given by mapping, a dictionnary
+    mapping values to their image"""
+
+    def __init__(self, mapping):
+        self.mapping = mapping
+
+    def __repr__(self):
+        return '<ValueSymmetry %s>' % self.mapping
+
+    def __call__(self, variable, value):
+        return variable, self.mapping.get(value, value)
+
+
+def interchangeable_variables(variables):
+    """return the symmetries exchanging two of variables"""
+    return [VariableSymmetry({var1: var2, var2: var1})
+            for index, var1 in enumerate(variables)
+            for var2 in variables[index + 1:]]
+
+def interchangeable_values(values):
+    """return the symmetries exchanging two of values"""
+    return [ValueSymmetry({val1: val2, val2: val1})
+            for index, val1 in enumerate(values)
+            for val2 in values[index + 1:]]
+
+def break_variable_symmetry(vectors, strict=False):
+    """return the constraints breaking the symmetry of interchangeable
+    variables, or of interchangeable vectors of variables (as the rows of
+    a matrix): their values are ordered (strictly if strict)"""
+    vectors = [isinstance(vector, (list, tuple)) and vector or [vector]
+               for vector in vectors]
+    return [fd.LexChain(vectors, strict)]
+
+def break_value_symmetry(variables, values):
+    """return the constraints breaking the symmetry of values which are
+    interchangeable for variables: the first variable taking one of
+    them takes the first one, and so on"""
+    return [fd.ValuePrecedence(variables, values)]
@@ -0,0 +1,39 @@
+"""Unit testing for the symmetry breaking"""
+
+# (c) 2000-2001 LOGILAB S.A. (Paris, FRANCE).
+# http://www.logilab.fr/ -- mailto:contact@logilab.fr
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307
+# USA.
+"""Problems and helpers shared by the tests"""
+
+from logilab.constraint.propagation import Repository
+from logilab.constraint import fd
+
+def queens(size, domain_class=fd.FiniteDomain):
+    """the repository of the problem of the size queens"""
+    variables = ['Q%d' % i for i in range(size)]
+    domains = {}
+    for var in variables:
+        domains[var] = domain_class(list(range(size)))
+    repo = Repository(variables, domains, [fd.AllDistinct(variables)])
+    for i, q1 in enumerate(variables):
+        for j, q2 in enumerate(variables[i+1:]):
+            repo.addConstraint(fd.make_expression((q1, q2),
+                'abs(%s-%s) != %d' % (q1, q2, j + 1)))
+    return repo
+
+def sort_solutions(solutions):
+    """return the solutions in an order independant of the search"""
+    return sorted([sorted(solution.items()) for solution in solutions])
@@ -18,6 +18,7 @@
 # USA.
 
 import unittest
+import operator
 from logilab.constraint import fd
 from logilab.constraint import propagation
 from logilab.constraint import distributors
@@ -156,6 +157,32 @@ class AllDistinctTC(AbstractConstraintTC):
 
 
     
+class AllDistinctDomainTC(AllDistinctTC):
+    def setUp(self):
+        AllDistinctTC.setUp(self)
+        self.constraint = fd.AllDistinct(self.relevant_variables, 'domain')
+
+    def testHallSet(self):
+        # x and y use up 1 and 2, which must be removed from z
+        domains = {'x':fd.FiniteDomain((1,2)),
+                   'y':fd.FiniteDomain((2,1)),
+                   'z':fd.FiniteDomain((1,2,3,4)),}
+        entailed = self.constraint.narrow(domains)
+        self.assertFalse(entailed)
+        self.assertEqual(domains['z'].getValues(), [3, 4])
+        self.assertEqual(domains['x'].size(), 2)
+
+    def testUnsupportedValue(self):
+        # y must take 2, so x can not
+        domains = {'x':fd.FiniteDomain((1,2,3)),
+                   'y':fd.FiniteDomain((2,3)),
+                   'z':fd.BitsetDomain((3,)),}
+        entailed = self.constraint.narrow(domains)
+        self.assertTrue(entailed)
+        self.assertEqual(domains['x'].getValues(), [1])
+        self.assertEqual(domains['y'].getValues(), [2])
+
+
 class UnaryMathConstrTC(AbstractConstraintTC):
     def setUp(self):
         self.relevant_variables = ['x']
@@ -187,6 +214,146 @@ class BinaryMathConstrTC(AbstractConstraintTC):
         v.sort()
         assert v == [0,1],str(v)
 
+class BinaryResiduesTC(unittest.TestCase):
+    def setUp(self):
+        self.constraint = fd.BinaryExpression(['x', 'y'], 'x < y')
+
+    def testResiduesRemembered(self):
+        domains = {'x':fd.FiniteDomain(list(range(4))),
+                   'y':fd.FiniteDomain(list(range(4)))}
+        self.assertFalse(self.constraint.narrow(domains))
+        self.assertEqual(domains['x'].getValues(), [0, 1, 2])
+        self.assertEqual(domains['y'].getValues(), [1, 2, 3])
+        residues_x, residues_y = self.constraint._residues
+        self.assertEqual(residues_x, {0: 1, 1: 2, 2: 3})
+        self.assertEqual(residues_y[1], 0)
+
+    def testResidueRemoved(self):
+        domains = {'x':fd.FiniteDomain(list(range(4))),
+                   'y':fd.FiniteDomain(list(range(4)))}
+        self.constraint.narrow(domains)
+        domains['y'].removeValue(3)
+        self.constraint.narrow(domains)
+        self.assertEqual(domains['x'].getValues(), [0, 1])
+        self.assertEqual(self.constraint._residues[0][1], 2)
+
+    def testResiduesAfterBacktrack(self):
+        # residues found in a narrower state are still checked when the
+        # constraint is narrowed on wider domains
+        domains = {'x':fd.FiniteDomain([0, 1]), 'y':fd.FiniteDomain([2])}
+        self.assertTrue(self.constraint.narrow(domains))
+        domains = {'x':fd.FiniteDomain([0, 1, 2, 3]),
+                   'y':fd.FiniteDomain([1, 3])}
+        self.constraint.narrow(domains)
+        self.assertEqual(domains['x'].getValues(), [0, 1, 2])
+        self.assertEqual(domains['y'].getValues(), [1, 3])
+
+
+class NaryResiduesTC(unittest.TestCase):
+    def setUp(self):
+        self.constraint = fd.Expression(['x', 'y', 'z'], 'x + y == z')
+
+    def testSupportsRemembered(self):
+        domains = {'x':fd.FiniteDomain([0, 1]), 'y':fd.FiniteDomain([0, 1]),
+                   'z':fd.FiniteDomain([1, 2, 3])}
+        self.assertFalse(self.constraint.narrow(domains))
+        self.assertEqual(domains['z'].getValues(), [1, 2])
+        residues_x, residues_y, residues_z = self.constraint._residues
+        # the last support found is recorded for each of its values
+        self.assertEqual(residues_x[0], (0, 1, 1))
+        self.assertEqual(residues_z[1], (1, 0, 1))
+        self.assertEqual(residues_x[1], (1, 1, 2))
+        self.assertEqual(residues_y[1], (1, 1, 2))
+
+    def testResidueRemoved(self):
+        domains = {'x':fd.FiniteDomain([0, 1]), 'y':fd.FiniteDomain([0, 1]),
+                   'z':fd.FiniteDomain([1, 2, 3])}
+        self.constraint.narrow(domains)
+        domains['z'].removeValue(2)
+        self.assertFalse(self.constraint.narrow(domains))
+        self.assertEqual(domains['x'].getValues(), [0, 1])
+        self.assertEqual(self.constraint._residues[0][1], (1, 0, 1))
+        domains['y'].removeValue(0)
+        self.assertTrue(self.constraint.narrow(domains))
+        self.assertEqual(domains['x'].getValues(), [0])
+
+    def testEntailment(self):
+        # some tuples satisfy the formula while all the values are
+        # supported: the constraint is not entailed
+        constraint = fd.Expression(['x', 'y', 'z'], '3*x - 2*y + z != 2')
+        domains = {'x':fd.FiniteDomain([0, 1]), 'y':fd.FiniteDomain([0, 1]),
+                   'z':fd.FiniteDomain([0, 1, 2])}
+        self.assertFalse(constraint.narrow(domains))
+        domains['x'].removeValue(1)
+        domains['y'].removeValue(1)
+        self.assertTrue(constraint.narrow(domains))
+        self.assertEqual(domains['z'].getValues(), [0, 1])
+
+    def testVariablesOrder(self):
+        # the compiled formula is shared by the expressions with the same
+        # variables in the same order only
+        formula = 'a * b == c * 2 + (a % 3)'
+        expected = set([(a, b, c) for a in range(4) for b in range(4)
+                        for c in range(4) if a * b == c * 2 + (a % 3)])
+        for variables in (['a', 'b', 'c'], ['c', 'b', 'a']):
+            for factory in (fd.Expression, fd.make_expression):
+                domains = {}
+                for var in 'abc':
+                    domains[var] = fd.FiniteDomain(list(range(4)))
+                repo = propagation.Repository(['a', 'b', 'c'], domains,
+                                              [factory(variables, formula)])
+                solutions = set([(s['a'], s['b'], s['c'])
+                                 for s in propagation.Solver().solve(repo)])
+                self.assertEqual(solutions, expected)
+
+
+class CostExpressionTC(unittest.TestCase):
+    def setUp(self):
+        self.cost = fd.CostExpression(('x', 'y'), 'x + 2*y')
+        self.domains = {'x':fd.FiniteDomain(list(range(4))),
+                        'y':fd.FiniteDomain(list(range(4)))}
+
+    def testCall(self):
+        self.assertEqual(self.cost(x=1, y=3, z=5), 7)
+
+    def testNarrowing(self):
+        self.assertEqual(self.cost.narrow(self.domains), 0)
+        self.assertEqual(self.domains['y'].size(), 4)
+        self.cost.setBound(3)
+        self.assertEqual(self.cost.narrow(self.domains), 0)
+        self.assertEqual(self.domains['x'].getValues(), [0, 1, 2])
+        self.assertEqual(self.domains['y'].getValues(), [0, 1])
+        self.cost.setBound(1)
+        self.assertRaises(propagation.ConsistencyFailure, self.cost.narrow,
+                          {'x':fd.FiniteDomain([1, 2]),
+                           'y':fd.FiniteDomain([0, 1])})
+
+    def testSolveBest(self):
+        repo = propagation.Repository(['x', 'y'], self.domains,
+                                      [fd.make_expression(('x', 'y'),
+                                                          'x + y >= 3')])
+        solutions = list(propagation.Solver().solve_best(repo, self.cost))
+        self.assertEqual(solutions[-1], ({'x':3, 'y':0}, 3))
+
+    def testBoundNotCompiled(self):
+        sizes = (len(fd.Expression._FILTER_CACHE),
+                 len(fd.Expression._VECTOR_CACHE))
+        for bound in range(10, 0, -1):
+            self.cost.setBound(bound)
+        self.assertEqual((len(fd.Expression._FILTER_CACHE),
+                          len(fd.Expression._VECTOR_CACHE)), sizes)
+
+    def testVariablesOrder(self):
+        reverse = fd.CostExpression(('y', 'x'), 'x + 2*y')
+        for cost in (self.cost, reverse):
+            cost.setBound(3)
+            domains = {'x':fd.FiniteDomain(list(range(4))),
+                       'y':fd.FiniteDomain(list(range(4)))}
+            cost.narrow(domains)
+            self.assertEqual(domains['x'].getValues(), [0, 1, 2])
+            self.assertEqual(domains['y'].getValues(), [0, 1])
+
+
 class TernaryMathConstrTC(AbstractConstraintTC):
     def setUp(self):
         self.relevant_variables = ['x','y','z']
@@ -212,6 +379,593 @@ class TernaryMathConstrTC(AbstractConstraintTC):
         v.sort()
         assert v == [2,3],str(v)
 
+@unittest.skipIf(fd.numpy is None, 'numpy is not available')
+class VectorizedExpressionTC(unittest.TestCase):
+    formulas = [('a', 'b', 'a != b and 3 != abs(a-b)'),
+                ('s', 'm', 'o', '(s+m) in (10*m+o,10*m+o-1)'),
+                ('a', 'b', 'a < b < 3 or not a'),
+                ('a', 'b', 'c', 'a - b if c > 2 else a + b == c'),
+                ('a', 'b', 'c', '(a*b - c) % 3 == 1'),
+                ('a', 'b', 'a not in (b, 3)')]
+
+    def setUp(self):
+        self.min_sizes = (fd.Expression._VECTORIZE_MIN_SIZE,
+                          fd.BinaryExpression._VECTORIZE_MIN_SIZE)
+        fd.Expression._VECTORIZE_MIN_SIZE = 0
+        fd.BinaryExpression._VECTORIZE_MIN_SIZE = 0
+
+    def tearDown(self):
+        (fd.Expression._VECTORIZE_MIN_SIZE,
+         fd.BinaryExpression._VECTORIZE_MIN_SIZE) = self.min_sizes
+
+    def narrow(self, variables, formula, domains, vectorize):
+        constraint = fd._make_expression(list(variables), formula)
+        self.assertTrue(constraint.vectorFunc is not None, formula)
+        if not vectorize:
+            constraint.vectorFunc = None
+        domains = dict([(var, fd.FiniteDomain(values))
+                        for var, values in zip(variables, domains)])
+        try:
+            constraint.narrow(domains)
+        except propagation.ConsistencyFailure:
+            return None
+        return [domains[var].getValues() for var in variables]
+
+    def testSameNarrowing(self):
+        import random
+        rand = random.Random(0)
+        for variables_formula in self.formulas:
+            variables, formula = variables_formula[:-1], variables_formula[-1]
+            for i in range(20):
+                domains = [rand.sample(range(-3, 10), rand.randint(1, 6))
+                           for var in variables]
+                self.assertEqual(self.narrow(variables, formula, domains, 1),
+                                 self.narrow(variables, formula, domains, 0))
+
+    def testVectorized(self):
+        constraint = fd._make_expression(['a', 'b', 'c'], 'a + b == c')
+        domains = dict([(var, fd.FiniteDomain(list(range(10))))
+                        for var in 'abc'])
+        self.assertTrue(constraint._vectorNarrow(domains) is not None)
+        self.assertEqual(domains['c'].size(), 10)
+        constraint = fd._make_expression(['a', 'b'], 'a // b == 1')
+        domains = dict([(var, fd.FiniteDomain(list(range(-3, 4))))
+                        for var in 'ab'])
+        # division by zero: the python version raises the error
+        self.assertEqual(constraint._vectorNarrow(domains), None)
+
+    def testBooleans(self):
+        # numpy adds booleans with a logical or
+        domains = [[True, False]] * 3
+        expected = self.narrow('abc', 'a + b + c == 2', domains, 0)
+        self.assertEqual(expected, domains)
+        self.assertEqual(self.narrow('abc', 'a + b + c == 2', domains, 1),
+                         expected)
+
+    def testOverflow(self):
+        # the products do not fit in 64 bits integers
+        big = 4 * 10**9
+        domains = [[big, big + 1], [big, big + 1], [big * big, big * big + 1,
+                                                    (big + 1) * big]]
+        expected = self.narrow('abc', 'a * b == c', domains, 0)
+        self.assertEqual(expected[2], [big * big, (big + 1) * big])
+        self.assertEqual(self.narrow('abc', 'a * b == c', domains, 1),
+                         expected)
+
+    def testEntailment(self):
+        constraint = fd.make_expression(('a', 'b'), 'a < b')
+        domains = {'a': fd.FiniteDomain([1, 2]), 'b': fd.FiniteDomain([3, 4])}
+        self.assertEqual(constraint.narrow(domains), 1)
+        domains = {'a': fd.FiniteDomain([1, 3]), 'b': fd.FiniteDomain([3, 4])}
+        self.assertEqual(constraint.narrow(domains), 0)
+
+    def testResidues(self):
+        # the supports found by numpy are the residues of the next calls
+        constraint = fd.Expression(['a', 'b', 'c'], 'a + b == c')
+        domains = dict([(var, fd.FiniteDomain(range(4))) for var in 'abc'])
+        constraint.narrow(domains)
+        for residue in constraint._residues:
+            for value, (a, b, c) in residue.items():
+                self.assertEqual(a + b, c)
+        domains['c'].removeValue(3)
+        constraint.narrow(domains)
+        self.assertEqual(domains['a'].getValues(), [0, 1, 2])
+
+    def testFallback(self):
+        for formula in ('a[0] == b', '(a and b) + 1 == 2', 'a ** b > 2',
+                        'min(a, b) == 0', 'a is b'):
+            self.assertEqual(fd._vectorize(['a', 'b'], formula), None)
+        # values which are not numbers use the python version
+        constraint = fd.make_expression(('a', 'b'), 'a != b')
+        domains = {'a': fd.FiniteDomain(['x']),
+                   'b': fd.FiniteDomain(['x', 'y'])}
+        constraint.narrow(domains)
+        self.assertEqual(domains['b'].getValues(), ['y'])
+
+
+class DiffersTC(AbstractConstraintTC):
+    def setUp(self):
+        self.relevant_variables = ['x','y']
+        self.irrelevant_variable = 'tagada'
+        self.constraint = fd.Differs('x', 'y', (0, 2, -2))
+        self.domains = {'x':fd.FiniteDomain([0, 1, 2, 3]),
+                        'y':fd.FiniteDomain([1, 3])}
+        self.entailed_domains = {'x':fd.FiniteDomain([1]),
+                                 'y':fd.FiniteDomain([0, 2, 4])}
+
+    def narrowingAssertions(self):
+        # 1 and 3 differ by 0 or 2 from all the values of y
+        self.assertEqual(self.domains['x'].getValues(), [0, 2])
+        self.assertEqual(self.domains['y'].getValues(), [1, 3])
+
+    def testAnyValues(self):
+        constraint = fd.Differs('x', 'y')
+        domains = {'x':fd.FiniteDomain(['a']),
+                   'y':fd.FiniteDomain(['a', 'b'])}
+        self.assertTrue(constraint.narrow(domains))
+        self.assertEqual(domains['y'].getValues(), ['b'])
+
+
+class ExpressionCompilerTC(unittest.TestCase):
+    formulas = [('a', 'b', 'a != b', fd.Differs),
+                ('a', 'b', 'a != b and 2 != abs(a - b)', fd.Conjunction),
+                ('a', 'b', 'b >= a', fd.LexLeq),
+                ('a', 'b', 'c', 'a + 2*b - c == 3', fd.Conjunction),
+                ('a', 'b', 'c', 'a < b < c', fd.Conjunction),
+                ('a', 'b', 'c', 'a*b == 2 and b*c == 2', fd.Conjunction),
+                ('a', 'b', 'a in (1, 2) and a - b != 1', fd.Conjunction),
+                ('a', 'a > 1', fd.Conjunction),
+                ('a', 'b', 'a + 1 < b', fd.BinaryExpression),
+                ('a', 'b', 'b != 0 and a % b == 1', fd.BinaryExpression),
+                ('a', 'b', 'c', 'a * b == c', fd.Expression)]
+
+    def testRecognized(self):
+        for formula in self.formulas:
+            variables, formula, klass = formula[:-2], formula[-2], formula[-1]
+            constraint = fd.make_expression(variables, formula)
+            self.assertEqual(constraint.__class__, klass, formula)
+
+    def testSameSolutions(self):
+        import random
+        rand = random.Random(0)
+        for formula in self.formulas:
+            variables, formula = list(formula[:-2]), formula[-2]
+            for i in range(10):
+                all_values = [rand.sample(range(-1, 6), rand.randint(1, 5))
+                              for var in variables]
+                solutions = []
+                for constraint in (fd.make_expression(variables, formula),
+                                   fd._make_expression(variables, formula)):
+                    domains = dict([(var, fd.FiniteDomain(values)) for
+                                    var, values in zip(variables, all_values)])
+                    repo = propagation.Repository(variables, domains,
+                                                  [constraint])
+                    solutions.append(sorted([sorted(solution.items())
+                        for solution in propagation.Solver().solve(repo)]))
+                self.assertEqual(solutions[0], solutions[1], formula)
+
+    def testPropagators(self):
+        constraint = fd.make_expression(('a', 'b'),
+                                        'a != b and 2 != abs(a - b)')
+        self.assertEqual([c.__class__ for c in constraint._constraints],
+                         [fd.Differs])
+        constraint = fd.make_expression(('a', 'b', 'c'), 'a + 2*b - c == 3')
+        self.assertEqual([c.__class__ for c in constraint._constraints],
+                         [fd.ScalarProduct])
+
+    def testUnaryQueued(self):
+        domains = {'v1': fd.FiniteDomain([0, 1, 2])}
+        repo = propagation.Repository(['v1'], domains,
+                                      [fd.make_expression(('v1',), 'v1 > 2')])
+        self.assertEqual(propagation.Solver().solve(repo), [])
+
+    def testNotNumbers(self):
+        # the formula concatenates strings
+        domains = {'a': fd.FiniteDomain(['x', 'xy']),
+                   'b': fd.FiniteDomain(['y', '']),
+                   'c': fd.FiniteDomain(['xy', 'z'])}
+        constraint = fd.make_expression(('a', 'b', 'c'), 'a + b == c')
+        repo = propagation.Repository(['a', 'b', 'c'], domains, [constraint])
+        solutions = propagation.Solver().solve(repo)
+        self.assertEqual(sorted([sorted(s.items()) for s in solutions]),
+                         [[('a', 'x'), ('b', 'y'), ('c', 'xy')],
+                          [('a', 'xy'), ('b', ''), ('c', 'xy')]])
+
+    def testExamples(self):
+        # the formula of examples/queens2.py is compiled
+        constraint = fd.make_expression(('Q0', 'Q2'),
+                                        'Q0 != Q2 and 2 != abs(Q0-Q2)')
+        self.assertEqual([c.__class__ for c in constraint._constraints],
+                         [fd.Differs])
+        # the one of examples/queens.py takes (row, column) pairs: the
+        # subscripts may fail and there is no propagator for the items of
+        # the values, so that it is kept whole
+        constraint = fd.make_expression(('Q00', 'Q02'),
+                                        'Q00[0] < Q02[0] and '
+                                        'Q00[1] != Q02[1] and '
+                                        'abs(Q00[0]-Q02[0]) != '
+                                        'abs(Q00[1]-Q02[1])')
+        self.assertEqual(constraint.__class__, fd.BinaryExpression)
+
+    def testWithoutUnparse(self):
+        # python < 3.9: the formulas with tests left are kept whole
+        unparse = fd._unparse
+        fd._unparse = None
+        try:
+            constraint = fd.make_expression(('a', 'b', 'c'),
+                                            'a*b == 2 and b*c == 2')
+            self.assertEqual(constraint.__class__, fd.Expression)
+            constraint = fd.make_expression(('a', 'b'), 'a < b')
+            self.assertEqual(constraint.__class__, fd.LexLeq)
+        finally:
+            fd._unparse = unparse
+
+    def testConstraintType(self):
+        constraint = fd.make_expression(('a', 'b'), 'a != b', 'my.Type')
+        self.assertEqual(constraint.__class__, fd.BinaryExpression)
+
+
+class TableTC(AbstractConstraintTC):
+    def setUp(self):
+        self.relevant_variables = ['x','y','z']
+        self.irrelevant_variable = 'tagada'
+        self.tuples = [(0, 1, 2), (1, 1, 0), (2, 0, 1), (1, 1, 0)]
+        self.constraint = fd.Table(self.relevant_variables, self.tuples)
+        self.domains = {'x':fd.FiniteDomain([0, 1, 3]),
+                        'y':fd.FiniteDomain(list(range(3))),
+                        'z':fd.FiniteDomain(list(range(3)))}
+        self.entailed_domains = {'x':fd.FiniteDomain([1, 2, 3]),
+                                 'y':fd.FiniteDomain([1]),
+                                 'z':fd.FiniteDomain([0])}
+
+    def narrowingAssertions(self):
+        self.assertEqual(sorted(self.domains['x'].getValues()), [0, 1])
+        self.assertEqual(sorted(self.domains['y'].getValues()), [1])
+        self.assertEqual(sorted(self.domains['z'].getValues()), [0, 2])
+
+    def testFailure(self):
+        domains = {'x':fd.FiniteDomain([0]), 'y':fd.FiniteDomain([0]),
+                   'z':fd.FiniteDomain(list(range(3)))}
+        self.assertRaises(propagation.ConsistencyFailure,
+                          self.constraint.narrow, domains)
+
+    def testResidues(self):
+        self.constraint.narrow(self.domains)
+        self.assertEqual(self.constraint._residues[0], {0: 0, 1: 1})
+        self.domains['z'].removeValue(0)
+        self.assertTrue(self.constraint.narrow(self.domains))
+        self.assertEqual(self.domains['x'].getValues(), [0])
+
+    def testForbidden(self):
+        constraint = fd.Table(('x', 'y'), [(0, 0), (0, 1), (1, 1)],
+                              forbidden=True)
+        domains = {'x':fd.FiniteDomain([0, 1]), 'y':fd.FiniteDomain([0, 1])}
+        self.assertTrue(constraint.narrow(domains))
+        self.assertEqual(domains['x'].getValues(), [1])
+        self.assertEqual(domains['y'].getValues(), [0])
+        self.assertRaises(propagation.ConsistencyFailure, constraint.narrow,
+                          {'x':fd.FiniteDomain([0]),
+                           'y':fd.FiniteDomain([0, 1])})
+
+    def testForbiddenNarrowing(self):
+        constraint = fd.Table(('x', 'y'), [(0, 0), (0, 1), (1, 1)],
+                              forbidden=True)
+        domains = {'x':fd.FiniteDomain([0, 1, 2]),
+                   'y':fd.FiniteDomain([0, 1])}
+        self.assertFalse(constraint.narrow(domains))
+        self.assertEqual(domains['x'].getValues(), [1, 2])
+        self.assertTrue(constraint.narrow({'x':fd.FiniteDomain([2]),
+                                           'y':fd.FiniteDomain([0, 1])}))
+
+    def testSameSolutionsAsExpression(self):
+        variables = ['x', 'y', 'z']
+        tuples = set([(x, y, z) for x in range(4) for y in range(4)
+                      for z in range(4) if (x * y + z) % 3 == 1])
+        for forbidden, formula in ((False, '(x * y + z) %% 3 == 1'),
+                                   (True, '(x * y + z) %% 3 != 1')):
+            solutions = []
+            for constraint in (fd.Table(variables, iter(tuples), forbidden),
+                               fd.make_expression(variables, formula % ())):
+                domains = dict([(var, fd.FiniteDomain(list(range(4))))
+                                for var in variables])
+                repo = propagation.Repository(variables, domains,
+                                              [constraint])
+                solutions.append(sorted([sorted(solution.items()) for solution
+                                         in propagation.Solver().solve(repo)]))
+            self.assertEqual(solutions[0], solutions[1])
+
+    def testReadTuples(self):
+        import os, tempfile
+        handle, filename = tempfile.mkstemp()
+        try:
+            os.write(handle, b'0 1 2\n1 1 0\n\n2 0 1\n')
+            os.close(handle)
+            self.assertEqual(list(fd.read_tuples(filename)), self.tuples[:3])
+        finally:
+            os.unlink(filename)
+
+    @unittest.skipIf(fd.numpy is None, 'numpy is not available')
+    def testArray(self):
+        constraint = fd.Table(self.relevant_variables,
+                              fd.numpy.array(self.tuples))
+        constraint.narrow(self.domains)
+        self.narrowingAssertions()
+
+
+class ScalarProductTC(AbstractConstraintTC):
+    def setUp(self):
+        self.relevant_variables = ['x','y','z']
+        self.irrelevant_variable = 'tagada'
+        self.constraint = fd.ScalarProduct(self.relevant_variables,
+                                           [2, 3, -1], '==', 10)
+        self.domains = {'x':fd.FiniteDomain(list(range(6))),
+                        'y':fd.FiniteDomain(list(range(6))),
+                        'z':fd.FiniteDomain(list(range(3)))}
+        self.entailed_domains = {'x':fd.FiniteDomain([2]),
+                                 'y':fd.FiniteDomain([2]),
+                                 'z':fd.FiniteDomain([0])}
+
+    def narrowingAssertions(self):
+        # 2x + 3y in [10, 12]
+        self.assertEqual(sorted(self.domains['x'].getValues()),
+                         [0, 1, 2, 3, 4, 5])
+        self.assertEqual(sorted(self.domains['y'].getValues()), [0, 1, 2, 3, 4])
+        self.assertEqual(sorted(self.domains['z'].getValues()), [0, 1, 2])
+
+    def testBoundsFixpoint(self):
+        constraint = fd.ScalarProduct(['x', 'y'], [1, 1], '==', 8)
+        domains = {'x':fd.FiniteDomain([0, 2, 4, 6]),
+                   'y':fd.FiniteDomain([1, 3, 4, 5])}
+        # x >= 3, then y >= 2, x <= 5 and y >= 4
+        self.assertTrue(constraint.narrow(domains))
+        self.assertEqual(domains['x'].getValues(), [4])
+        self.assertEqual(domains['y'].getValues(), [4])
+
+    def testDomainConsistency(self):
+        domains = {'x':fd.FiniteDomain([0, 2, 4, 6]),
+                   'y':fd.FiniteDomain([2, 3, 5, 6])}
+        constraint = fd.ScalarProduct(['x', 'y'], [1, 1], '==', 8)
+        self.assertFalse(constraint.narrow(domains))
+        self.assertEqual(domains['x'].getValues(), [2, 4, 6])
+        constraint = fd.ScalarProduct(['x', 'y'], [1, 1], '==', 8,
+                                      consistency='domain')
+        self.assertFalse(constraint.narrow(domains))
+        self.assertEqual(domains['x'].getValues(), [2, 6])
+        self.assertEqual(domains['y'].getValues(), [2, 6])
+
+    def testLesserOrEqual(self):
+        constraint = fd.ScalarProduct(['x', 'y'], [2, -1], '<=', 3)
+        domains = {'x':fd.FiniteDomain(list(range(6))),
+                   'y':fd.FiniteDomain(list(range(4)))}
+        self.assertFalse(constraint.narrow(domains))
+        self.assertEqual(domains['x'].getValues(), [0, 1, 2, 3])
+        self.assertEqual(domains['y'].getValues(), [0, 1, 2, 3])
+        domains['x'].removeValues([2, 3])
+        self.assertTrue(constraint.narrow(domains))
+
+    def testGreaterOrEqual(self):
+        constraint = fd.Sum(['x', 'y'], '>=', 7)
+        domains = {'x':fd.FiniteDomain(list(range(6))),
+                   'y':fd.FiniteDomain(list(range(4)))}
+        constraint.narrow(domains)
+        self.assertEqual(domains['x'].getValues(), [4, 5])
+        self.assertRaises(propagation.ConsistencyFailure, constraint.narrow,
+                          {'x':fd.FiniteDomain([3]),
+                           'y':fd.FiniteDomain([1, 2, 3])})
+
+    def testNotEqual(self):
+        constraint = fd.ScalarProduct(['x', 'y'], [1, 2], '!=', 5)
+        domains = {'x':fd.FiniteDomain(list(range(4))),
+                   'y':fd.FiniteDomain([1, 2])}
+        self.assertFalse(constraint.narrow(domains))
+        domains['y'].removeValue(2)
+        self.assertTrue(constraint.narrow(domains))
+        self.assertEqual(domains['x'].getValues(), [0, 1, 2])
+
+    def testSameSolutionsAsEnumeration(self):
+        variables = ['x', 'y', 'z']
+        values = list(range(-2, 4))
+        tests = {'==': operator.eq, '!=': operator.ne,
+                 '<=': operator.le, '>=': operator.ge}
+        for relation, test in tests.items():
+            expected = sorted([[('x', x), ('y', y), ('z', z)]
+                               for x in values for y in values for z in values
+                               if test(3*x - 2*y + z, 2)])
+            for consistency in ('bounds', 'domain'):
+                constraint = fd.ScalarProduct(variables, [3, -2, 1], relation,
+                                              2, consistency)
+                domains = dict([(var, fd.FiniteDomain(values))
+                                for var in variables])
+                repo = propagation.Repository(variables, domains, [constraint])
+                solutions = sorted([sorted(solution.items()) for solution
+                                    in propagation.Solver().solve(repo)])
+                self.assertEqual(solutions, expected)
+
+class AmongTC(AbstractConstraintTC):
+    def setUp(self):
+        self.relevant_variables = ['x','y','z']
+        self.irrelevant_variable = 'tagada'
+        self.constraint = fd.Among(self.relevant_variables, [0, 1], 2, 2)
+        self.domains = {'x':fd.FiniteDomain([0, 1]),
+                        'y':fd.FiniteDomain([1, 2]),
+                        'z':fd.FiniteDomain([0, 2, 3])}
+        self.entailed_domains = {'x':fd.FiniteDomain([0]),
+                                 'y':fd.FiniteDomain([1]),
+                                 'z':fd.FiniteDomain([2, 3])}
+
+    def narrowingAssertions(self):
+        # nothing can be deduced yet
+        self.assertEqual(self.domains['y'].getValues(), [1, 2])
+        self.assertEqual(self.domains['z'].getValues(), [0, 2, 3])
+
+    def testHighReached(self):
+        self.domains['y'].removeValue(2)
+        self.assertTrue(self.constraint.narrow(self.domains))
+        self.assertEqual(self.domains['z'].getValues(), [2, 3])
+
+    def testLowReached(self):
+        self.domains['x'] = fd.FiniteDomain([2])
+        self.assertTrue(self.constraint.narrow(self.domains))
+        self.assertEqual(self.domains['y'].getValues(), [1])
+        self.assertEqual(self.domains['z'].getValues(), [0])
+
+    def testAtMostAtLeast(self):
+        domains = {'x':fd.FiniteDomain([0]), 'y':fd.FiniteDomain([0, 1]),
+                   'z':fd.FiniteDomain([0, 1])}
+        self.assertFalse(fd.AtMost(['x', 'y', 'z'], 0, 2).narrow(domains))
+        self.assertTrue(fd.AtLeast(['x', 'y', 'z'], 1, 2).narrow(domains))
+        self.assertEqual(domains['y'].getValues(), [1])
+        self.assertRaises(propagation.ConsistencyFailure,
+                          fd.AtMost(['x', 'y', 'z'], 1, 1).narrow, domains)
+
+
+class GlobalCardinalityTC(AbstractConstraintTC):
+    def setUp(self):
+        self.relevant_variables = ['x','y','z', 't']
+        self.irrelevant_variable = 'tagada'
+        self.constraint = fd.GlobalCardinality(self.relevant_variables,
+                                               {'a': (1, 2), 'b': (0, 2)},
+                                               closed=True)
+        self.domains = {'x':fd.FiniteDomain(['a']),
+                        'y':fd.FiniteDomain(['a', 'b']),
+                        'z':fd.FiniteDomain(['a', 'b', 'c']),
+                        't':fd.FiniteDomain(['b', 'c'])}
+        self.entailed_domains = {'x':fd.FiniteDomain(['a']),
+                                 'y':fd.FiniteDomain(['a']),
+                                 'z':fd.FiniteDomain(['b']),
+                                 't':fd.FiniteDomain(['b'])}
+
+    def narrowingAssertions(self):
+        self.assertEqual(self.domains['t'].getValues(), ['b'])
+        self.assertEqual(self.domains['y'].getValues(), ['a', 'b'])
+        self.assertEqual(self.domains['z'].getValues(), ['a', 'b'])
+
+    def testCounting(self):
+        constraint = fd.GlobalCardinality(self.relevant_variables,
+                                          {'a': 2, 'b': (0, 1)})
+        self.domains['t'] = fd.FiniteDomain(['b'])
+        # 'b' is taken by t, then 'a' by x and y
+        self.assertTrue(constraint.narrow(self.domains))
+        self.assertEqual(self.domains['y'].getValues(), ['a'])
+        self.assertEqual(self.domains['z'].getValues(), ['c'])
+
+    def testOpen(self):
+        constraint = fd.GlobalCardinality(self.relevant_variables,
+                                          {'a': (1, 2), 'b': (0, 2)})
+        self.assertFalse(constraint.narrow(self.domains))
+        self.assertEqual(self.domains['t'].getValues(), ['b', 'c'])
+
+    def testTooManyValues(self):
+        constraint = fd.GlobalCardinality(['x', 'y'], {'a': 1, 'b': 2})
+        self.assertRaises(propagation.ConsistencyFailure, constraint.narrow,
+                          {'x':fd.FiniteDomain(['a', 'b']),
+                           'y':fd.FiniteDomain(['a', 'b'])})
+
+    def testShifts(self):
+        # two nurses on the day shift, one at night, one off
+        nurses = ['n%d' % index for index in range(4)]
+        domains = dict([(nurse, fd.FiniteDomain(['day', 'night', 'off']))
+                        for nurse in nurses])
+        constraints = [fd.GlobalCardinality(nurses, {'day': 2, 'night': 1,
+                                                     'off': 1})]
+        repo = propagation.Repository(nurses, domains, constraints)
+        solutions = propagation.Solver().solve(repo)
+        self.assertEqual(len(solutions), 12)
+        for solution in solutions:
+            self.assertEqual(list(solution.values()).count('day'), 2)
+
+
+class LexLeqTC(AbstractConstraintTC):
+    def setUp(self):
+        self.relevant_variables = ['x1', 'x2', 'y1', 'y2']
+        self.irrelevant_variable = 'tagada'
+        self.constraint = fd.LexLeq(['x1', 'x2'], ['y1', 'y2'])
+        self.domains = {'x1':fd.FiniteDomain([1, 2, 3]),
+                        'x2':fd.FiniteDomain([2, 3]),
+                        'y1':fd.FiniteDomain([0, 1, 2]),
+                        'y2':fd.FiniteDomain([0, 1])}
+        self.entailed_domains = {'x1':fd.FiniteDomain([1]),
+                                 'x2':fd.FiniteDomain([2, 3]),
+                                 'y1':fd.FiniteDomain([2, 3]),
+                                 'y2':fd.FiniteDomain([0, 1])}
+
+    def narrowingAssertions(self):
+        # x2 > y2, so that x1 < y1
+        self.assertEqual(self.domains['x1'].getValues(), [1])
+        self.assertEqual(self.domains['y1'].getValues(), [2])
+
+    def testStrict(self):
+        domains = {'x1':fd.FiniteDomain([1]), 'x2':fd.FiniteDomain([0, 1]),
+                   'y1':fd.FiniteDomain([1]), 'y2':fd.FiniteDomain([0, 1])}
+        constraint = fd.LexLeq(['x1', 'x2'], ['y1', 'y2'], strict=True)
+        self.assertTrue(constraint.narrow(domains))
+        self.assertEqual(domains['x2'].getValues(), [0])
+        self.assertEqual(domains['y2'].getValues(), [1])
+        self.assertRaises(propagation.ConsistencyFailure, constraint.narrow,
+                          {'x1':fd.FiniteDomain([1]), 'x2':fd.FiniteDomain([0]),
+                           'y1':fd.FiniteDomain([1]), 'y2':fd.FiniteDomain([0])})
+
+    def testSolutions(self):
+        variables = ['x1', 'x2', 'y1', 'y2']
+        for strict in (False, True):
+            domains = dict([(var, fd.FiniteDomain(range(3)))
+                            for var in variables])
+            repo = propagation.Repository(variables, domains,
+                [fd.LexLeq(['x1', 'x2'], ['y1', 'y2'], strict)])
+            solutions = propagation.Solver().solve(repo)
+            expected = [sol for sol in range(81)
+                        if _lex(sol // 27, sol // 9 % 3, sol // 3 % 3,
+                                sol % 3, strict)]
+            self.assertEqual(len(solutions), len(expected))
+            for sol in solutions:
+                self.assertTrue(_lex(sol['x1'], sol['x2'], sol['y1'],
+                                     sol['y2'], strict))
+
+def _lex(x1, x2, y1, y2, strict):
+    if strict:
+        return (x1, x2) < (y1, y2)
+    return (x1, x2) <= (y1, y2)
+
+
+class LexChainTC(unittest.TestCase):
+    def testChain(self):
+        variables = ['a', 'b', 'c']
+        domains = dict([(var, fd.FiniteDomain(range(3)))
+                        for var in variables])
+        constraint = fd.LexChain([['a'], ['b'], ['c']], strict=True)
+        self.assertTrue(constraint.narrow(domains))
+        for index, var in enumerate(variables):
+            self.assertEqual(domains[var].getValues(), [index])
+
+
+class ValuePrecedenceTC(AbstractConstraintTC):
+    def setUp(self):
+        self.relevant_variables = ['x','y','z']
+        self.irrelevant_variable = 'tagada'
+        self.constraint = fd.ValuePrecedence(self.relevant_variables,
+                                             ['a', 'b', 'c'])
+        self.domains = {'x':fd.FiniteDomain(['a', 'b', 'c']),
+                        'y':fd.FiniteDomain(['a', 'b', 'c']),
+                        'z':fd.FiniteDomain(['a', 'b', 'c'])}
+        self.entailed_domains = {'x':fd.FiniteDomain(['a']),
+                                 'y':fd.FiniteDomain(['b', 'c']),
+                                 'z':fd.FiniteDomain(['a', 'b', 'c'])}
+
+    def narrowingAssertions(self):
+        self.assertEqual(self.domains['x'].getValues(), ['a'])
+        self.assertEqual(self.domains['y'].getValues(), ['a', 'b'])
+        self.assertEqual(self.domains['z'].getValues(), ['a', 'b', 'c'])
+
+    def testSolutions(self):
+        # set partitions of 4 elements in at most 3 parts
+        variables = ['v1', 'v2', 'v3', 'v4']
+        domains = dict([(var, fd.FiniteDomain(range(3)))
+                        for var in variables])
+        repo = propagation.Repository(variables, domains,
+            [fd.ValuePrecedence(variables, range(3))])
+        self.assertEqual(len(propagation.Solver().solve(repo)), 1 + 7 + 6)
+
+
 class AbstractBasicConstraintTC(unittest.TestCase):
     """override the following methods:
      * setUp to initialize variables
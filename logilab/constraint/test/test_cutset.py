@@ -0,0 +1,101 @@
+"""Unit testing for the symmetry breaking"""
+
+# (c) 2000-2001 LOGILAB S.A. (Paris, FRANCE).
+# http://www.logilab.fr/ -- mailto:contact@logilab.fr
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307
+# USA.
+
+import unittest
+from logilab.constraint.propagation import Repository, Solver
+from logilab.constraint.cutset import *
+from logilab.constraint import fd
+from problems import sort_solutions
+
+def chain(size, values, extra=()):
+    """variables ordered by a chain of constraints, with extra
+    constraints on pairs of them"""
+    variables = ['x%d' % i for i in range(size)]
+    domains = {}
+    for var in variables:
+        domains[var] = fd.FiniteDomain(list(range(values)))
+    constraints = []
+    for var1, var2 in zip(variables, variables[1:]):
+        constraints.append(fd._make_expression([var1, var2],
+                                               '%s < %s' % (var1, var2)))
+    for index1, index2, formula in extra:
+        var1, var2 = variables[index1], variables[index2]
+        constraints.append(fd._make_expression([var1, var2],
+                                               formula % (var1, var2)))
+    return Repository(variables, domains, constraints)
+
+
+class CycleCutsetTC(unittest.TestCase):
+
+    def testTree(self):
+        cutset, order = cycle_cutset(chain(4, 6))
+        self.assertEqual(cutset, [])
+        self.assertEqual(order, [('x0', None), ('x1', 'x0'), ('x2', 'x1'),
+                                 ('x3', 'x2')])
+
+    def testCycle(self):
+        repo = chain(5, 8, [(0, 4, '%s != %s - 5')])
+        cutset, order = cycle_cutset(repo)
+        self.assertEqual(len(cutset), 1)
+        self.assertEqual(len(order), 4)
+        self.assertTrue(cutset[0] not in [var for var, parent in order])
+
+    def testNary(self):
+        repo = chain(4, 6)
+        repo.addConstraint(fd.AllDistinct(['x0', 'x1', 'x3']))
+        cutset, order = cycle_cutset(repo)
+        self.assertEqual(sorted(cutset), ['x0', 'x1', 'x3'])
+        self.assertEqual(order, [('x2', None)])
+
+
+class CutsetSolverTC(unittest.TestCase):
+
+    def testChain(self):
+        solver = CutsetSolver()
+        solutions = solver.solve(chain(6, 9))
+        self.assertEqual(len(solutions), 84)
+        self.assertEqual(solver.cutset, [])
+        # backtrack free
+        self.assertEqual(solver.distrib_cnt, 0)
+        self.assertEqual(sort_solutions(solutions),
+                         sort_solutions(Solver().solve(chain(6, 9))))
+
+    def testSameSolutions(self):
+        extra = [(0, 3, '%s != %s - 4'), (1, 5, '%s + %s != 10'),
+                 (2, 6, '%s * 2 <= %s')]
+        expected = sort_solutions(Solver().solve(chain(7, 9, extra)))
+        solver = CutsetSolver()
+        solutions = sort_solutions(solver.solve(chain(7, 9, extra)))
+        self.assertTrue(solver.cutset)
+        self.assertEqual(solutions, expected)
+
+    def testNoSolution(self):
+        solver = CutsetSolver()
+        self.assertEqual(solver.solve(chain(5, 6, [(0, 4, '%s == %s')])), [])
+        self.assertEqual(solver.solve_one(chain(7, 6)), None)
+
+    def testSolveOne(self):
+        solver = CutsetSolver(trail=True)
+        solution = solver.solve_one(chain(5, 5))
+        self.assertEqual(solution, {'x0': 0, 'x1': 1, 'x2': 2, 'x3': 3,
+                                    'x4': 4})
+
+
+if __name__ == '__main__':
+    unittest.main()
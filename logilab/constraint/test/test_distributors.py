@@ -124,6 +124,46 @@ class EnumeratorDistributorTC(AbstractDistributorTC):
             assert d['v2'].size() == 1
 
 
+class WeightedDegreeDistributorTC(DichotomyDistributorTC):
+    def buildDistributor(self):
+        return distributors.WeightedDegreeDistributor()
+
+    def testWeights(self):
+        dist = self.buildDistributor()
+        self.assertEqual(dist.getWeight('v3'), 1)
+        constraint = fd.make_expression(('v1', 'v3'), 'v1 < v3')
+        for i in range(3):
+            dist.notifyFailure(constraint)
+        dist.notifyFailure(None)
+        self.assertEqual(dist.getWeight('v3'), 4)
+        # 4 values / weight 4 < 2 values / weight 1
+        self.assertEqual(dist._selectVariable(self.domains1), 'v3')
+        distributed = dist.distribute(self.domains1)
+        self.assertEqual(distributed[0]['v3'].size(), 2)
+        self.assertEqual(distributed[0]['v2'].size(), 2)
+
+class ActivityDistributorTC(DichotomyDistributorTC):
+    def buildDistributor(self):
+        return distributors.ActivityDistributor()
+
+    def testActivities(self):
+        dist = self.buildDistributor()
+        self.assertEqual(dist._selectVariable(self.domains1), 'v2')
+        dist.notifyPropagation(['v3', 'v3'])
+        dist.notifyPropagation(['v2'])
+        dist.notifyPropagation(['v3'])
+        self.assertTrue(dist.getActivity('v3') > 2 * dist.getActivity('v2'))
+        self.assertEqual(dist._selectVariable(self.domains1), 'v3')
+
+    def testRescaling(self):
+        dist = self.buildDistributor()
+        dist._increment = 0.99e100
+        dist.notifyPropagation(['v1'])
+        self.assertTrue(dist._increment < 10)
+        dist.notifyPropagation(['v2'])
+        self.assertTrue(dist.getActivity('v2') > dist.getActivity('v1'))
+
+
 def get_all_cases(module):
     import types
     all_cases = []
@@ -18,6 +18,8 @@
 # USA.
 
 import unittest
+import gc
+import pickle
 from logilab.constraint import fd
 from logilab.constraint import propagation
 from logilab.constraint import distributors
@@ -68,6 +70,65 @@ class SuiteDomainTC(AbstractDomainTC):
         self.domain = fd.FiniteDomain(self.values)
 
 
+class BitsetDomainTC(AbstractDomainTC):
+    def setUp(self):
+        self.values = list(range(3))
+        self.domain = fd.BitsetDomain(self.values)
+
+    def testRemoveMissingValue(self):
+        self.domain.removeValue(1)
+        self.assertRaises(KeyError, self.domain.removeValue, 1)
+
+    def testValuesOrder(self):
+        domain = fd.BitsetDomain([3, 'a', 1, 3])
+        self.assertEqual(domain.getValues(), [3, 'a', 1])
+        domain.removeValue('a')
+        self.assertEqual(domain.getValues(), [3, 1])
+
+    def testCopy(self):
+        copy = self.domain.copy()
+        copy.removeValue(0)
+        self.assertEqual(self.domain.size(), 3)
+        self.assertEqual(copy.size(), 2)
+        self.domain.setState(copy.getState())
+        self.assertEqual(self.domain.getValues(), [1, 2])
+
+    def testIntersect(self):
+        other = fd.BitsetDomain(self.values)
+        other.removeValue(1)
+        self.domain.intersect(other)
+        self.assertEqual(self.domain.getValues(), [0, 2])
+        self.domain.intersect([2, 5])
+        self.assertEqual(self.domain.getValues(), [2])
+        self.assertRaises(propagation.ConsistencyFailure,
+                          self.domain.intersect, [0])
+
+    def testSubtract(self):
+        self.domain.subtract([0, 5])
+        self.assertEqual(self.domain.getValues(), [1, 2])
+        self.assertTrue(self.domain.hasChanged())
+        self.assertRaises(propagation.ConsistencyFailure,
+                          self.domain.subtract, fd.BitsetDomain(self.values))
+
+    def testUniverses(self):
+        values = ['universe', 1, 2]
+        domain = fd.BitsetDomain(values)
+        self.assertTrue(fd.BitsetDomain(values)._universe is domain._universe)
+        self.assertTrue(tuple(values) in fd.BitsetDomain._UNIVERSES)
+        # forgotten with the last domain using it
+        copy = domain.copy()
+        del domain
+        gc.collect()
+        self.assertTrue(tuple(values) in fd.BitsetDomain._UNIVERSES)
+        del copy
+        gc.collect()
+        self.assertFalse(tuple(values) in fd.BitsetDomain._UNIVERSES)
+
+    def testPickle(self):
+        domain = pickle.loads(pickle.dumps(self.domain))
+        self.assertTrue(domain._universe is self.domain._universe)
+        self.assertEqual(domain.getValues(), self.values)
+
 
 def get_all_cases(module):
     import types
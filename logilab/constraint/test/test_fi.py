@@ -68,6 +68,29 @@ class FiniteIntervalTC(unittest.TestCase):
         self.assertEqual(self.dom1.size(), 9 + 8 + 7)
         self.assertEqual(self.dom2.size(), 1)
         self.assertEqual(self.dom3.size(), 12)
+        self.assertEqual(FiniteIntervalDomain(0, 10**9, 10, 1000).size(),
+                         991 * (10**9 - 9) - 991 * 990 // 2)
+
+    def test_getValue(self):
+        for dom in (self.dom1, self.dom2, self.dom3):
+            values = list(dom.iter_values())
+            for index, value in enumerate(values):
+                self.assertEqual(dom.getValue(index), value)
+            self.assertEqual(dom.getValue(-1), values[-1])
+            self.assertRaises(IndexError, dom.getValue, len(values))
+        self.assertEqual(self.dom3.getValue(5), Interval(2, 4.5))
+
+    def test_getValuesIsLazy(self):
+        dom = FiniteIntervalDomain(0, 10**9, 10, 1000, .5)
+        values = dom.getValues()
+        self.assertEqual(values[0], Interval(0, 10))
+        self.assertEqual(values[-1], Interval(10**9 - 1000, 10**9))
+        # the values are the ones of the domain when they were asked
+        dom.setLowestMin(5)
+        self.assertEqual(values[0], Interval(0, 10))
+        self.assertEqual(self.dom2.getValues(), [Interval(2, 5)])
+        self.assertEqual(self.dom1.getValues()[1:3],
+                         [Interval(1, 3), Interval(2, 4)])
 
     def test_overlap(self):
         self.assertTrue(self.dom1.overlap(self.dom2))
@@ -445,6 +468,89 @@ class ConstraintTC(unittest.TestCase):
         self.assertRaises(ConsistencyFailure, c.narrow, self.domains)
 
         
+class ResourceConstraintTC(unittest.TestCase):
+
+    def test_Disjunctive_EdgeFinding(self):
+        # C can not end before A and B, which can not end before 10
+        domains = {'A': FiniteIntervalDomain(0, 10, 4),
+                   'B': FiniteIntervalDomain(1, 10, 5),
+                   'C': FiniteIntervalDomain(0, 20, 3)}
+        entailed = Disjunctive(['A', 'B', 'C']).narrow(domains)
+        self.assertEqual(domains['C'].lowestMin, 9)
+        self.assertFalse(entailed)
+
+    def test_Disjunctive_NotLast(self):
+        # C can not be last, since A and B can not end before its latest
+        # start 7: it ends before their latest start 8
+        domains = {'A': FiniteIntervalDomain(0, 12, 4),
+                   'B': FiniteIntervalDomain(0, 12, 4),
+                   'C': FiniteIntervalDomain(0, 11, 4)}
+        Disjunctive(['A', 'B', 'C']).narrow(domains)
+        self.assertEqual(domains['C'].highestMax, 8)
+
+    def test_Disjunctive_Unique(self):
+        domains = {'A': FiniteIntervalDomain(0, 9, 3),
+                   'B': FiniteIntervalDomain(2, 9, 4),
+                   'C': FiniteIntervalDomain(4, 10, 3)}
+        self.assertTrue(Disjunctive(['A', 'B', 'C']).narrow(domains))
+        self.assertEqual(domains['A'].getValues(), [Interval(0, 3)])
+        self.assertEqual(domains['B'].getValues(), [Interval(3, 7)])
+        self.assertEqual(domains['C'].getValues(), [Interval(7, 10)])
+
+    def test_Disjunctive_Entailed(self):
+        domains = {'A': FiniteIntervalDomain(0, 5, 2),
+                   'B': FiniteIntervalDomain(5, 8, 3),
+                   'C': FiniteIntervalDomain(8, 12, 1)}
+        self.assertTrue(Disjunctive(['A', 'B', 'C']).narrow(domains))
+
+    def test_Disjunctive_ConsistencyFailure(self):
+        domains = {'A': FiniteIntervalDomain(0, 8, 3),
+                   'B': FiniteIntervalDomain(0, 8, 3),
+                   'C': FiniteIntervalDomain(0, 8, 3)}
+        self.assertRaises(ConsistencyFailure,
+                          Disjunctive(['A', 'B', 'C']).narrow, domains)
+
+    def test_Disjunctive_SameSolutionsAsNoOverlap(self):
+        variables = ['A', 'B', 'C', 'D']
+        answers = []
+        for constraints in ([Disjunctive(variables)],
+                            [NoOverlap(var1, var2) for var1 in variables
+                             for var2 in variables if var1 < var2]):
+            domains = {'A': FiniteIntervalDomain(0, 10, 2),
+                       'B': FiniteIntervalDomain(0, 10, 3),
+                       'C': FiniteIntervalDomain(2, 10, 2),
+                       'D': FiniteIntervalDomain(0, 6, 2)}
+            repo = Repository(variables, domains, constraints)
+            solutions = Solver(FiniteIntervalDistributor()).solve(repo)
+            answers.append(sorted([[(var, (value._start, value._end))
+                                    for var, value in sorted(sol.items())]
+                                   for sol in solutions]))
+        self.assertTrue(answers[0])
+        self.assertEqual(answers[0], answers[1])
+
+    def test_Cumulative_Timetable(self):
+        # A and B must hold 2 units of the resource during [4, 5[
+        domains = {'A': FiniteIntervalDomain(3, 6, 2),
+                   'B': FiniteIntervalDomain(4, 5, 1),
+                   'C': FiniteIntervalDomain(2, 10, 3)}
+        constraint = Cumulative(['A', 'B', 'C'], [1, 1, 1], 2)
+        self.assertTrue(constraint.narrow(domains))
+        self.assertEqual(domains['C'].lowestMin, 5)
+
+    def test_Cumulative_Entailed(self):
+        domains = {'A': FiniteIntervalDomain(0, 5, 2),
+                   'B': FiniteIntervalDomain(0, 5, 3),
+                   'C': FiniteIntervalDomain(5, 10, 3)}
+        constraint = Cumulative(['A', 'B', 'C'], [1, 2, 3], 3)
+        self.assertTrue(constraint.narrow(domains))
+
+    def test_Cumulative_ConsistencyFailure(self):
+        # 2 * 3 + 2 * 3 units of energy within 5 units of time
+        domains = {'A': FiniteIntervalDomain(0, 5, 3),
+                   'B': FiniteIntervalDomain(0, 5, 3)}
+        constraint = Cumulative(['A', 'B'], [2, 2], 2)
+        self.assertRaises(ConsistencyFailure, constraint.narrow, domains)
+
 class DistributorTC(unittest.TestCase):
     def setUp(self):
         self.d = FiniteIntervalDistributor()
@@ -500,6 +606,21 @@ class PlannerTC(unittest.TestCase):
         import pprint
         pprint.pprint( list(answers) )
 
+    def test_trail(self):
+        constraints = [ StartsAfterEnd('B','A'),
+                        StartsAfterEnd('C','A'),
+                        NoOverlap('B','C' ) ]
+        answers = []
+        for trail in (False, True):
+            repo = Repository(['A','B','C'],
+                              {'A': FiniteIntervalDomain(0, 15, 5),
+                               'B': FiniteIntervalDomain(0, 15, 5),
+                               'C': FiniteIntervalDomain(0, 15, 5)},
+                              constraints)
+            answers.append(Solver(self.d, trail=trail).solve(repo))
+        self.assertEqual(len(answers[0]), 2)
+        self.assertEqual(answers[0], answers[1])
+
     def test_pb1(self):
         constraints = [ StartsAfterEnd('B','A'),
                         StartsAfterEnd('C','A'),
@@ -0,0 +1,66 @@
+"""Unit testing for the parallel solver"""
+
+# (c) 2000-2001 LOGILAB S.A. (Paris, FRANCE).
+# http://www.logilab.fr/ -- mailto:contact@logilab.fr
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307
+# USA.
+
+import unittest
+from logilab.constraint.propagation import Repository, Solver
+from logilab.constraint.parallel import ParallelSolver
+from logilab.constraint import fd
+from logilab.constraint.distributors import DefaultDistributor
+from problems import queens, sort_solutions
+
+
+
+class ParallelSolver_TC(unittest.TestCase):
+    def testSolve(self):
+        variables = list('abcd')
+        domains = {}
+        for v in variables:
+            domains[v] = fd.FiniteDomain(list(range(4)))
+        repo = Repository(variables, domains)
+        for v1 in variables:
+            for v2 in variables:
+                if v1 < v2:
+                    repo.addConstraint(fd.make_expression((v1, v2),
+                                                          '%s < %s'%(v1, v2)))
+        solutions = ParallelSolver(processes=2).solve(repo)
+        self.assertEqual(solutions, [{'a':0, 'b':1, 'c':2, 'd':3}])
+
+    def testNoSolution(self):
+        repo = queens(3)
+        self.assertEqual(ParallelSolver(processes=2).solve(repo), [])
+
+    def testSameSolutionsAsSerial(self):
+        for domain_class in (fd.FiniteDomain, fd.BitsetDomain):
+            expected = Solver(DefaultDistributor()).solve(queens(7, domain_class))
+            solver = ParallelSolver(DefaultDistributor(), processes=2,
+                                    chunk_size=2)
+            solutions = solver.solve(queens(7, domain_class))
+            self.assertEqual(len(solutions), 40)
+            self.assertEqual(sort_solutions(solutions),
+                             sort_solutions(expected))
+
+    def testSolveOneStops(self):
+        solver = ParallelSolver(processes=2, chunk_size=1)
+        solution = solver.solve_one(queens(8))
+        self.assertTrue(solution)
+        self.assertEqual(len(set(solution.values())), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -21,7 +21,29 @@ import unittest
 import os
 from logilab.constraint.propagation import *
 from logilab.constraint import fd
-from logilab.constraint.distributors import DefaultDistributor
+from logilab.constraint.distributors import DefaultDistributor, \
+     WeightedDegreeDistributor
+from problems import queens
+
+class Recorder(AbstractConstraint):
+    """constraint logging its narrowings, which removes the values of
+    its variables listed in removals on its first narrowing"""
+    def __init__(self, variables, cost, log, removals=()):
+        AbstractConstraint.__init__(self, variables)
+        self.cost = cost
+        self.log = log
+        self.removals = list(removals)
+
+    def estimateCost(self, domains):
+        return self.cost
+
+    def narrow(self, domains):
+        self.log.append(self.cost)
+        for var, val in self.removals:
+            domains[var].removeValue(val)
+        self.removals = []
+        return 0
+
 
 class Repository_TC(unittest.TestCase):
     def setUp(self):
@@ -76,6 +98,22 @@ class Repository_TC(unittest.TestCase):
         for v, dom in list(self.repo.getDomains().items()):
             self.assertEqual(dom.size(),1)
 
+    def testQueueOrder(self):
+        log = []
+        for cost in (3, 1, 2):
+            self.repo.addConstraint(Recorder(['a'], cost, log))
+        self.repo.consistency()
+        self.assertEqual(log, [1, 2, 3])
+
+    def testAffectedConstraintQueuedOnce(self):
+        log = []
+        self.repo.addConstraint(Recorder(['a', 'b'], 1, log,
+                                         [('a', 0), ('b', 0)]))
+        self.repo.addConstraint(Recorder(['a', 'b'], 2, log))
+        self.repo.addConstraint(Recorder(['c'], 3, log))
+        self.repo.consistency()
+        self.assertEqual(log, [1, 2, 3])
+
     def testInconsistency(self):
         self.repo.addConstraint(fd.make_expression(('a', 'b'),
                                                    'a < b'))
@@ -88,6 +126,22 @@ class Repository_TC(unittest.TestCase):
         except ConsistencyFailure:
             pass
 
+    def testFailingConstraint(self):
+        c1 = fd.make_expression(('a', 'b'), 'a < b')
+        c2 = fd.make_expression(('b', 'c'), 'b > c + 6')
+        self.repo.addConstraint(c1)
+        self.repo.addConstraint(c2)
+        try:
+            self.repo.consistency()
+            self.fail('No ConsistencyFailure raised')
+        except ConsistencyFailure as exc:
+            self.assertTrue(exc.constraint is c2)
+
+    def testChangedVariables(self):
+        self.repo.addConstraint(fd.make_expression(('a', 'b'), 'a < b'))
+        self.repo.consistency()
+        self.assertEqual(sorted(self.repo.getChangedVariables()), ['a', 'b'])
+
 
 class Sover_TC(unittest.TestCase):
     def setUp(self):
@@ -130,6 +184,243 @@ class Sover_TC(unittest.TestCase):
                          [])
 
 
+class TrailSolver_TC(Sover_TC):
+    def setUp(self):
+        Sover_TC.setUp(self)
+        self.solver = Solver(trail=True)
+
+    def testSameSolutionsAsCopy(self):
+        variables = ['Q%d' % i for i in range(6)]
+        solutions = []
+        for trail in (False, True):
+            domains = {}
+            for i, name in enumerate(variables):
+                domains[name] = fd.FiniteDomain([(i, j) for j in range(6)])
+            repo = Repository(variables, domains)
+            for q1 in variables:
+                for q2 in variables:
+                    if q1 < q2:
+                        repo.addConstraint(fd.make_expression((q1, q2),
+                            '%(q1)s[1] != %(q2)s[1] and '
+                            'abs(%(q1)s[0]-%(q2)s[0]) != '
+                            'abs(%(q1)s[1]-%(q2)s[1])' % {'q1':q1, 'q2':q2}))
+            solver = Solver(DefaultDistributor(), trail=trail)
+            solutions.append(solver.solve(repo))
+        self.assertEqual(len(solutions[0]), 4)
+        self.assertEqual(solutions[0], solutions[1])
+
+    def testBitsetDomains(self):
+        solutions = []
+        for domain_class in (fd.FiniteDomain, fd.BitsetDomain):
+            variables = list('abcd')
+            domains = {}
+            for var in variables:
+                domains[var] = domain_class(list(range(4)))
+            repo = Repository(variables, domains,
+                              [fd.AllDistinct(variables),
+                               fd.make_expression(('a', 'b'), 'a < b'),
+                               fd.make_expression(('b', 'c', 'd'),
+                                                  'b + c < d + 2')])
+            solutions.append(self.solver.solve(repo))
+        self.assertTrue(solutions[0])
+        self.assertEqual(solutions[0], solutions[1])
+
+    def testDomainsRestored(self):
+        repo = Repository(list('ab'), {'a': fd.FiniteDomain(list(range(4))),
+                                       'b': fd.FiniteDomain(list(range(4)))})
+        repo.addConstraint(fd.make_expression(('a', 'b'), 'a != b'))
+        self.solver.solve_one(repo)
+        for dom in repo.getDomains().values():
+            self.assertEqual(dom.size(), 4)
+        self.assertEqual(len(repo._constraints), 1)
+
+
+class Trail_TC(unittest.TestCase):
+    def testBacktrack(self):
+        trail = Trail()
+        domain = fd.FiniteDomain(list(range(5)))
+        domain._trail = trail
+        domain.removeValue(0)
+        level = trail.mark()
+        domain.removeValue(1)
+        domain.removeValue(2)
+        self.assertEqual(len(trail), 1)
+        trail.mark()
+        domain.removeValue(3)
+        self.assertEqual(len(trail), 2)
+        trail.backtrack(level)
+        self.assertEqual(trail.level(), 0)
+        self.assertEqual(domain.getValues(), [1, 2, 3, 4])
+        # already closed
+        trail.backtrack(level)
+        self.assertEqual(domain.getValues(), [1, 2, 3, 4])
+
+
+class Checkpoint_TC(unittest.TestCase):
+    def setUp(self):
+        self.domains = {}
+        for v in 'abc':
+            self.domains[v] = fd.FiniteDomain(list(range(6)))
+        self.repo = Repository(list('abc'), self.domains)
+        self.repo.addConstraint(fd.make_expression(('a', 'b'), 'a < b'))
+        self.repo.consistency()
+
+    def testPushPop(self):
+        self.repo.push()
+        constraint = fd.make_expression(('b', 'c'), 'b < c')
+        self.repo.addConstraint(constraint)
+        self.repo.consistency()
+        self.assertEqual(self.domains['c'].getValues(), [2, 3, 4, 5])
+        self.assertEqual(self.domains['b'].getValues(), [1, 2, 3, 4])
+        self.repo.pop()
+        self.assertEqual(self.domains['c'].size(), 6)
+        self.assertEqual(self.domains['b'].getValues(), [1, 2, 3, 4, 5])
+        self.assertFalse(constraint in self.repo._constraints)
+        self.assertTrue(self.repo._trail is None)
+
+    def testIncrementalPropagation(self):
+        log = []
+        self.repo.addConstraint(Recorder(['a'], 1, log))
+        self.repo.addConstraint(Recorder(['c'], 2, log))
+        self.repo.consistency()
+        self.assertEqual(log, [1, 2])
+        del log[:]
+        self.repo.push()
+        self.repo.addConstraint(Recorder(['c'], 3, log, [('c', 0)]))
+        self.repo.consistency()
+        # only the new constraint, then the ones on c are propagated
+        self.assertEqual(log, [3, 2])
+        del log[:]
+        self.repo.consistency()
+        self.assertEqual(log, [])
+        self.domains['a'].removeValue(1)
+        self.repo.consistency()
+        self.assertEqual(log, [1])
+        self.repo.pop()
+        self.assertEqual(self.domains['a'].getValues(), [0, 1, 2, 3, 4])
+
+    def testRetract(self):
+        self.repo.push()
+        first = fd.make_expression(('b', 'c'), 'b < c')
+        self.repo.addConstraint(first)
+        self.repo.push()
+        second = fd.make_expression(('a',), 'a > 1')
+        self.repo.addConstraint(second)
+        self.repo.consistency()
+        self.assertEqual(self.domains['c'].getValues(), [4, 5])
+        self.repo.retract(first)
+        self.assertFalse(first in self.repo._constraints)
+        self.repo.consistency()
+        self.assertEqual(self.domains['a'].getValues(), [2, 3, 4])
+        self.assertEqual(self.domains['c'].size(), 6)
+        self.assertEqual(len(self.repo._checkpoints), 2)
+        self.assertRaises(ValueError, self.repo.retract, first)
+        self.repo.pop()
+        self.repo.pop()
+        self.assertEqual(self.domains['a'].getValues(), [0, 1, 2, 3, 4])
+
+    def testSolveInCheckpoint(self):
+        self.repo.push()
+        self.repo.addConstraint(fd.make_expression(('b', 'c'), 'b < c'))
+        solver = Solver(trail=True)
+        self.assertEqual(len(solver.solve(self.repo)), 20)
+        self.assertEqual(len(self.repo._checkpoints), 1)
+        self.repo.pop()
+        self.assertEqual(len(solver.solve(self.repo)), 90)
+
+
+class RestartSolver_TC(unittest.TestCase):
+    def testLuby(self):
+        limits = luby_restarts(2)
+        self.assertEqual([next(limits) for i in range(15)],
+                         [2, 2, 4, 2, 2, 4, 8, 2, 2, 4, 2, 2, 4, 8, 16])
+
+    def testGeometric(self):
+        limits = geometric_restarts(10, 1.5)
+        self.assertEqual([next(limits) for i in range(4)], [10, 15, 22, 33])
+
+    def testSolveOne(self):
+        repo = queens(10)
+        solver = Solver(WeightedDegreeDistributor())
+        solution = solver.solve_one(repo, restarts=luby_restarts(1))
+        self.assertTrue(solver.restart_cnt > 0)
+        values = [solution['Q%d' % i] for i in range(10)]
+        self.assertEqual(sorted(values), list(range(10)))
+        for i in range(10):
+            for j in range(i + 1, 10):
+                self.assertNotEqual(abs(values[i] - values[j]), j - i)
+        # nogoods are removed and domains restored
+        self.assertEqual(len(repo._constraints), 46)
+        for domain in repo.getDomains().values():
+            self.assertEqual(domain.size(), 10)
+
+    def testNoSolution(self):
+        solver = Solver()
+        self.assertEqual(solver.solve_one(queens(3),
+                                          restarts=geometric_restarts(1)),
+                         None)
+
+
+class Budget_TC(unittest.TestCase):
+    def testExhausted(self):
+        solver = Solver()
+        self.assertEqual(len(solver.solve(queens(6))), 4)
+        self.assertEqual(solver.status, EXHAUSTED)
+        self.assertEqual(solver.solve_one(queens(3)), None)
+        self.assertEqual(solver.status, EXHAUSTED)
+        self.assertTrue(solver.solve_one(queens(6)))
+        self.assertEqual(solver.status, SOLVED)
+
+    def testNodeLimit(self):
+        for trail in (False, True):
+            repo = queens(8)
+            solver = Solver(trail=trail)
+            solutions = solver.solve(repo, max_nodes=50)
+            self.assertEqual(solver.status, NODE_LIMITED)
+            self.assertTrue(0 < len(solutions) < 92)
+            self.assertTrue(solver.distrib_cnt < 50)
+            for domain in repo.getDomains().values():
+                if trail:
+                    self.assertEqual(domain.size(), 8)
+
+    def testTimeout(self):
+        solver = Solver()
+        self.assertEqual(solver.solve_one(queens(8), timeout=0),
+                         None)
+        self.assertEqual(solver.status, TIMED_OUT)
+
+    def testBestSoFar(self):
+        def cost(**solution):
+            return solution['Q0'] - solution['Q1']
+        solver = Solver()
+        solutions = list(solver.solve_best(queens(8), cost,
+                                           max_nodes=100))
+        self.assertEqual(solver.status, NODE_LIMITED)
+        self.assertEqual(solver.best, solutions[-1])
+
+
+class Nogood_TC(unittest.TestCase):
+    def setUp(self):
+        self.nogood = Nogood([('a', [0, 1]), ('b', [2]), ('a', [1, 2])])
+        self.domains = {'a': fd.FiniteDomain(list(range(4))),
+                        'b': fd.FiniteDomain(list(range(4)))}
+
+    def testNarrowing(self):
+        self.assertEqual(self.nogood.narrow(self.domains), 0)
+        self.domains['b'].removeValues([0, 1, 3])
+        self.assertEqual(self.nogood.narrow(self.domains), 1)
+        self.assertEqual(self.domains['a'].getValues(), [0, 2, 3])
+
+    def testEntailed(self):
+        self.domains['a'].removeValue(1)
+        self.assertEqual(self.nogood.narrow(self.domains), 1)
+        self.assertEqual(self.domains['b'].size(), 4)
+
+    def testFailure(self):
+        domains = {'a': fd.FiniteDomain([1]), 'b': fd.FiniteDomain([2])}
+        self.assertRaises(ConsistencyFailure, self.nogood.narrow, domains)
+
+
 class SolverBest_TC(unittest.TestCase):
     def setUp(self):
         self.solver = Solver()
@@ -160,6 +451,141 @@ class SolverBest_TC(unittest.TestCase):
         self.assertEqual(costs, sorted_costs)
         self.assertEqual(costs, [s[1] for s in solutions])
 
+    def lowerBound(self, domains):
+        return -sum([max(domains[var].getValues())**2
+                     for var in self.variables])
+
+    def testBranchAndBound(self):
+        best = min([self.costFunc(**sol) for sol in self.solver.solve(self.repo)])
+        solutions = list(self.solver.solve_best(self.repo, self.costFunc,
+                                                lower_bound=self.lowerBound))
+        costs = [cost for sol, cost in solutions]
+        self.assertEqual(costs[-1], best)
+        self.assertEqual(solutions[-1][0], {'a':3, 'b':4, 'c':5})
+        for cost1, cost2 in zip(costs, costs[1:]):
+            self.assertTrue(cost2 < cost1)
+        # the bound is removed from the repository
+        self.assertEqual(len(self.repo._constraints), 3)
+
+    def testBranchAndBoundPrunes(self):
+        list(self.solver.solve_best(self.repo, self.costFunc))
+        distributions = self.solver.distrib_cnt
+        list(self.solver.solve_best(self.repo, self.costFunc,
+                                    lower_bound=self.lowerBound))
+        self.assertTrue(self.solver.distrib_cnt < distributions)
+
+
+class Decompose_TC(unittest.TestCase):
+    def setUp(self):
+        self.domains = {}
+        for v in 'abcxyz':
+            self.domains[v] = fd.FiniteDomain(list(range(4)))
+        self.domains['z'] = fd.FiniteDomain([1])
+        self.constraints = [fd._make_expression(['a', 'b'], 'a < b'),
+                            fd._make_expression(['b', 'c', 'z'],
+                                                'b + z <= c'),
+                            fd._make_expression(['x', 'y', 'z'],
+                                                'x + z != y')]
+
+    def repository(self):
+        domains = dict([(v, d.copy()) for v, d in self.domains.items()])
+        return Repository('abcxyz', domains, self.constraints)
+
+    def solutions(self, solver):
+        return sorted([tuple(sorted(s.items()))
+                       for s in solver.solve(self.repository())])
+
+    def testComponents(self):
+        repo = self.repository()
+        self.assertEqual(repo.components(), [list('abc'), list('xy')])
+        parts = repo.split()
+        self.assertEqual([part._variables for part in parts],
+                         [list('abcz'), list('xyz')])
+        self.assertEqual([len(part._constraints) for part in parts], [2, 1])
+
+    def testSameSolutions(self):
+        expected = self.solutions(Solver())
+        self.assertEqual(len(expected), 4 * 13)
+        self.assertEqual(self.solutions(Solver(decompose=True)), expected)
+        self.assertEqual(self.solutions(Solver(decompose=True, trail=True)),
+                         expected)
+
+    def testAdditiveSearch(self):
+        # the pigeons have no solution, which is found after exploring
+        # each solution of the other part unless decomposing
+        pigeons = ['p%d' % i for i in range(6)]
+        for v in pigeons:
+            self.domains[v] = fd.FiniteDomain(list(range(5)))
+        for v1 in pigeons:
+            for v2 in pigeons:
+                if v1 < v2:
+                    self.constraints.append(fd._make_expression(
+                        [v1, v2], '%s != %s' % (v1, v2)))
+        variables = list('abcxyz') + pigeons
+        solver = Solver()
+        repo = Repository(variables, dict([(v, d.copy()) for v, d in
+                                           self.domains.items()]),
+                          self.constraints)
+        self.assertEqual(solver.solve_one(repo), None)
+        distributions = solver.distrib_cnt
+        solver = Solver(decompose=True)
+        repo = Repository(variables, self.domains, self.constraints)
+        self.assertEqual(solver.solve_one(repo), None)
+        self.assertEqual(solver.status, EXHAUSTED)
+        self.assertTrue(solver.distrib_cnt * 10 < distributions)
+
+
+class SimplifyModel_TC(unittest.TestCase):
+    def setUp(self):
+        self.domains = {}
+        for v in 'abc':
+            self.domains[v] = fd.FiniteDomain(list(range(6)))
+        self.less = fd._make_expression(['a', 'b'], 'a < b')
+        self.constraints = [fd._make_expression(['a'], 'a > 2'),
+                            fd.GreaterThan('c', 4),
+                            self.less, self.less,
+                            fd._make_expression(['b', 'a'], 'a + b != 8'),
+                            fd._make_expression(['b', 'c'], 'b < c'),
+                            fd._make_expression(['c'], 'c % 2 == 1')]
+
+    def solutions(self, repo):
+        return sorted([tuple(sorted(s.items())) for s in Solver().solve(repo)])
+
+    def testReport(self):
+        constraints, report = simplify_model(self.domains, self.constraints)
+        self.assertEqual(report, {'constraints': 7, 'unary': 3, 'entailed': 0,
+                                  'merged': 2, 'left': 2, 'values': 3 + 5})
+        self.assertEqual(self.domains['a'].getValues(), [3, 4, 5])
+        self.assertEqual(self.domains['c'].getValues(), [5])
+        self.assertEqual(len(constraints), 2)
+        self.assertEqual(set(constraints[0].affectedVariables()),
+                         set(['a', 'b']))
+
+    def testSameSolutions(self):
+        domains = dict([(v, d.copy()) for v, d in self.domains.items()])
+        expected = self.solutions(Repository('abc', domains, self.constraints))
+        repo = Repository('abc', self.domains, self.constraints, simplify=True)
+        self.assertEqual(repo.simplify_report['left'], 2)
+        self.assertEqual(self.solutions(repo), expected)
+        self.assertEqual(expected, [(('a', 3), ('b', 4), ('c', 5))])
+
+    def testEntailed(self):
+        self.domains['a'] = fd.FiniteDomain([1])
+        self.domains['b'] = fd.FiniteDomain([2])
+        constraints, report = simplify_model(self.domains, [self.less])
+        self.assertEqual(constraints, [])
+        self.assertEqual(report['entailed'], 1)
+
+    def testFailure(self):
+        constraints = [fd._make_expression(['a'], 'a > 7')]
+        self.assertRaises(ConsistencyFailure, simplify_model,
+                          self.domains, constraints)
+
+    def testMergeDiffers(self):
+        merged = fd.Differs('a', 'b', (1,)).merge(fd.Differs('b', 'a', (2,)))
+        self.assertEqual(merged._variables, ['a', 'b'])
+        self.assertEqual(sorted(merged._offsets), [-2, 1])
+
                          
 
 if __name__ == '__main__':
@@ -0,0 +1,109 @@
+"""Unit testing for the statistics of the search"""
+
+# (c) 2000-2001 LOGILAB S.A. (Paris, FRANCE).
+# http://www.logilab.fr/ -- mailto:contact@logilab.fr
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307
+# USA.
+
+import unittest
+import json
+import os
+import pstats
+import tempfile
+from logilab.constraint.propagation import Repository, Solver
+from logilab.constraint.stats import SearchStats
+from logilab.constraint import fd
+
+
+class Observer(SearchStats):
+    def on_start(self, repository):
+        SearchStats.on_start(self, repository)
+        self.events = []
+
+    def on_failure(self, repository, constraint):
+        SearchStats.on_failure(self, repository, constraint)
+        self.events.append(constraint)
+
+    def on_solution(self, solution):
+        SearchStats.on_solution(self, solution)
+        self.events.append(solution)
+
+
+class SearchStats_TC(unittest.TestCase):
+    def setUp(self):
+        variables = list('abcd')
+        domains = {}
+        for var in variables:
+            domains[var] = fd.FiniteDomain(list(range(4)))
+        self.all_distinct = fd.AllDistinct(variables)
+        self.less = fd.BinaryExpression(['a', 'b'], 'a < b')
+        self.repo = Repository(variables, domains,
+                               [self.all_distinct, self.less])
+
+    def testCounters(self):
+        for trail in (False, True):
+            stats = SearchStats()
+            solutions = Solver(trail=trail, stats=stats).solve(self.repo)
+            self.assertEqual(stats.solutions, len(solutions))
+            self.assertEqual(stats.solutions, 12)
+            self.assertTrue(stats.nodes > stats.solutions + stats.failures)
+            self.assertTrue(stats.removals > 0)
+            self.assertTrue(stats.elapsed > 0)
+            self.assertEqual(stats.peak_trail > 0, trail)
+            classes = stats.by_class()
+            self.assertEqual(sorted(classes),
+                             ['fd.AllDistinct', 'fd.BinaryExpression'])
+            self.assertTrue(classes['fd.AllDistinct']['calls'] >= stats.nodes)
+        # the repository is not measured after the search
+        self.assertEqual(self.repo._stats, None)
+
+    def testHooks(self):
+        self.repo.addConstraint(fd.make_expression(('c', 'd'), 'c > d + 1'))
+        stats = Observer()
+        solver = Solver(stats=stats)
+        solutions = solver.solve(self.repo)
+        self.assertEqual([event for event in stats.events
+                          if isinstance(event, dict)], solutions)
+        self.assertEqual(len(stats.events) - len(solutions), stats.failures)
+        for event in stats.events:
+            if not isinstance(event, dict):
+                self.assertTrue(event is None or event in
+                                self.repo._constraints)
+        # counters are reset
+        solver.solve(self.repo)
+        self.assertEqual(stats.solutions, len(solutions))
+
+    def testExport(self):
+        stats = SearchStats()
+        Solver(stats=stats).solve(self.repo)
+        data = json.loads(stats.to_json(top=1))
+        self.assertEqual(data['nodes'], stats.nodes)
+        self.assertEqual(len(data['constraints']), 1)
+        self.assertEqual(data['constraints'][0]['constraint'],
+                         repr(stats.by_constraint()[0][0]))
+        fd_, filename = tempfile.mkstemp()
+        os.close(fd_)
+        try:
+            stats.dump_stats(filename)
+            profile = pstats.Stats(filename)
+            self.assertEqual(profile.total_calls,
+                             sum([counters['calls'] for constraint, counters
+                                  in stats.by_constraint()]))
+        finally:
+            os.remove(filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
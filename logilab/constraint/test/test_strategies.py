@@ -0,0 +1,157 @@
+"""Unit testing for the search strategies"""
+
+# (c) 2000-2001 LOGILAB S.A. (Paris, FRANCE).
+# http://www.logilab.fr/ -- mailto:contact@logilab.fr
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307
+# USA.
+
+import unittest
+import random
+from logilab.constraint.propagation import Repository, Solver, EXHAUSTED, \
+     NODE_LIMITED, TIMED_OUT
+from logilab.constraint.strategies import LimitedDiscrepancySearch, \
+     DepthBoundedDiscrepancySearch, IterativeDeepeningSearch
+from logilab.constraint.distributors import DichotomyDistributor, \
+     EnumeratorDistributor
+from logilab.constraint import fd
+from problems import queens, sort_solutions
+
+
+def random_model(seed):
+    """small model with domains of various sizes, so that the leaves of
+    the search tree are at various depths"""
+    rand = random.Random(seed)
+    variables = ['x%d' % i for i in range(rand.randint(2, 5))]
+    domains = {}
+    for var in variables:
+        domains[var] = fd.FiniteDomain(rand.sample(range(5),
+                                                   rand.randint(1, 4)))
+    constraints = []
+    for i in range(rand.randint(1, 4)):
+        var1, var2 = rand.sample(variables, 2)
+        formula = rand.choice(['%s != %s', 'abs(%s - %s) != 1', '%s <= %s'])
+        constraints.append(fd.make_expression((var1, var2),
+                                              formula % (var1, var2)))
+    if rand.random() < .5:
+        constraints.append(fd.AllDistinct(variables))
+    return Repository(variables, domains, constraints)
+
+
+class AbstractStrategyTC:
+    """mixin for the test cases of the strategies: override buildStrategy"""
+
+    def buildStrategy(self, **kwargs):
+        raise NotImplementedError
+
+    def testSameSolutions(self):
+        for distributor in (DichotomyDistributor, EnumeratorDistributor):
+            for trail in (False, True):
+                expected = Solver(distributor(), trail=trail).solve(queens(6))
+                solver = Solver(distributor(), trail=trail,
+                                strategy=self.buildStrategy())
+                solutions = solver.solve(queens(6))
+                self.assertEqual(len(solutions), len(expected))
+                self.assertEqual(sort_solutions(solutions),
+                                 sort_solutions(expected))
+
+    def testRandomModels(self):
+        for seed in range(100):
+            for distributor in (DichotomyDistributor, EnumeratorDistributor):
+                expected = Solver(distributor()).solve(random_model(seed))
+                for trail in (False, True):
+                    solver = Solver(distributor(), trail=trail,
+                                    strategy=self.buildStrategy())
+                    solutions = solver.solve(random_model(seed))
+                    self.assertEqual(sort_solutions(solutions),
+                                     sort_solutions(expected), (seed, trail))
+
+    def testSameTreeAtEachIteration(self):
+        # the value consistency of AllDistinct may narrow the domains more
+        # when propagated again: the iterations must start from the same
+        # state to explore the same tree
+        def model():
+            values = {'x0': [2, 3, 0, 4, 5], 'x1': [5, 3], 'x2': [5, 3, 1],
+                      'x3': [4, 2, 5], 'x4': [1, 2], 'x5': [4]}
+            variables = sorted(values)
+            domains = dict([(var, fd.FiniteDomain(values[var]))
+                            for var in variables])
+            constraints = [fd.make_expression(('x0', 'x5'), 'x0 < x5 + 2'),
+                           fd.make_expression(('x1', 'x3'), 'x1 <= x3'),
+                           fd.make_expression(('x1', 'x3'), 'x1 != x3'),
+                           fd.AllDistinct(variables)]
+            return Repository(variables, domains, constraints)
+        expected = Solver().solve(model())
+        self.assertEqual(len(expected), 1)
+        for trail in (False, True):
+            solver = Solver(trail=trail, strategy=self.buildStrategy())
+            self.assertEqual(solver.solve(model()), expected)
+
+    def testDomainsRestored(self):
+        repo = queens(5)
+        solver = Solver(trail=True, strategy=self.buildStrategy())
+        self.assertTrue(solver.solve_one(repo))
+        for domain in repo.getDomains().values():
+            self.assertEqual(domain.size(), 5)
+
+    def testNodeBudget(self):
+        strategy = self.buildStrategy(max_nodes=10)
+        solver = Solver(strategy=strategy)
+        solver.solve(queens(8))
+        self.assertTrue(strategy.interrupted)
+        self.assertEqual(solver.status, NODE_LIMITED)
+        self.assertTrue(solver.distrib_cnt <= 10)
+        solver.strategy = self.buildStrategy()
+        solver.solve(queens(4))
+        self.assertFalse(solver.strategy.interrupted)
+        self.assertEqual(solver.status, EXHAUSTED)
+
+    def testTimeout(self):
+        strategy = self.buildStrategy(timeout=0)
+        solver = Solver(strategy=strategy)
+        self.assertEqual(solver.solve_one(queens(8)), None)
+        self.assertTrue(strategy.interrupted)
+        self.assertEqual(solver.status, TIMED_OUT)
+
+
+class LimitedDiscrepancySearchTC(AbstractStrategyTC, unittest.TestCase):
+    def buildStrategy(self, **kwargs):
+        return LimitedDiscrepancySearch(**kwargs)
+
+    def testMaxDiscrepancies(self):
+        solver = Solver(EnumeratorDistributor(),
+                        strategy=LimitedDiscrepancySearch(0))
+        # the first values of the domains
+        self.assertEqual(solver.solve(queens(4)), [])
+        solver.strategy = LimitedDiscrepancySearch(20)
+        self.assertEqual(len(solver.solve(queens(4))), 2)
+
+
+class DepthBoundedDiscrepancySearchTC(AbstractStrategyTC, unittest.TestCase):
+    def buildStrategy(self, **kwargs):
+        return DepthBoundedDiscrepancySearch(**kwargs)
+
+
+class IterativeDeepeningSearchTC(AbstractStrategyTC, unittest.TestCase):
+    def buildStrategy(self, **kwargs):
+        return IterativeDeepeningSearch(2, **kwargs)
+
+    def testMaxDepth(self):
+        solver = Solver(strategy=IterativeDeepeningSearch(max_depth=1))
+        self.assertEqual(solver.solve(queens(6)), [])
+        self.assertEqual(solver.max_depth, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""Unit testing for the symmetry breaking"""
+
+# (c) 2000-2001 LOGILAB S.A. (Paris, FRANCE).
+# http://www.logilab.fr/ -- mailto:contact@logilab.fr
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307
+# USA.
+
+import unittest
+from logilab.constraint.propagation import Repository, Solver, \
+     luby_restarts
+from logilab.constraint.distributors import EnumeratorDistributor
+from logilab.constraint.symmetry import *
+from logilab.constraint import fd
+from problems import queens
+
+def permutations(size, constraints=()):
+    variables = ['v%d' % i for i in range(size)]
+    domains = {}
+    for var in variables:
+        domains[var] = fd.FiniteDomain(list(range(size)))
+    return Repository(variables, domains,
+                      [fd.AllDistinct(variables)] + list(constraints))
+
+def board_symmetries(size):
+    """the symmetries of the square, for the queens"""
+    last = size - 1
+    transforms = [lambda row, col: (row, last - col),
+                  lambda row, col: (last - row, col),
+                  lambda row, col: (last - row, last - col),
+                  lambda row, col: (col, row),
+                  lambda row, col: (last - col, last - row),
+                  lambda row, col: (col, last - row),
+                  lambda row, col: (last - col, row)]
+    def symmetry(transform):
+        def image(variable, value):
+            row, col = transform(int(variable[1:]), value)
+            return 'Q%d' % row, col
+        return image
+    return [symmetry(transform) for transform in transforms]
+
+
+class SymmetryTC(unittest.TestCase):
+
+    def testSymmetries(self):
+        symmetry = VariableSymmetry({'x': 'y', 'y': 'x'})
+        self.assertEqual(symmetry('x', 1), ('y', 1))
+        self.assertEqual(symmetry('z', 1), ('z', 1))
+        symmetry = ValueSymmetry({1: 2, 2: 1})
+        self.assertEqual(symmetry('x', 1), ('x', 2))
+        self.assertEqual(len(interchangeable_variables('abcd')), 6)
+        self.assertEqual(len(interchangeable_values([1, 2, 3])), 3)
+
+    def testBreakVariableSymmetry(self):
+        variables = ['v%d' % i for i in range(4)]
+        repo = permutations(4, break_variable_symmetry(variables))
+        self.assertEqual(Solver().solve(repo),
+                         [{'v0': 0, 'v1': 1, 'v2': 2, 'v3': 3}])
+
+    def testBreakValueSymmetry(self):
+        variables = ['v%d' % i for i in range(4)]
+        repo = permutations(4, break_value_symmetry(variables, range(4)))
+        self.assertEqual(Solver().solve(repo),
+                         [{'v0': 0, 'v1': 1, 'v2': 2, 'v3': 3}])
+
+
+class SymmetricSolverTC(unittest.TestCase):
+
+    def testInterchangeableVariables(self):
+        symmetries = interchangeable_variables(['v%d' % i for i in range(4)])
+        solver = Solver(symmetries=symmetries)
+        self.assertEqual(len(solver.solve(permutations(4))), 1)
+        self.assertEqual(solver._path, None)
+
+    def testInterchangeableValues(self):
+        solver = Solver(symmetries=interchangeable_values(range(4)))
+        self.assertEqual(len(solver.solve(permutations(4))), 1)
+
+    def testQueens(self):
+        # 92 solutions, 12 up to the symmetries of the board
+        solver = Solver(EnumeratorDistributor(),
+                        symmetries=board_symmetries(8))
+        solutions = solver.solve(queens(8))
+        self.assertEqual(len(solutions), 12)
+        # the domains are restored after the search
+        repo = queens(8)
+        solver.solve(repo)
+        self.assertEqual(len(Solver().solve(repo)), 92)
+
+    def testSolveOne(self):
+        solver = Solver(EnumeratorDistributor(),
+                        symmetries=board_symmetries(6))
+        self.assertTrue(solver.solve_one(queens(6)))
+        self.assertTrue(solver.solve_one(queens(6), restarts=luby_restarts(2)))
+        self.assertEqual(solver._path, None)
+
+
+if __name__ == '__main__':
+    unittest.main()